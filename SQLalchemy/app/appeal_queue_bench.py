@@ -0,0 +1,177 @@
+# appeal_queue_bench.py
+# Нагрузка на очередь обращений: --admins симулированных админов одновременно
+# разбирают --appeals новых обращений через AdminQueries.claim_next_appeal,
+# пока очередь не опустеет. Проверяется, что каждое обращение досталось ровно
+# одному админу, и печатается пропускная способность и задержка захвата:
+#
+#   python appeal_queue_bench.py --admins 50 --appeals 5000
+#
+# Нужна локальная база без чужих новых обращений: claim_next_appeal берет
+# любое обращение из очереди, поэтому при непустой очереди скрипт не
+# запускается. Созданные строки удаляются.
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, update
+from database import async_engine, pool_status
+from models import Admin, AppealStatus, PriorityStatus, SupportAppeal, User
+from queries.orm import AdminQueries
+
+BENCH_TELEGRAM_ID_START = 7_000_000_000
+
+
+def bench_ids(admins: int):
+    # админы [START, START + admins) и один пользователь START + admins;
+    # выше тоже бывают реальные аккаунты и пользователи seeding.py
+    return BENCH_TELEGRAM_ID_START, BENCH_TELEGRAM_ID_START + admins
+
+
+async def foreign_queue_size() -> int:
+    async with async_engine.connect() as conn:
+        return (
+            await conn.execute(
+                select(func.count()).where(
+                    SupportAppeal.status == AppealStatus.NEW,
+                    SupportAppeal.assigned_admin_id.is_(None),
+                )
+            )
+        ).scalar()
+
+
+async def setup(admins: int, appeals: int, seed: int) -> list[int]:
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    first_id, user_telegram_id = bench_ids(admins)
+    admin_telegram_ids = [first_id + i for i in range(admins)]
+    async with async_engine.begin() as conn:
+        await conn.execute(
+            insert(Admin),
+            [
+                {"telegram_id": telegram_id, "name": f"bench_{i}"}
+                for i, telegram_id in enumerate(admin_telegram_ids)
+            ],
+        )
+        await conn.execute(insert(User).values(telegram_id=user_telegram_id))
+        priorities = [priority.value for priority in PriorityStatus]
+        await conn.execute(
+            insert(SupportAppeal),
+            [
+                {
+                    "telegram_id": user_telegram_id,
+                    "status": AppealStatus.NEW,
+                    "priority": rng.choice(priorities),
+                    "created_date": now - timedelta(minutes=rng.randint(0, 3 * 24 * 60)),
+                }
+                for _ in range(appeals)
+            ],
+        )
+    return admin_telegram_ids
+
+
+async def cleanup(admins: int):
+    first_id, user_telegram_id = bench_ids(admins)
+    bench_admins = Admin.telegram_id.between(first_id, user_telegram_id - 1)
+    bench_admin_ids = select(Admin.admin_id).where(bench_admins)
+    async with async_engine.begin() as conn:
+        await conn.execute(
+            delete(SupportAppeal).where(SupportAppeal.telegram_id == user_telegram_id)
+        )
+        # обращение, появившееся во время прогона, возвращаем в очередь
+        await conn.execute(
+            update(SupportAppeal)
+            .where(SupportAppeal.assigned_admin_id.in_(bench_admin_ids))
+            .values(status=AppealStatus.NEW, assigned_admin_id=None, admin_visit=False)
+        )
+        await conn.execute(delete(Admin).where(bench_admins))
+        await conn.execute(delete(User).where(User.telegram_id == user_telegram_id))
+
+
+async def admin_worker(telegram_id: int, claimed: list, timings: list):
+    while True:
+        started = time.perf_counter()
+        appeal_id = await AdminQueries.claim_next_appeal(telegram_id)
+        timings.append((time.perf_counter() - started) * 1000)
+        if appeal_id is None:
+            return
+        claimed.append((appeal_id, telegram_id))
+
+
+async def check(claimed: list, appeals: int, admins: int) -> list:
+    errors = []
+    per_appeal = Counter(appeal_id for appeal_id, _ in claimed)
+    duplicates = [appeal_id for appeal_id, count in per_appeal.items() if count > 1]
+    if duplicates:
+        errors.append(f"обращения выданы дважды: {duplicates[:10]}")
+    if len(per_appeal) != appeals:
+        errors.append(f"выдано {len(per_appeal)} из {appeals}")
+    async with async_engine.connect() as conn:
+        left = (
+            await conn.execute(
+                select(SupportAppeal.appeal_id).where(
+                    SupportAppeal.telegram_id == bench_ids(admins)[1],
+                    SupportAppeal.status == AppealStatus.NEW,
+                )
+            )
+        ).all()
+    if left:
+        errors.append(f"в очереди осталось {len(left)}")
+    return errors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Конкурентный разбор очереди обращений")
+    parser.add_argument("--admins", type=int, default=50)
+    parser.add_argument("--appeals", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    foreign = await foreign_queue_size()
+    if foreign:
+        print(f"❌ В очереди уже {foreign} новых обращений - нужна отдельная база")
+        await async_engine.dispose()
+        return 1
+    admin_telegram_ids = await setup(args.admins, args.appeals, args.seed)
+    claimed, timings = [], []
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                admin_worker(telegram_id, claimed, timings)
+                for telegram_id in admin_telegram_ids
+            )
+        )
+        elapsed = time.perf_counter() - started
+        errors = await check(claimed, args.appeals, args.admins)
+    finally:
+        await cleanup(args.admins)
+        await async_engine.dispose()
+    ordered = sorted(timings)
+    print(
+        f"Админов: {args.admins}, обращений: {args.appeals}, время: {elapsed:.2f}с, "
+        f"захватов в секунду: {len(claimed) / elapsed:.0f}"
+    )
+    print(
+        f"Задержка захвата, мс: p50={statistics.median(ordered):.2f} "
+        f"p95={ordered[int(len(ordered) * 0.95) - 1]:.2f} max={ordered[-1]:.2f}"
+    )
+    per_admin = Counter(telegram_id for _, telegram_id in claimed)
+    print(f"На админа: min={min(per_admin.values(), default=0)} max={max(per_admin.values(), default=0)}")
+    print(f"Пул соединений: {pool_status()}")
+    for error in errors:
+        print(f"❌ {error}")
+    if not errors:
+        print("✅ Каждое обращение выдано ровно одному админу")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
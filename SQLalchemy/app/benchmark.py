@@ -0,0 +1,263 @@
+# benchmark.py
+# Замер запросов из queries/orm.py: для каждого метода считаются перцентили
+# задержки, число обращений к БД (через события SQLAlchemy) и число строк в
+# ответе. Отчет пишется в JSON, чтобы его можно было сравнивать между коммитами:
+#
+#   python seeding.py --users 10000 --reviews 200000 --orders 50000
+#   python benchmark.py --iterations 50 --output bench.json
+#
+# Меняющие данные методы (add_*, del_*, made_*, update_* ...) не замеряются.
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from sqlalchemy import event, text
+from database import async_engine, pool_status
+from models import AdminPermission
+from queries.orm import (
+    AdminQueries,
+    AuthorQueries,
+    BookQueries,
+    OrderQueries,
+    StatisticsQueries,
+    SupportQueries,
+    UserQueries,
+    admin_cache,
+    appeal_throttle,
+    book_card_cache,
+    cart_cache,
+    count_cache,
+    message_throttle,
+)
+from seeding import BulkSeeder
+
+DEFAULT_ITERATIONS = 30
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+async def _sample_ids() -> dict:
+    # берем реальные id из базы, чтобы запросы что-то находили
+    queries = {
+        "author_id": "SELECT author_id FROM authors ORDER BY author_id LIMIT 1",
+        "book_id": "SELECT book_id FROM reviews GROUP BY book_id ORDER BY COUNT(*) DESC LIMIT 1",
+        "review_id": "SELECT review_id FROM reviews ORDER BY review_id LIMIT 1",
+        "telegram_id": "SELECT telegram_id FROM order_data GROUP BY telegram_id ORDER BY COUNT(*) DESC LIMIT 1",
+        "order_id": "SELECT order_id FROM order_data ORDER BY order_id DESC LIMIT 1",
+        "appeal_id": "SELECT appeal_id FROM support_appeals ORDER BY appeal_id DESC LIMIT 1",
+        "admin_id": "SELECT admin_id FROM admins ORDER BY admin_id LIMIT 1",
+        "admin_telegram_id": "SELECT telegram_id FROM admins ORDER BY admin_id LIMIT 1",
+        "username": "SELECT u.username FROM support_appeals sa JOIN users u ON u.telegram_id = sa.telegram_id LIMIT 1",
+        "book_title": "SELECT book_title FROM books ORDER BY book_id LIMIT 1",
+    }
+    ids = {}
+    async with async_engine.connect() as conn:
+        for key, query in queries.items():
+            ids[key] = (await conn.execute(text(query))).scalar()
+    return ids
+
+
+def build_cases(ids: dict) -> dict:
+    book_id = ids["book_id"]
+    telegram_id = ids["telegram_id"]
+    order_id = ids["order_id"]
+    appeal_id = ids["appeal_id"]
+    admin_id = ids["admin_id"]
+    username = ids["username"]
+    title_query = (ids["book_title"] or "книга").split()[0]
+    return {
+        # Авторы
+        "AuthorQueries.get_author": lambda: AuthorQueries.get_author(ids["author_id"]),
+        "AuthorQueries.get_author_with_books": lambda: AuthorQueries.get_author_with_books(ids["author_id"]),
+        "AuthorQueries.get_author_data": lambda: AuthorQueries.get_author_data(ids["author_id"]),
+        # Книги
+        "BookQueries.get_book": lambda: BookQueries.get_book(book_id),
+        "BookQueries.get_book_by_genre": lambda: BookQueries.get_book_by_genre("classic"),
+        "BookQueries.get_book_info": lambda: BookQueries.get_book_info(book_id),
+        "BookQueries.get_book_reviews": lambda: BookQueries.get_book_reviews(book_id),
+        "BookQueries.full_book_review": lambda: BookQueries.full_book_review(ids["review_id"]),
+        "BookQueries.check_book_availability": lambda: BookQueries.check_book_availability(book_id, telegram_id),
+        "BookQueries.get_books_for_admin": lambda: BookQueries.get_books_for_admin(),
+        "BookQueries.get_book_sale_info": lambda: BookQueries.get_book_sale_info(book_id),
+        "BookQueries.search_books_by_title": lambda: BookQueries.search_books_by_title(title_query),
+        "BookQueries.search_books_by_title_with_pagination": lambda: BookQueries.search_books_by_title_with_pagination(title_query),
+        "BookQueries.search_books_by_title_for_user": lambda: BookQueries.search_books_by_title_for_user(title_query),
+        "BookQueries.get_books_not_in_stock": lambda: BookQueries.get_books_not_in_stock(),
+        "BookQueries.get_sale_genre": lambda: BookQueries.get_sale_genre("classic"),
+        # Пользователи
+        "UserQueries.get_user_published_reviews": lambda: UserQueries.get_user_published_reviews(telegram_id),
+        "UserQueries.get_user_balance": lambda: UserQueries.get_user_balance(telegram_id),
+        # Корзина и заказы
+        "OrderQueries.get_cart_summary": lambda: OrderQueries.get_cart_summary(telegram_id),
+        "OrderQueries.get_cart_total": lambda: OrderQueries.get_cart_total(telegram_id),
+        "OrderQueries.get_cart_view": lambda: OrderQueries.get_cart_view(telegram_id),
+        "OrderQueries.get_address_small": lambda: OrderQueries.get_address_small(telegram_id),
+        "OrderQueries.get_user_orders": lambda: OrderQueries.get_user_orders(telegram_id),
+        "OrderQueries.get_user_orders_count": lambda: OrderQueries.get_user_orders_count(telegram_id),
+        "OrderQueries.get_order_ids_by_book": lambda: OrderQueries.get_order_ids_by_book(book_id),
+        "OrderQueries.get_order_details": lambda: OrderQueries.get_order_details(order_id, telegram_id),
+        "OrderQueries.check_cart_quantity_limit": lambda: OrderQueries.check_cart_quantity_limit(telegram_id, book_id),
+        # Поддержка
+        "SupportQueries.get_appeals_count": lambda: SupportQueries.get_appeals_count(telegram_id),
+        "SupportQueries.get_small_appeals_paginated": lambda: SupportQueries.get_small_appeals_paginated(telegram_id),
+        "SupportQueries.appeal_cooldown_seconds": lambda: SupportQueries.appeal_cooldown_seconds(telegram_id),
+        "SupportQueries.message_cooldown_seconds": lambda: SupportQueries.message_cooldown_seconds(telegram_id),
+        "SupportQueries.get_appeal_full": lambda: SupportQueries.get_appeal_full(appeal_id),
+        "SupportQueries.get_appeal_transcript": lambda: SupportQueries.get_appeal_transcript(appeal_id),
+        # Админка
+        "AdminQueries.get_admin_identity": lambda: AdminQueries.get_admin_identity(ids["admin_telegram_id"]),
+        "AdminQueries.get_admins_with_permission": lambda: AdminQueries.get_admins_with_permission(AdminPermission.MANAGE_ORDERS),
+        "AdminQueries.get_closed_appeals": lambda: AdminQueries.get_closed_appeals(admin_id),
+        "AdminQueries.has_new_appeal": lambda: AdminQueries.has_new_appeal(),
+        "AdminQueries.get_admin_appeal_by_id": lambda: AdminQueries.get_admin_appeal_by_id(appeal_id),
+        "AdminQueries.get_appeals_by_username": lambda: AdminQueries.get_appeals_by_username(username, admin_id, True),
+        "AdminQueries.get_admins_info": lambda: AdminQueries.get_admins_info(),
+        "AdminQueries.get_admins_paginated": lambda: AdminQueries.get_admins_paginated("superadmin"),
+        "AdminQueries.get_admin_orders_count": lambda: AdminQueries.get_admin_orders_count("new"),
+        "AdminQueries.get_admin_orders_paginated": lambda: AdminQueries.get_admin_orders_paginated("new"),
+        "AdminQueries.admin_get_user_orders_by_telegram_id_small": lambda: AdminQueries.admin_get_user_orders_by_telegram_id_small(telegram_id),
+        "AdminQueries.get_order_details": lambda: AdminQueries.get_order_details(order_id),
+        # Статистика
+        "StatisticsQueries.get_admin_support_statistics": lambda: StatisticsQueries.get_admin_support_statistics(ids["admin_telegram_id"]),
+        "StatisticsQueries.get_comprehensive_stats": lambda: StatisticsQueries.get_comprehensive_stats(),
+        "StatisticsQueries.orders_statistic": lambda: StatisticsQueries.orders_statistic(),
+        "StatisticsQueries.get_best_sellers": lambda: StatisticsQueries.get_best_sellers(),
+        "StatisticsQueries.get_revenue_per_book": lambda: StatisticsQueries.get_revenue_per_book(),
+    }
+
+
+def _rows(result) -> int:
+    # списки/кортежи (страница, всего) считаем по первому элементу-списку
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    if isinstance(result, (list, dict)):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def _percentile(values: list, percent: int) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def _reset_caches():
+    cart_cache.clear()
+    admin_cache.clear()
+    count_cache.clear()
+    book_card_cache.clear()
+    # иначе холодные кейсы кулдаунов отвечают из памяти без запросов
+    appeal_throttle.clear()
+    message_throttle.clear()
+
+
+async def run_case(call, iterations: int, warm: bool) -> dict:
+    counter = QueryCounter()
+    timings, round_trips = [], []
+    rows = 0
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+    try:
+        for _ in range(iterations):
+            if not warm:
+                _reset_caches()
+            counter.count = 0
+            started = time.perf_counter()
+            result = await call()
+            timings.append((time.perf_counter() - started) * 1000)
+            round_trips.append(counter.count)
+            rows = _rows(result)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
+    return {
+        "p50_ms": round(_percentile(timings, 50), 3),
+        "p95_ms": round(_percentile(timings, 95), 3),
+        "p99_ms": round(_percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "round_trips": max(round_trips),
+        "rows": rows,
+    }
+
+
+async def _table_sizes() -> dict:
+    tables = ("users", "books", "reviews", "order_data", "order_items", "support_appeals")
+    async with async_engine.connect() as conn:
+        return {
+            table: (await conn.execute(text(f"SELECT COUNT(*) FROM {table}"))).scalar()
+            for table in tables
+        }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замер запросов queries/orm.py")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--only", help="подстрока имени метода, например BookQueries")
+    parser.add_argument(
+        "--warm", action="store_true", help="не сбрасывать кэши между вызовами"
+    )
+    parser.add_argument("--seed-users", type=int, default=0)
+    parser.add_argument("--seed-books", type=int, default=0)
+    parser.add_argument("--seed-reviews", type=int, default=0)
+    parser.add_argument("--seed-orders", type=int, default=0)
+    parser.add_argument("--seed-appeals", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    sizes = (
+        args.seed_users,
+        args.seed_books,
+        args.seed_reviews,
+        args.seed_orders,
+        args.seed_appeals,
+    )
+    if any(sizes):
+        await BulkSeeder(seed=args.seed).run(*sizes)
+    cases = build_cases(await _sample_ids())
+    results = {}
+    for name, call in cases.items():
+        if args.only and args.only not in name:
+            continue
+        try:
+            results[name] = await run_case(call, args.iterations, args.warm)
+        except Exception as e:
+            results[name] = {"error": str(e)}
+        print(f"{name}: {results[name]}")
+    report = {
+        "commit": _git_commit(),
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "iterations": args.iterations,
+        "warm_cache": args.warm,
+        "table_sizes": await _table_sizes(),
+        "pool": pool_status(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"✅ Отчет сохранен в {args.output}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
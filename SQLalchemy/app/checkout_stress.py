@@ -0,0 +1,192 @@
+# checkout_stress.py
+# Проверка OrderQueries.checkout под конкуренцией: создается одна книга с
+# остатком --stock и --buyers покупателей, у каждого она в корзине. Все
+# оформления запускаются параллельно, после чего проверяется, что продано не
+# больше, чем было на складе, и остаток сходится с позициями заказов:
+#
+#   python checkout_stress.py --buyers 300 --stock 50
+#
+# Нужна локальная база (DATABASE_* из .env). Созданные строки удаляются.
+
+import argparse
+import asyncio
+import sys
+from collections import Counter
+from sqlalchemy import delete, func, insert, select
+from database import async_engine, pool_status
+from models import Book, BookStatus, Cart, CartItem, OrderData, OrderItem, User, UserAddress
+from queries.orm import OrderQueries
+
+STRESS_TELEGRAM_ID_START = 8_000_000_000
+BOOK_PRICE = 100
+
+
+async def setup(buyers: int, stock: int, per_buyer: int) -> tuple[int, list]:
+    telegram_ids = [STRESS_TELEGRAM_ID_START + i for i in range(buyers)]
+    async with async_engine.begin() as conn:
+        book_id = (
+            await conn.execute(
+                insert(Book)
+                .values(
+                    book_title="Stress test book",
+                    book_status=BookStatus.IN_STOCK,
+                    book_price=BOOK_PRICE,
+                    book_quantity=stock,
+                    book_in_stock=stock > 0,
+                )
+                .returning(Book.book_id)
+            )
+        ).scalar()
+        await conn.execute(
+            insert(User),
+            [
+                {"telegram_id": telegram_id, "user_balance": BOOK_PRICE * per_buyer}
+                for telegram_id in telegram_ids
+            ],
+        )
+        cart_ids = (
+            await conn.execute(
+                insert(Cart).returning(Cart.cart_id, Cart.telegram_id),
+                [{"telegram_id": telegram_id} for telegram_id in telegram_ids],
+            )
+        ).all()
+        await conn.execute(
+            insert(CartItem),
+            [
+                {
+                    "cart_id": cart_id,
+                    "book_id": book_id,
+                    "quantity": per_buyer,
+                    "price": BOOK_PRICE,
+                }
+                for cart_id, _ in cart_ids
+            ],
+        )
+        addresses = (
+            await conn.execute(
+                insert(UserAddress).returning(
+                    UserAddress.telegram_id, UserAddress.address_id
+                ),
+                [
+                    {"telegram_id": telegram_id, "is_complete": True}
+                    for telegram_id in telegram_ids
+                ],
+            )
+        ).all()
+    return book_id, addresses
+
+
+def stress_users(buyers: int):
+    # только id, созданные setup(): выше STRESS_TELEGRAM_ID_START лежат и
+    # пользователи seeding.py, и реальные аккаунты
+    return User.telegram_id.between(
+        STRESS_TELEGRAM_ID_START, STRESS_TELEGRAM_ID_START + buyers - 1
+    )
+
+
+async def cleanup(book_id: int, buyers: int):
+    telegram_ids = select(User.telegram_id).where(stress_users(buyers))
+    async with async_engine.begin() as conn:
+        await conn.execute(delete(OrderItem).where(OrderItem.book_id == book_id))
+        await conn.execute(
+            delete(OrderData).where(OrderData.telegram_id.in_(telegram_ids))
+        )
+        await conn.execute(
+            delete(CartItem).where(
+                CartItem.cart_id.in_(
+                    select(Cart.cart_id).where(Cart.telegram_id.in_(telegram_ids))
+                )
+            )
+        )
+        await conn.execute(delete(Cart).where(Cart.telegram_id.in_(telegram_ids)))
+        await conn.execute(
+            delete(UserAddress).where(UserAddress.telegram_id.in_(telegram_ids))
+        )
+        await conn.execute(delete(User).where(stress_users(buyers)))
+        await conn.execute(delete(Book).where(Book.book_id == book_id))
+
+
+async def check(
+    book_id: int, stock: int, per_buyer: int, buyers: int, statuses: Counter
+) -> list:
+    errors = []
+    async with async_engine.connect() as conn:
+        quantity, in_stock = (
+            await conn.execute(
+                select(Book.book_quantity, Book.book_in_stock).where(
+                    Book.book_id == book_id
+                )
+            )
+        ).one()
+        sold = (
+            await conn.execute(
+                select(func.coalesce(func.sum(OrderItem.quantity), 0)).where(
+                    OrderItem.book_id == book_id
+                )
+            )
+        ).scalar()
+        negative_balances = (
+            await conn.execute(
+                select(func.count()).where(
+                    stress_users(buyers), User.user_balance < 0
+                )
+            )
+        ).scalar()
+    if quantity < 0:
+        errors.append(f"отрицательный остаток: {quantity}")
+    if sold + quantity != stock:
+        errors.append(f"продано {sold}, осталось {quantity}, было {stock}")
+    if sold != statuses["ok"] * per_buyer:
+        errors.append(f"позиций {sold}, успешных оформлений {statuses['ok']}")
+    expected = min(sum(statuses.values()), stock // per_buyer)
+    if statuses["ok"] != expected:
+        errors.append(f"успешных оформлений {statuses['ok']}, ожидалось {expected}")
+    if in_stock != (quantity > 0):
+        errors.append(f"book_in_stock={in_stock} при остатке {quantity}")
+    if negative_balances:
+        errors.append(f"отрицательный баланс у {negative_balances} покупателей")
+    return errors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Параллельные оформления заказа")
+    parser.add_argument("--buyers", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--per-buyer", type=int, default=1)
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    book_id, addresses = await setup(args.buyers, args.stock, args.per_buyer)
+    try:
+        results = await asyncio.gather(
+            *(
+                OrderQueries.checkout(telegram_id, address_id)
+                for telegram_id, address_id in addresses
+            ),
+            return_exceptions=True,
+        )
+        statuses = Counter(
+            f"error: {type(result).__name__}"
+            if isinstance(result, Exception)
+            else result["status"]
+            for result in results
+        )
+        print(f"Результаты: {dict(statuses)}")
+        print(f"Пул соединений: {pool_status()}")
+        errors = await check(
+            book_id, args.stock, args.per_buyer, args.buyers, statuses
+        )
+    finally:
+        await cleanup(book_id, args.buyers)
+        await async_engine.dispose()
+    for error in errors:
+        print(f"❌ {error}")
+    if not errors:
+        print("✅ Перепродаж нет, остаток сходится с заказами")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,136 @@
+# chunker_fuzz.py
+# Проверка utils/text_chunker на случайных текстах: эмодзи вне BMP, Markdown и
+# HTML сущности, длинные строки без пробелов. Для каждого текста проверяется,
+# что части не длиннее лимита в UTF-16, склеиваются обратно в исходный текст и
+# не режут сущности разметки. В конце - время на больших входах, чтобы видеть,
+# что разбиение растет линейно:
+#
+#   python chunker_fuzz.py --runs 2000 --seed 1
+#
+# База и бот не нужны.
+
+import argparse
+import random
+import sys
+import time
+from utils.text_chunker import (
+    _protected_spans,
+    chunk_lines,
+    split_text,
+    take_lines,
+    utf16_len,
+)
+
+ALPHABET = list("abcxyz АБВгдеёж0123") + ["😀", "📚", "👨‍💻", "𝔸", "\n", " ", "  "]
+MARKDOWN_ENTITIES = ["*жирный*", "_курсив_", "`code`", "```\nblock 😀\n```", "[ссылка](https://t.me)"]
+HTML_ENTITIES = ["<b>жирный</b>", "<i>😀 курсив</i>", "<code>x</code>", "&amp;", '<a href="tg://x">@x</a>']
+
+
+def random_text(rng: random.Random, size: int, entities: list) -> str:
+    pieces = []
+    for _ in range(size):
+        if rng.random() < 0.1:
+            pieces.append(rng.choice(entities))
+        elif rng.random() < 0.01:
+            pieces.append("x" * rng.randint(50, 500))
+        else:
+            pieces.append(rng.choice(ALPHABET))
+    return "".join(pieces)
+
+
+def check_split(text: str, limit: int, parse_mode: str) -> list:
+    errors = []
+    parts = split_text(text, limit, parse_mode)
+    if "".join(parts) != text:
+        errors.append("части не склеиваются в исходный текст")
+    spans = _protected_spans(text, parse_mode)
+    position = 0
+    for part in parts[:-1]:
+        if utf16_len(part) > limit and utf16_len(part) > 2:
+            errors.append(f"часть длиной {utf16_len(part)} при лимите {limit}")
+        position += len(part)
+        for start, end in spans:
+            # резать сущность можно только если она сама длиннее лимита
+            if start < position < end and utf16_len(text[start:end]) <= limit:
+                errors.append(f"разрез внутри сущности {text[start:end]!r}")
+    if parts and utf16_len(parts[-1]) > max(limit, 2):
+        errors.append("последняя часть длиннее лимита")
+    return errors
+
+
+def check_lines(lines: list, limit: int, header: str, continuation: str) -> list:
+    errors = []
+    parts = chunk_lines(lines, limit, header=header, continuation=continuation)
+    if not lines or not "".join(lines):
+        return [] if not parts else ["части без строк"]
+    if not parts[0].startswith(header):
+        errors.append("первая часть без заголовка")
+    body = [parts[0][len(header):]]
+    for part in parts[1:]:
+        if not part.startswith(continuation):
+            errors.append("часть без заголовка продолжения")
+        body.append(part[len(continuation):])
+    if "".join(body) != "".join(lines):
+        errors.append("строки потеряны или переставлены")
+    for part in parts:
+        if utf16_len(part) > limit:
+            errors.append(f"часть длиной {utf16_len(part)} при лимите {limit}")
+    text, taken = take_lines(lines, limit)
+    if utf16_len(text) > limit or text != "".join(lines[:taken]):
+        errors.append("take_lines взял лишнее")
+    return errors
+
+
+def timing(sizes: list, rng: random.Random):
+    for size in sizes:
+        text = random_text(rng, size, MARKDOWN_ENTITIES)
+        started = time.perf_counter()
+        parts = split_text(text)
+        split_ms = (time.perf_counter() - started) * 1000
+        lines = text.splitlines(keepends=True)
+        started = time.perf_counter()
+        chunk_lines(lines, header="*История:*\n\n", continuation="*Продолжение:*\n\n")
+        lines_ms = (time.perf_counter() - started) * 1000
+        print(
+            f"{utf16_len(text):>10} UTF-16: split_text {split_ms:8.1f} мс "
+            f"({len(parts)} ч.), chunk_lines {lines_ms:8.1f} мс"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Случайная проверка text_chunker")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-timing", action="store_true")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    rng = random.Random(args.seed)
+    errors = []
+    for run in range(args.runs):
+        parse_mode, entities = rng.choice(
+            [("Markdown", MARKDOWN_ENTITIES), ("HTML", HTML_ENTITIES)]
+        )
+        text = random_text(rng, rng.randint(0, 3000), entities)
+        limit = rng.choice([1, 2, 7, 64, 500, 4000])
+        errors += [f"#{run} split {parse_mode}: {e}" for e in check_split(text, limit, parse_mode)]
+        lines = text.splitlines(keepends=True)
+        errors += [
+            f"#{run} lines: {e}"
+            for e in check_lines(lines, max(limit, 64), "*Заголовок*\n", "*Еще*\n")
+        ]
+        if len(errors) > 20:
+            break
+    for error in errors[:20]:
+        print(f"❌ {error}")
+    if not errors:
+        print(f"✅ {args.runs} случайных текстов разбиты корректно")
+    if not args.no_timing:
+        timing([100_000, 400_000, 1_600_000], rng)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
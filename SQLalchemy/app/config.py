@@ -14,6 +14,17 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASS: str
     DB_NAME: str
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # кэш подготовленных запросов asyncpg на соединение (0 - выключить,
+    # нужно за pgbouncer в режиме transaction)
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    # кэш prepared statements диалекта SQLAlchemy поверх asyncpg
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -28,6 +39,21 @@ class Settings(BaseSettings):
             database=self.DB_NAME,
         )
 
+    @property
+    def async_engine_options(self) -> dict:
+        return {
+            "echo": self.DB_ECHO,
+            "pool_size": self.DB_POOL_SIZE,
+            "max_overflow": self.DB_MAX_OVERFLOW,
+            "pool_timeout": self.DB_POOL_TIMEOUT,
+            "pool_recycle": self.DB_POOL_RECYCLE,
+            "pool_pre_ping": self.DB_POOL_PRE_PING,
+            "connect_args": {
+                "statement_cache_size": self.DB_STATEMENT_CACHE_SIZE,
+                "prepared_statement_cache_size": self.DB_PREPARED_STATEMENT_CACHE_SIZE,
+            },
+        }
+
     @property
     def sync_database_url(self) -> URL:
         return URL.create(
@@ -1,14 +1,26 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from config import settings
-from typing import AsyncIterator
+from typing import AsyncIterator, Optional
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from utils.db_metrics import InstrumentedQueuePool, install_pool_events, pool_metrics
 
-sync_engine = create_engine(url=settings.sync_database_url, echo=True)
-async_engine = create_async_engine(url=settings.async_database_url)  # echo = True
+sync_engine = create_engine(url=settings.sync_database_url, echo=settings.DB_ECHO)
+async_engine = create_async_engine(
+    url=settings.async_database_url,
+    poolclass=InstrumentedQueuePool,
+    **settings.async_engine_options,
+)
+install_pool_events(async_engine.sync_engine)
 
 SyncSessionLocal = sessionmaker(bind=sync_engine, autoflush=False, autocommit=False)
 AsyncSessionLocal = async_sessionmaker(bind=async_engine)
+# сессия на один апдейт (DBSessionMiddleware): после commit одного запроса
+# объекты, полученные хендлером раньше, не должны протухать
+RequestSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 
 
 class Base(DeclarativeBase):
@@ -20,6 +32,66 @@ async def get_async_db() -> AsyncIterator[AsyncSession]:
         yield session
 
 
+class _RequestSession:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        # сессию нельзя использовать параллельно - задачи, запущенные из
+        # хендлера через create_task, получают свою
+        self.task = asyncio.current_task()
+        self.depth = 0
+
+
+_request_session: ContextVar[Optional[_RequestSession]] = ContextVar(
+    "request_session", default=None
+)
+
+
+@asynccontextmanager
+async def request_session_scope() -> AsyncIterator[AsyncSession]:
+    async with RequestSessionLocal() as session:
+        token = _request_session.set(_RequestSession(session))
+        try:
+            yield session
+        finally:
+            _request_session.reset(token)
+
+
+@asynccontextmanager
+async def use_session(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    # Явно переданная сессия, затем сессия апдейта, иначе - новая, как раньше.
+    # Общая сессия не закрывается: соединение и транзакция переиспользуются
+    # следующими запросами того же апдейта. Поэтому метод, который сам ловит
+    # ошибку запроса, обязан сделать session.rollback() - иначе транзакция
+    # апдейта останется прерванной и следующие запросы упадут.
+    holder = _request_session.get()
+    if session is None and holder is not None and holder.task is asyncio.current_task():
+        session = holder.session
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    if holder is None or holder.session is not session:
+        yield session
+        return
+    holder.depth += 1
+    try:
+        yield session
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        holder.depth -= 1
+        if holder.depth == 0:
+            # каждый метод *Queries видит объекты заново, как со своей сессией
+            session.expunge_all()
+
+
+def pool_status() -> dict:
+    # занятые соединения, ожидание свободного и выходы за pool_size -
+    # видно, упирается ли задержка хендлеров в пул
+    return pool_metrics.snapshot(async_engine.pool)
+
+
 async def get_version():
     async with async_engine.connect() as conn:
         res = await conn.execute(text("SELECT VERSION()"))
@@ -0,0 +1,234 @@
+# flood_load_test.py
+# Офлайн-нагрузка на ThrottleMiddleware: синтетические callback-апдейты
+# подаются прямо в Dispatcher через feed_raw_update, Telegram и база не нужны.
+# --spammers пользователей без пауз жмут одни и те же кнопки, --users обычных
+# пользователей нажимают в среднем раз в --think-ms со случайным сдвигом (иначе
+# все 50 жмут одновременно и задержку задают их же пачки, а не спам). Хендлер
+# имитирует запрос в базу: держит одно из --pool "соединений" --work-ms
+# миллисекунд. Три прогона: без спамеров (эталон), со спамерами без middleware
+# и с ним. С middleware p95 обычных пользователей должен быть не хуже, чем без
+# него, и не дальше --tolerance-ms от эталона - спамеры не вытесняют остальных.
+# Dispatcher собирается как в main.py (setup_throttle, SimpleEventIsolation),
+# хранилище FSM считает чтения - отброшенный callback не должен читать состояние:
+#
+#   python flood_load_test.py --spammers 20 --clicks 200 --users 50
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import CallbackQuery
+from middleware.mw_throttle import ThrottleMiddleware, setup_throttle
+
+SPAM_BUTTONS = ["book_1", "genre_2", "orders_0", "add_to_cart_book_1"]
+SPAMMER_ID_START = 1_000_000
+
+
+class OfflineSession(BaseSession):
+    # вместо HTTP к Telegram только считаем вызовы
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if isinstance(method, AnswerCallbackQuery):
+            return True
+        raise RuntimeError(f"неожиданный запрос {type(method).__name__}")
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class CountingStorage(MemoryStorage):
+    # в боте каждое чтение - запрос в PostgresStorage
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    async def get_state(self, key):
+        self.reads += 1
+        return await super().get_state(key)
+
+    async def get_data(self, key):
+        self.reads += 1
+        return await super().get_data(key)
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(user_id),
+            "data": data,
+        },
+    }
+
+
+def build(args, throttle: ThrottleMiddleware = None):
+    pool = asyncio.Semaphore(args.pool)
+    executed = []
+    router = Router()
+
+    @router.callback_query(F.data)
+    async def handler(callback: CallbackQuery):
+        async with pool:
+            await asyncio.sleep(args.work_ms / 1000)
+        executed.append(callback.from_user.id)
+        await callback.answer()
+
+    storage = CountingStorage()
+    dp = Dispatcher(
+        storage=storage,
+        events_isolation=SimpleEventIsolation(),
+        disable_fsm=throttle is not None,
+    )
+    if throttle is not None:
+        setup_throttle(dp, throttle)
+    dp.include_router(router)
+    return dp, executed, storage
+
+
+async def run(args, throttle: ThrottleMiddleware = None, spammers: int = None) -> dict:
+    spammers = args.spammers if spammers is None else spammers
+    session = OfflineSession()
+    bot = Bot(token="42:OFFLINE", session=session)
+    dp, executed, storage = build(args, throttle)
+    counter = iter(range(1, 10**9))
+    rng = random.Random(args.seed)
+    latencies = []
+
+    async def spammer(user_id: int):
+        button = SPAM_BUTTONS[user_id % len(SPAM_BUTTONS)]
+        tasks = []
+        for _ in range(args.clicks):
+            update = callback_update(next(counter), user_id, button)
+            tasks.append(asyncio.create_task(dp.feed_raw_update(bot, update)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    async def user(user_id: int, delays: list):
+        for click, delay in enumerate(delays):
+            await asyncio.sleep(delay)
+            update = callback_update(next(counter), user_id, f"book_{click}")
+            started = time.perf_counter()
+            await dp.feed_raw_update(bot, update)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    think = args.think_ms / 1000
+    # одинаковый seed - одинаковые паузы во всех трех прогонах
+    pauses = [
+        [rng.uniform(0, think)]
+        + [rng.uniform(think / 2, think * 1.5) for _ in range(args.user_clicks - 1)]
+        for _ in range(args.users)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(spammer(SPAMMER_ID_START + i) for i in range(spammers)),
+        *(user(i, pauses[i]) for i in range(args.users)),
+    )
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    ordered = sorted(latencies)
+    return {
+        "elapsed": elapsed,
+        "updates": spammers * args.clicks + args.users * args.user_clicks,
+        "executed": len(executed),
+        "spam_executed": sum(user_id >= SPAMMER_ID_START for user_id in executed),
+        "api_calls": session.calls,
+        "fsm_reads": storage.reads,
+        "p50": statistics.median(ordered),
+        "p95": ordered[int(len(ordered) * 0.95) - 1],
+        "max": ordered[-1],
+    }
+
+
+def report(title: str, result: dict):
+    print(
+        f"{title}: апдейтов {result['updates']}, хендлеров {result['executed']} "
+        f"(спам {result['spam_executed']}), "
+        f"вызовов API {result['api_calls']}, чтений FSM {result['fsm_reads']}, "
+        f"время {result['elapsed']:.2f}с"
+    )
+    print(
+        f"  задержка обычных пользователей, мс: p50={result['p50']:.1f} "
+        f"p95={result['p95']:.1f} max={result['max']:.1f}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Флуд inline-кнопками")
+    parser.add_argument("--spammers", type=int, default=20)
+    parser.add_argument("--clicks", type=int, default=200)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--user-clicks", type=int, default=10)
+    parser.add_argument("--think-ms", type=float, default=500)
+    parser.add_argument("--work-ms", type=float, default=20)
+    parser.add_argument("--pool", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    # допустимый рост p95 - по умолчанию один лишний ход хендлера
+    parser.add_argument("--tolerance-ms", type=float, default=None)
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    tolerance = args.work_ms if args.tolerance_ms is None else args.tolerance_ms
+    clean = await run(args, spammers=0)
+    report("Без спамеров", clean)
+    baseline = await run(args)
+    report("Без ThrottleMiddleware", baseline)
+    throttle = ThrottleMiddleware()
+    throttled = await run(args, throttle)
+    report("С ThrottleMiddleware", throttled)
+    print(f"  {throttle.stats()}")
+    errors = []
+    spam_limit = args.spammers * max(
+        capacity + rate * throttled["elapsed"]
+        for rate, capacity in [*throttle.limits.values(), throttle.default_limit]
+    )
+    if throttled["spam_executed"] > spam_limit:
+        errors.append("спамеры прошли сверх лимита token bucket")
+    if throttled["executed"] - throttled["spam_executed"] != args.users * args.user_clicks:
+        errors.append("обычные пользователи попали под ограничение")
+    if throttled["fsm_reads"] != throttle.passed:
+        errors.append(
+            f"чтений FSM {throttled['fsm_reads']} при {throttle.passed} пропущенных"
+        )
+    if throttle.stats()["in_flight"]:
+        errors.append("после прогона остались незавершенные callback")
+    if throttled["executed"] + throttle.throttled + throttle.coalesced != throttled["updates"]:
+        errors.append("часть апдейтов потерялась")
+    if throttled["p95"] > baseline["p95"] + tolerance:
+        errors.append(
+            f"p95 обычных пользователей с middleware хуже: "
+            f"{baseline['p95']:.1f} -> {throttled['p95']:.1f} мс"
+        )
+    if throttled["p95"] > clean["p95"] + tolerance:
+        errors.append(
+            f"спамеры замедляют обычных пользователей: p95 {throttled['p95']:.1f} мс "
+            f"при {clean['p95']:.1f} мс без спама (допуск {tolerance:.0f} мс)"
+        )
+    for error in errors:
+        print(f"❌ {error}")
+    if not errors:
+        print(
+            f"✅ p95 обычных пользователей: {baseline['p95']:.1f} -> {throttled['p95']:.1f} мс "
+            f"(без спама {clean['p95']:.1f} мс)"
+        )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
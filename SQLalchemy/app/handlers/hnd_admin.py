@@ -53,6 +53,8 @@ from models import AppealStatus, AdminPermission, OrderStatus, AdminRole
 import asyncio
 from aiogram.exceptions import TelegramBadRequest
 from utils.admin_utils import PermissionChecker
+from utils.pagination import parse_page_callback
+from utils.message_cleanup import delete_messages
 
 
 admin_router = Router()
@@ -69,19 +71,6 @@ GENRES = {
 }
 
 
-async def delete_messages(bot, chat_id: int, message_ids: list):
-    for message_id in message_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-            # await asyncio.sleep(0.1)
-        except Exception as e:
-            if "message to delete not found" not in str(
-                e
-            ) and "message can't be deleted" not in str(e):
-                print(f"Ошибка удаления сообщения {message_id}: {e}")
-            continue
-
-
 def admin_required(handler):
     @wraps(handler)
     async def wrapper(event: Union[Message, CallbackQuery], *args, **kwargs):
@@ -265,7 +254,10 @@ async def appeal_sure_close(
     await SupportQueries.close_appeal(appeal_id, who_close="admin")
     status = await SupportQueries.check_appeal_status(appeal_id)
     appeal = await AdminQueries.get_admin_appeal_by_id(appeal_id)
-    message_parts, main_text = await admin_appeal_split_messages(appeal, admin_name)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await admin_appeal_split_messages(
+        appeal, transcript, admin_name
+    )
     try:
         await callback.message.delete()
     except Exception:
@@ -281,11 +273,18 @@ async def appeal_sure_close(
         )
         new_messages_to_delete.append(main_message.message_id)
     else:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await callback.message.answer(part_text, parse_mode="Markdown")
+            msg = await callback.message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             new_messages_to_delete.append(msg.message_id)
         main_message = await callback.message.answer(
             text=main_text,
@@ -397,7 +396,10 @@ async def admin_open_appeal(
     appeal = await AdminQueries.get_admin_appeal_by_id(appeal_id)
     await AdminQueries.admin_visited(appeal_id)
     status = await SupportQueries.check_appeal_status(appeal_id)
-    message_parts, main_text = await admin_appeal_split_messages(appeal, admin_name)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await admin_appeal_split_messages(
+        appeal, transcript, admin_name
+    )
     messages_to_delete = []
     await callback.message.delete()
     if not message_parts:
@@ -410,11 +412,18 @@ async def admin_open_appeal(
         )
         messages_to_delete.append(main_message.message_id)
     else:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await callback.message.answer(part_text, parse_mode="Markdown")
+            msg = await callback.message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             messages_to_delete.append(msg.message_id)
         main_message = await callback.message.answer(
             text=main_text,
@@ -439,8 +448,7 @@ async def agreement_before_new_appeal(
     admin_permissions: int,
     admin_name: str,
 ):
-    new_appeal = await AdminQueries.get_new_appeal()
-    if not new_appeal:
+    if not await AdminQueries.has_new_appeal():
         await callback.answer("Сейчас нет новых обращений", show_alert=True)
         return
     telegram_id = int(callback.from_user.id)
@@ -468,16 +476,16 @@ async def support_take_new(
     admin_permissions: int,
     admin_name: str,
 ):
-    new_appeal = await AdminQueries.get_new_appeal()
-    if not new_appeal:
+    appeal_id = await AdminQueries.claim_next_appeal(int(callback.from_user.id))
+    if not appeal_id:
         await callback.answer("Сейчас нет новых обращений", show_alert=True)
         return
-    await AdminQueries.assign_appeal_to_admin(
-        int(new_appeal.appeal_id), int(callback.from_user.id)
+    new_appeal = await AdminQueries.get_admin_appeal_by_id(appeal_id)
+    status = new_appeal.status
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await admin_appeal_split_messages(
+        new_appeal, transcript, admin_name
     )
-    await AdminQueries.admin_visited(new_appeal.appeal_id)
-    status = await SupportQueries.check_appeal_status(new_appeal.appeal_id)
-    message_parts, main_text = await admin_appeal_split_messages(new_appeal, admin_name)
     messages_to_delete = []
     await callback.message.delete()
     if not message_parts:
@@ -490,11 +498,18 @@ async def support_take_new(
         )
         messages_to_delete.append(main_message.message_id)
     else:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await callback.message.answer(part_text, parse_mode="Markdown")
+            msg = await callback.message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             messages_to_delete.append(msg.message_id)
         main_message = await callback.message.answer(
             text=main_text,
@@ -602,11 +617,11 @@ async def admin_all_closed_appeals_pagination(
     admin_permissions: int,
     admin_name: str,
 ):
-    page = int(callback.data.split("_")[-1])
+    page, cursor = parse_page_callback(callback.data)
     telegram_id = int(callback.from_user.id)
     admin = await AdminQueries.get_admin_by_telegram_id(telegram_id)
     appeals_data, total_count = await AdminQueries.get_closed_appeals(
-        admin.admin_id, page=page
+        admin.admin_id, page=page, cursor=cursor
     )
     await callback.message.edit_text(
         text=f"Ваши закрытые обращения. Всего у вас {total_count} закрытых обращений",
@@ -679,7 +694,7 @@ async def search_username_pagination(
     admin_permissions: int,
     admin_name: str,
 ):
-    page = int(callback.data.split("_")[-1])
+    page, cursor = parse_page_callback(callback.data)
     data = await state.get_data()
     username = data.get("search_username")
     if not username:
@@ -696,6 +711,7 @@ async def search_username_pagination(
         has_admin_permission=has_admin_permission,
         page=page,
         items_per_page=10,
+        cursor=cursor,
     )
     if not appeals_data:
         await callback.answer("Больше обращений нет", show_alert=True)
@@ -841,11 +857,11 @@ async def admin_new_orders_pagination(
     admin_name: str,
 ):
     try:
-        page = int(callback.data.split("_")[-1])
-        order_type = str(callback.data.split("_")[-2])
+        page, cursor = parse_page_callback(callback.data)
+        order_type = callback.data.removeprefix("page_admin_orders_").split("_")[0]
         total_count = await AdminQueries.get_admin_orders_count(order_type)
         orders_data = await AdminQueries.get_admin_orders_paginated(
-            order_type, page=page
+            order_type, page=page, cursor=cursor
         )
         if not orders_data:
             await callback.answer("Больше заказов нет", show_alert=True)
@@ -1034,7 +1050,8 @@ async def admin_contact_user(
         )
         status = await SupportQueries.check_appeal_status(appeal_id)
         appeal = await SupportQueries.get_appeal_full(appeal_id)
-        message_parts, main_text = await text_appeal_split_messages(appeal)
+        transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+        message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
         main_message = await callback.message.edit_text(
             text=main_text,
             parse_mode="Markdown",
@@ -1103,17 +1120,9 @@ async def cancellation_order_by_admin_with_reason(
                 parse_mode="HTML",
             )
             await callback.answer(text="Заказ успешно отменён", show_alert=True)
+            # деньги и книги уже возвращены в canceling_order_with_reason
             user_info = order_details.get("user", {})
             user_telegram_id = user_info.get("telegram_id")
-            order_price = order_details.get("total_price")
-            await OrderQueries.get_user_money_back(user_telegram_id, order_price)
-            book_data = order_details.get("books")
-            books = []
-            for book in book_data:
-                book_id = book.get("book_id")
-                quantity = book.get("quantity")
-                books.append((book_id, quantity))
-            await BookQueries.add_books_back_when_canceled_order(books)
             if user_telegram_id:
                 send_msg_to_user = await send_user_msg(
                     bot, order_id, user_telegram_id, status, reason
@@ -1346,11 +1355,13 @@ async def page_admin_see_admins(
         )
         return
     try:
-        page = int(callback.data.split("_")[-1])
-        admin_lvl = str(callback.data.split("_")[-2])
+        page, cursor = parse_page_callback(callback.data)
+        admin_lvl = callback.data.removeprefix("page_admin_see_admins_").split("_")[0]
         total_count = await AdminQueries.get_total_count_admins_by_lvl(admin_lvl)
-        orders_data = await AdminQueries.get_admins_paginated(admin_lvl, page=page)
-        if not orders_data:
+        admin_data = await AdminQueries.get_admins_paginated(
+            admin_lvl, page=page, cursor=cursor
+        )
+        if not admin_data:
             await callback.answer("Больше администраторов нет", show_alert=True)
             return
         admin_text = {
@@ -1362,7 +1373,7 @@ async def page_admin_see_admins(
         await callback.message.edit_text(
             text=admin_text.get(admin_lvl),
             reply_markup=await KbAdmin.kb_find_admins(
-                admin_lvl, orders_data=orders_data, page=page, total_count=total_count
+                admin_lvl, admin_data, page=page, total_count=total_count
             ),
             parse_mode="HTML",
         )
@@ -3782,7 +3793,8 @@ async def admin_first_appeal_message(
             pass
     appeal = await SupportQueries.get_appeal_full(appeal_id)
     status = await SupportQueries.check_appeal_status(appeal_id)
-    message_parts, main_text = await text_appeal_split_messages(appeal)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
     user_info = f"👤 Пользователь: {user_name}"
     if data.get("user_username"):
         user_info += f" {data.get('user_username')}"
@@ -3790,11 +3802,18 @@ async def admin_first_appeal_message(
     full_main_text = f"{main_text}\n{user_info}\n{order_info}"
     new_messages_to_delete = []
     if message_parts:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await message.answer(part_text, parse_mode="Markdown")
+            msg = await message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             new_messages_to_delete.append(msg.message_id)
     main_message = await message.answer(
         text=full_main_text,
@@ -3875,16 +3894,24 @@ async def message_from_support(
         await message.answer("❌ Обращение не найдено")
         await state.clear()
         return
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
     message_parts, main_text = await admin_appeal_split_messages(
-        updated_appeal, admin_name
+        updated_appeal, transcript, admin_name
     )
     new_messages_to_delete = []
     if message_parts:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await message.answer(part_text, parse_mode="Markdown")
+            msg = await message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             new_messages_to_delete.append(msg.message_id)
     main_message = await message.answer(
         text=main_text,
@@ -3967,7 +3994,10 @@ async def appeal_id_to_find(
             return
         await AdminQueries.admin_visited(appeal_id)
         status = await SupportQueries.check_appeal_status(appeal_id)
-        message_parts, main_text = await admin_appeal_split_messages(appeal, admin_name)
+        transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+        message_parts, main_text = await admin_appeal_split_messages(
+            appeal, transcript, admin_name
+        )
         messages_to_delete = []
         if not message_parts:
             main_message = await message.answer(
@@ -3979,13 +4009,20 @@ async def appeal_id_to_find(
             )
             messages_to_delete.append(main_message.message_id)
         else:
+            older_kb = await SupportKeyboards.kb_older_history(
+                appeal_id, transcript["older"]
+            )
             for i, part in enumerate(message_parts):
                 part_text = part
                 if len(message_parts) > 1:
                     part_text = (
                         f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
                     )
-                msg = await message.answer(part_text, parse_mode="Markdown")
+                msg = await message.answer(
+                    part_text,
+                    parse_mode="Markdown",
+                    reply_markup=older_kb if i == 0 else None,
+                )
                 messages_to_delete.append(msg.message_id)
             main_message = await message.answer(
                 text=main_text,
@@ -2,40 +2,37 @@ from aiogram import Bot, Router, F, types
 from aiogram.types import Message, CallbackQuery
 from utils.states import OrderForm
 from aiogram.fsm.context import FSMContext
-from queries.orm import OrderQueries, UserQueries, BookQueries, AdminQueries
+from queries.orm import (
+    OrderQueries,
+    UserQueries,
+    BookQueries,
+    AdminQueries,
+    PaymentQueries,
+)
 from text_templates import order_data_structure, text_address_data
 from keyboards.kb_order import OrderProcessing
 from keyboards.kb_admin import KbAdmin
+from utils.notifications import notification_dispatcher
+from utils.payment_expiry import PAYMENT_TIMEOUT, payment_expiry, utcnow
+from utils.message_cleanup import delete_messages
 from config import PAYMENT_TOKEN
 import asyncio
-from models import AdminPermission
+from models import AdminPermission, PaymentStatus
 from aiogram.types.message import ContentType
 import logging
 import asyncio
 import time
+from decimal import Decimal
 from aiogram.types import LabeledPrice, PreCheckoutQuery
 from aiogram.filters import Command
 from aiogram.enums import ContentType
 import regex as re
 
-pending_payments = {}
-
 processing = Router()
 
 payment_logger = logging.getLogger("payment")
 
 
-async def delete_messages(bot, chat_id: int, message_ids: list):
-    for message_id in message_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-        except Exception as e:
-            if "message to delete not found" not in str(
-                e
-            ) and "message can't be deleted" not in str(e):
-                print(f"Ошибка удаления сообщения {message_id}: {e}")
-
-
 async def validate_field(column_name: str, value: str) -> tuple[bool, str, str]:
     if column_name == "name":
         if not value:
@@ -203,23 +200,27 @@ async def send_order_notification(bot: Bot, order_data: dict, order_id: int):
         f"💬 *Комментарий:* {comment}\n"
         f"*Номер заказа* {order_id}"
     )
+    reply_markup = await KbAdmin.kb_open_order_for_admin(order_id)
+    notification_dispatcher.spawn(
+        notify_order_admins(bot, message_text, reply_markup)
+    )
+
+
+async def notify_order_admins(bot: Bot, message_text: str, reply_markup):
     try:
         admin_ids = await AdminQueries.get_admins_with_permission(
             AdminPermission.MANAGE_ORDERS
         )
-        for admin_id in admin_ids:
-            try:
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=message_text,
-                    parse_mode="Markdown",
-                    reply_markup=await KbAdmin.kb_open_order_for_admin(order_id),
-                )
-            except Exception as e:
-                print(f"Ошибка отправки уведомления админу {admin_id}: {e}")
-                continue
     except Exception as e:
         print(f"Ошибка при получении списка админов: {e}")
+        return
+    await notification_dispatcher.broadcast(
+        bot,
+        admin_ids,
+        text=message_text,
+        parse_mode="Markdown",
+        reply_markup=reply_markup,
+    )
 
 
 @processing.callback_query(F.data == "new_address")
@@ -477,12 +478,16 @@ async def replenish_balance(callback: CallbackQuery, bot: Bot, state: FSMContext
         except Exception as e:
             print(f"error in replenish_balance : {e}")
     payment_id = f"pay_{telegram_id}_{int(time.time())}"
-    pending_payments[payment_id] = {
-        "user_id": telegram_id,
-        "address_id": address_id,
-        "created_at": time.time(),
-        "status": "pending",
-    }
+    amount = int(-remainder * 100)
+    expires_at = utcnow() + PAYMENT_TIMEOUT
+    await PaymentQueries.create_payment(
+        payment_id=payment_id,
+        telegram_id=telegram_id,
+        chat_id=callback.message.chat.id,
+        address_id=address_id,
+        amount=amount,
+        expires_at=expires_at,
+    )
     invoice = await bot.send_invoice(
         chat_id=callback.message.chat.id,
         title="Покупка в магазине Book_bot",
@@ -490,7 +495,7 @@ async def replenish_balance(callback: CallbackQuery, bot: Bot, state: FSMContext
         provider_token=PAYMENT_TOKEN,
         currency="rub",
         is_flexible=False,
-        prices=[LabeledPrice(label="Пополнение баланса", amount=int(-remainder * 100))],
+        prices=[LabeledPrice(label="Пополнение баланса", amount=amount)],
         payload=payment_id,
         photo_url="https://thumbs.dreamstime.com/b/%D0%BA%D0%BD%D0%B8%D0%B6%D0%BD%D1%8B%D0%B5-%D0%BF%D0%BE%D0%BB%D0%BA%D0%B8-%D0%B4%D1%80%D0%B5%D0%B2%D0%BD%D0%B5%D0%B9-%D0%B2%D0%B5%D0%BD%D1%81%D0%BA%D0%BE%D0%B9-%D0%B1%D0%B8%D0%B1%D0%BB%D0%B8%D0%BE%D1%82%D0%B5%D0%BA%D0%B8-%D0%B0%D0%B2%D1%81%D1%82%D1%80%D0%B8%D1%8F-%D0%B2%D0%B5%D0%BD%D0%B0-%D1%81%D0%B5%D0%BD%D1%82%D1%8F%D0%B1%D1%80%D1%8C-%D0%B3%D0%BE%D0%B4%D0%B0-308270038.jpg",
         photo_height=450,
@@ -498,28 +503,9 @@ async def replenish_balance(callback: CallbackQuery, bot: Bot, state: FSMContext
         photo_size=100000,
     )
     await state.update_data(price=-remainder, invoice_message_id=invoice.message_id)
-    asyncio.create_task(
-        cancel_payment_after_timeout(bot, payment_id, telegram_id, invoice.message_id)
-    )
-
-
-async def cancel_payment_after_timeout(
-    bot: Bot, payment_id: str, user_id: int, invoice_message_id: int, timeout: int = 900
-):
-    await asyncio.sleep(timeout)
-    if (
-        payment_id in pending_payments
-        and pending_payments[payment_id]["status"] == "pending"
-    ):
-        pending_payments[payment_id]["status"] = "timeout"
-        try:
-            await bot.delete_message(chat_id=user_id, message_id=invoice_message_id)
-            print(f"Инвойс {invoice_message_id} удален по таймауту")
-        except Exception as e:
-            print(f"Не удалось удалить инвойс при таймауте: {e}")
-        await asyncio.sleep(3600)
-        if payment_id in pending_payments:
-            del pending_payments[payment_id]
+    await PaymentQueries.set_invoice_message(payment_id, invoice.message_id)
+    # таймаут инвойса обрабатывает общий планировщик, а не отдельная задача
+    payment_expiry.schedule(payment_id, expires_at)
 
 
 @processing.pre_checkout_query()
@@ -528,20 +514,13 @@ async def pre_checkout_query_handler(
 ):
     try:
         payment_id = pre_checkout_q.invoice_payload
-        if payment_id not in pending_payments:
+        payment_data = await PaymentQueries.get_pending_payment(payment_id)
+        if not payment_data:
             await pre_checkout_q.answer(
                 ok=False, error_message="Платеж устарел. Создайте новый."
             )
             return
-        payment_data = pending_payments[payment_id]
-        amount_expected = payment_data.get("amount", 0) * 100
-        if amount_expected == 0:
-            data = await state.get_data()
-            telegram_id = data.get("telegram_id")
-            user_balance = await UserQueries.get_user_balance(telegram_id)
-            total_price, cart_data = await OrderQueries.get_cart_total(telegram_id)
-            amount_expected = max(0, total_price - user_balance) * 100
-        if pre_checkout_q.total_amount != amount_expected:
+        if pre_checkout_q.total_amount != payment_data["amount"]:
             await pre_checkout_q.answer(
                 ok=False, error_message="Неверная сумма платежа"
             )
@@ -549,9 +528,9 @@ async def pre_checkout_query_handler(
         if pre_checkout_q.currency != "RUB":
             await pre_checkout_q.answer(ok=False, error_message="Неверная валюта")
             return
-        data = await state.get_data()
-        telegram_id = data.get("telegram_id")
-        total_price, cart_data = await OrderQueries.get_cart_total(telegram_id)
+        total_price, cart_data = await OrderQueries.get_cart_total(
+            payment_data["telegram_id"]
+        )
         all_available, insufficient_books = await BookQueries.check_books_availability(
             cart_data
         )
@@ -570,10 +549,17 @@ async def pre_checkout_query_handler(
 @processing.message(F.content_type == ContentType.SUCCESSFUL_PAYMENT)
 async def successful_payment(message: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
-    telegram_id = data.get("telegram_id")
+    payment_id = message.successful_payment.invoice_payload
+    # платеж закрываем сразу - планировщик таймаутов его уже не тронет
+    payment = await PaymentQueries.finish_payment(payment_id, PaymentStatus.PAID)
+    telegram_id = data.get("telegram_id", message.from_user.id)
     address_id = data.get("address_id")
     username = data.get("username")
     invoice_message_id = data.get("invoice_message_id")
+    if payment:
+        telegram_id = payment["telegram_id"]
+        address_id = payment["address_id"]
+        invoice_message_id = payment["invoice_message_id"] or invoice_message_id
     if invoice_message_id:
         try:
             await bot.delete_message(
@@ -582,17 +568,22 @@ async def successful_payment(message: Message, state: FSMContext, bot: Bot):
             print(f"Инвойс {invoice_message_id} удален после оплаты")
         except Exception as e:
             print(f"Не удалось удалить инвойс: {e}")
-    total_price, cart_data = await OrderQueries.get_cart_total(telegram_id)
-    price = int(total_price)
-    all_available, insufficient_books = await BookQueries.check_books_availability(
-        cart_data
+    # total_amount - в копейках
+    payment_amount = Decimal(message.successful_payment.total_amount) / 100
+    checkout = await OrderQueries.checkout(
+        telegram_id, address_id, top_up=payment_amount
     )
-    if not all_available:
+    if checkout["status"] != "ok":
+        reason = "Не удалось оформить заказ"
+        if checkout["insufficient_books"]:
+            reason = f"Товары закончились: {', '.join(checkout['insufficient_books'])}"
         await message.answer(
-            f"❌ Товары закончились: {', '.join(insufficient_books)}\n"
-            f"Свяжитесь с администратором для возврата средств."
+            f"❌ {reason}\n"
+            f"Оплаченная сумма зачислена на ваш баланс."
         )
         return
+    order_id = checkout["order_id"]
+    cart_data = checkout["cart_data"]
     address_data = await OrderQueries.get_user_address_data(telegram_id, address_id)
     address_dict = dict(address_data._mapping)
     order_data = {
@@ -601,21 +592,12 @@ async def successful_payment(message: Message, state: FSMContext, bot: Bot):
         "address": await format_address(address_dict),
         "payment": address_dict.get("payment", "Не указан"),
         "products": await format_products(cart_data),
-        "total_price": total_price,
+        "total_price": checkout["total_price"],
         "comment": address_dict.get("comment", "Нет комментария"),
         "user_id": telegram_id,
         "username": username or "Не указан",
     }
-    payment_amount = message.successful_payment.total_amount / 100
-    await UserQueries.updata_user_balance(telegram_id, payment_amount)
-    await BookQueries.decrease_book_value(cart_data)
-    await UserQueries.updata_user_balance(telegram_id, 0)
-    order_id = await OrderQueries.made_order(telegram_id, address_id, price, cart_data)
     await send_order_notification(bot, order_data, order_id)
-    await OrderQueries.del_cart(telegram_id)
-    payment_id = message.successful_payment.invoice_payload
-    if payment_id in pending_payments:
-        del pending_payments[payment_id]
     await message.answer(
         text=f"🎊 Заказ оформлен! 🎊\n\nНомер вашего заказа {order_id}\n\nВ Ближайшее время с вам свяжется менеджер для согласования даты доставки\n\nСледить за статусом заказа можно в разделе: 📦 Мои заказы",
         reply_markup=await OrderProcessing.kb_order_last_step(0, True, address_id),
@@ -668,9 +650,8 @@ async def show_last_order(message: Message, bot: Bot):
 
 @processing.callback_query(F.data.startswith("cancel_payment_"))
 async def cancel_payment(callback: CallbackQuery, bot: Bot, state: FSMContext):
-    payment_id = callback.data.split("_")[-1]
-    if payment_id in pending_payments:
-        del pending_payments[payment_id]
+    payment_id = callback.data.removeprefix("cancel_payment_")
+    if await PaymentQueries.finish_payment(payment_id, PaymentStatus.CANCELLED):
         await callback.answer("Платеж отменен", show_alert=True)
         await callback.message.edit_text(
             "Платеж был отменен. Вы можете попробовать снова или изменить содержимое корзины."
@@ -683,62 +664,51 @@ async def new_order_done(callback: CallbackQuery, bot: Bot):
     address_str = callback.data.split("_")[3]
     address_id = int(address_str)
     telegram_id = callback.from_user.id
-    address_data = await OrderQueries.get_user_address_data(telegram_id, address_id)
-    total_price, cart_data = await OrderQueries.get_cart_total(telegram_id)
-    price = int(total_price)
-    user_balance = await UserQueries.get_user_balance(telegram_id)
-    balance = int(user_balance)
-    remainder = balance - price
-    if remainder >= 0:
-        all_available, insufficient_books = await BookQueries.check_books_availability(
-            cart_data
-        )
-        if all_available:
-            if address_data:
-                address_dict = dict(address_data._mapping)
-            else:
-                address_dict = {}
-            order_data = {
-                "user_name": address_dict.get("name", "Не указано"),
-                "user_phone": address_dict.get("phone", "Не указан"),
-                "address": await format_address(address_dict),
-                "payment": address_dict.get("payment", "Не указан"),
-                "products": await format_products(cart_data),
-                "total_price": total_price,
-                "comment": address_dict.get("comment", "Нет комментария"),
-                "user_id": telegram_id,
-                "username": callback.from_user.username or "Не указан",
-            }
-            await BookQueries.decrease_book_value(cart_data)
-            await UserQueries.updata_user_balance(telegram_id, remainder)
-            order_id = await OrderQueries.made_order(
-                telegram_id, address_id, price, cart_data
-            )
-            await send_order_notification(bot, order_data, order_id)
-            await OrderQueries.del_cart(telegram_id)
-            await wait_msg.delete()
-            await callback.message.edit_text(
-                text=f"🎊 Заказ оформлен! 🎊\n\nНомер вашего заказа {order_id}\n\nВ Ближайшее время с вам свяжется менеджер для согласования даты доставки\n\nСледить за статусом заказа можно в разделе: 📦 Мои заказы",
-                reply_markup=await OrderProcessing.kb_order_last_step(
-                    remainder, all_available, address_id
-                ),
-            )
+    # проверка остатков и баланса, заказ, списание и очистка корзины -
+    # одна транзакция с блокировкой строк книг
+    checkout = await OrderQueries.checkout(telegram_id, address_id)
+    remainder = int(checkout["remainder"])
+    all_available = not checkout["insufficient_books"]
+    await wait_msg.delete()
+    if checkout["status"] == "ok":
+        order_id = checkout["order_id"]
+        address_data = await OrderQueries.get_user_address_data(telegram_id, address_id)
+        if address_data:
+            address_dict = dict(address_data._mapping)
         else:
-            await wait_msg.delete()
-            await callback.message.edit_text(
-                text=f"❌ Произошла Ошибка, у нас не хватает книг\n\n{''.join(insufficient_books)}\n\nПожалуйста, вернитесь в главное корзину и повторите попытку.",
-                reply_markup=await OrderProcessing.kb_order_last_step(
-                    remainder, all_available, address_id
-                ),
-            )
-    else:
-        await wait_msg.delete()
+            address_dict = {}
+        order_data = {
+            "user_name": address_dict.get("name", "Не указано"),
+            "user_phone": address_dict.get("phone", "Не указан"),
+            "address": await format_address(address_dict),
+            "payment": address_dict.get("payment", "Не указан"),
+            "products": await format_products(checkout["cart_data"]),
+            "total_price": checkout["total_price"],
+            "comment": address_dict.get("comment", "Нет комментария"),
+            "user_id": telegram_id,
+            "username": callback.from_user.username or "Не указан",
+        }
+        await send_order_notification(bot, order_data, order_id)
+        await callback.message.edit_text(
+            text=f"🎊 Заказ оформлен! 🎊\n\nНомер вашего заказа {order_id}\n\nВ Ближайшее время с вам свяжется менеджер для согласования даты доставки\n\nСледить за статусом заказа можно в разделе: 📦 Мои заказы",
+            reply_markup=await OrderProcessing.kb_order_last_step(
+                remainder, all_available, address_id
+            ),
+        )
+    elif checkout["status"] == "insufficient_funds":
         await callback.message.edit_text(
             text=f"❌ На вашем балансе не хватает {-remainder}₽ для заказа",
             reply_markup=await OrderProcessing.kb_order_last_step(
                 remainder, all_available, address_id
             ),
         )
+    else:
+        await callback.message.edit_text(
+            text=f"❌ Произошла Ошибка, у нас не хватает книг\n\n{''.join(checkout['insufficient_books'])}\n\nПожалуйста, вернитесь в главное корзину и повторите попытку.",
+            reply_markup=await OrderProcessing.kb_order_last_step(
+                remainder, False, address_id
+            ),
+        )
 
 
 # FMScontext hnd
@@ -2,6 +2,7 @@ from aiogram import Bot, Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from utils.states import ReviewState
+from utils.message_cleanup import delete_messages
 from queries.orm import BookQueries, ReviewQueries, UserQueries
 from text_templates import book_for_review, get_full_review
 from keyboards.kb_review import KbReview
@@ -22,15 +23,6 @@ review_model = {
 }
 
 
-async def delete_messages(bot, chat_id: int, message_ids: list):
-    for message_id in message_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-        except Exception as e:
-            if "message to delete not found" not in str(e):
-                print(f"Ошибка удаления сообщения {message_id}: {e}")
-
-
 @review_router.callback_query(F.data.startswith("new_review_"))
 async def start_review(callback: CallbackQuery, state: FSMContext):
     book_id = int(callback.data.split("_")[2])
@@ -3,32 +3,25 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from config import ADMIN_ID
 from utils.states import SupportState
-from queries.orm import SupportQueries
+from utils.message_cleanup import delete_messages
+from queries.orm import AdminQueries, SupportQueries
 from keyboards.kb_support import SupportKeyboards
 from text_templates import (
+    appeal_header_text,
     appeal_hint_text,
     cooldown_text,
     text_appeal_split_messages,
+    text_appeal_tail_parts,
     message_cooldown_text,
+    older_history_parts,
 )
 from aiogram.exceptions import TelegramBadRequest
 import asyncio
+import math
 
 support_router = Router()
 
 
-async def delete_messages(bot, chat_id: int, message_ids: list):
-    for message_id in message_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-            # await asyncio.sleep(0.1)
-        except Exception as e:
-            if "message to delete not found" not in str(
-                e
-            ) and "message can't be deleted" not in str(e):
-                print(f"Ошибка удаления сообщения {message_id}: {e}")
-
-
 @support_router.callback_query(F.data == "support")
 async def contact_support(callback: CallbackQuery, state: FSMContext):
     telegram_id = int(callback.from_user.id)
@@ -52,9 +45,9 @@ async def contact_support(callback: CallbackQuery, state: FSMContext):
 @support_router.callback_query(F.data == "new_appeal")
 async def new_appeal(callback: CallbackQuery, state: FSMContext):
     telegram_id = int(callback.from_user.id)
-    no_cooldown = await SupportQueries.can_create_appeal(telegram_id)
-    if not no_cooldown:
-        cooldown_time = await SupportQueries.get_cooldown_minutes(telegram_id)
+    cooldown_seconds = await SupportQueries.appeal_cooldown_seconds(telegram_id)
+    if cooldown_seconds:
+        cooldown_time = math.ceil(cooldown_seconds / 60)
         last_appeal_id = await SupportQueries.get_last_appeal_id(telegram_id)
         text = await cooldown_text(cooldown_time)
         main_message = await callback.message.edit_text(
@@ -67,7 +60,8 @@ async def new_appeal(callback: CallbackQuery, state: FSMContext):
     status = await SupportQueries.check_appeal_status(appeal_id)
     hint_text = await appeal_hint_text(appeal_id)
     appeal = await SupportQueries.get_appeal_full(appeal_id)
-    message_parts, main_text = await text_appeal_split_messages(appeal)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
     main_message = await callback.message.edit_text(
         text=main_text,
         parse_mode="Markdown",
@@ -86,6 +80,7 @@ async def new_appeal(callback: CallbackQuery, state: FSMContext):
         last_hint_id=hint_message.message_id,
         user_messages=[],
         current_step="message_to_support",
+        transcript_cursor=None,
     )
 
 
@@ -97,15 +92,23 @@ async def open_appeal(callback: CallbackQuery, state: FSMContext):
     if not appeal:
         await callback.answer("❌ Обращение не найдено", show_alert=True)
         return
-    message_parts, main_text = await text_appeal_split_messages(appeal)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
     messages_to_delete = []
     await callback.message.delete()
     if message_parts:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await callback.message.answer(part_text, parse_mode="Markdown")
+            msg = await callback.message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             messages_to_delete.append(msg.message_id)
     has_user_msg = await SupportQueries.has_user_msg(appeal_id)
     if not has_user_msg:
@@ -134,6 +137,56 @@ async def open_appeal(callback: CallbackQuery, state: FSMContext):
         messages_to_delete=messages_to_delete,
         main_message_id=main_message.message_id,
         last_hint_id=last_hint_id,
+        transcript_cursor=transcript["latest"] if message_parts else None,
+    )
+    await callback.answer()
+
+
+@support_router.callback_query(F.data.startswith("appeal_older_"))
+async def appeal_older_history(callback: CallbackQuery, state: FSMContext):
+    # Ранние сообщения обращения окнами по TRANSCRIPT_WINDOW. Общий хендлер
+    # для пользователя и админа: кнопка висит на первой части переписки, а
+    # новое окно приходит отдельными сообщениями со своей кнопкой дальше.
+    _, _, appeal_id, cursor = callback.data.split("_", 3)
+    appeal_id = int(appeal_id)
+    telegram_id = int(callback.from_user.id)
+    appeal = await SupportQueries.get_appeal_full(appeal_id)
+    if not appeal:
+        await callback.answer("❌ Обращение не найдено", show_alert=True)
+        return
+    admin = None
+    if appeal.telegram_id != telegram_id:
+        admin = await AdminQueries.get_admin_identity(telegram_id)
+        if admin is None:
+            await callback.answer("❌ Обращение не найдено", show_alert=True)
+            return
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id, cursor=cursor)
+    message_parts = older_history_parts(
+        appeal_id,
+        transcript,
+        admin_name=admin["name"] if admin else None,
+        for_admin=admin is not None,
+    )
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except TelegramBadRequest:
+        pass
+    older_kb = await SupportKeyboards.kb_older_history(appeal_id, transcript["older"])
+    new_message_ids = []
+    for i, part in enumerate(message_parts):
+        part_text = part
+        if len(message_parts) > 1:
+            part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
+        msg = await callback.message.answer(
+            part_text,
+            parse_mode="Markdown",
+            reply_markup=older_kb if i == 0 else None,
+        )
+        new_message_ids.append(msg.message_id)
+    # удаляются вместе с остальной перепиской при следующей перерисовке
+    data = await state.get_data()
+    await state.update_data(
+        messages_to_delete=data.get("messages_to_delete", []) + new_message_ids
     )
     await callback.answer()
 
@@ -153,7 +206,8 @@ async def appeal_sure_close(callback: CallbackQuery):
     await SupportQueries.close_appeal(appeal_id, who_close="user")
     status = await SupportQueries.check_appeal_status(appeal_id)
     appeal = await SupportQueries.get_appeal_full(appeal_id)
-    message_parts, main_text = await text_appeal_split_messages(appeal)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
     await callback.message.edit_text(
         text=main_text,
         parse_mode="Markdown",
@@ -171,13 +225,21 @@ async def new_msg_to_support(callback: CallbackQuery, state: FSMContext):
     if not appeal:
         await callback.answer("❌ Обращение не найдено", show_alert=True)
         return
-    message_parts, main_text = await text_appeal_split_messages(appeal)
+    transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+    message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
     if message_parts:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
             if len(message_parts) > 1:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await callback.message.answer(part_text, parse_mode="Markdown")
+            msg = await callback.message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             messages_to_delete.append(msg.message_id)
     main_message = await callback.message.edit_text(
         text=main_text,
@@ -197,6 +259,7 @@ async def new_msg_to_support(callback: CallbackQuery, state: FSMContext):
         messages_to_delete=messages_to_delete,
         main_message_id=main_message.message_id,
         last_hint_id=last_hint_id,
+        transcript_cursor=transcript["latest"] if message_parts else None,
     )
     await callback.answer()
 
@@ -211,8 +274,8 @@ async def message_to_support(message: Message, state: FSMContext):
     old_messages_to_delete = data.get("messages_to_delete", [])
     last_hint_id = data.get("last_hint_id")
     old_main_message_id = data.get("main_message_id")
-    no_message_cooldown = await SupportQueries.message_cooldown(telegram_id)
-    if not no_message_cooldown:
+    cooldown_time = await SupportQueries.message_cooldown_seconds(telegram_id)
+    if cooldown_time:
         if last_hint_id:
             try:
                 await bot.delete_message(
@@ -226,7 +289,6 @@ async def message_to_support(message: Message, state: FSMContext):
             )
         except Exception:
             pass
-        cooldown_time = await SupportQueries.get_message_cooldown_seconds(telegram_id)
         text = await message_cooldown_text(cooldown_time)
         hint_message = await message.answer(text=text)
         await state.update_data(last_hint_id=hint_message.message_id)
@@ -239,7 +301,11 @@ async def message_to_support(message: Message, state: FSMContext):
     await SupportQueries.new_user_message(
         telegram_id=telegram_id, appeal_id=appeal_id, message=message.text
     )
-    all_messages_to_delete = old_messages_to_delete.copy()
+    # переписка уже показана частями - старые части остаются в чате,
+    # дописываем только новые сообщения и заново шлем главное сообщение
+    transcript_cursor = data.get("transcript_cursor")
+    tail_only = bool(transcript_cursor and old_messages_to_delete)
+    all_messages_to_delete = [] if tail_only else old_messages_to_delete.copy()
     if old_main_message_id:
         all_messages_to_delete.append(old_main_message_id)
     await delete_messages(bot, message.chat.id, all_messages_to_delete)
@@ -249,14 +315,30 @@ async def message_to_support(message: Message, state: FSMContext):
         print(f"Не удалось удалить сообщение пользователя: {e}")
     appeal = await SupportQueries.get_appeal_full(appeal_id)
     status = await SupportQueries.check_appeal_status(appeal_id)
-    message_parts, main_text = await text_appeal_split_messages(appeal)
-    new_messages_to_delete = []
+    if tail_only:
+        transcript = await SupportQueries.get_appeal_transcript(
+            appeal_id, cursor=transcript_cursor
+        )
+        message_parts = text_appeal_tail_parts(appeal_id, transcript)
+        main_text = appeal_header_text(appeal)
+        new_messages_to_delete = old_messages_to_delete.copy()
+    else:
+        transcript = await SupportQueries.get_appeal_transcript(appeal_id)
+        message_parts, main_text = await text_appeal_split_messages(appeal, transcript)
+        new_messages_to_delete = []
     if message_parts:
+        older_kb = await SupportKeyboards.kb_older_history(
+            appeal_id, transcript["older"]
+        )
         for i, part in enumerate(message_parts):
             part_text = part
-            if len(message_parts) > 1:
+            if len(message_parts) > 1 and not tail_only:
                 part_text = f"*Часть {i + 1} из {len(message_parts)}*\n\n" + part_text
-            msg = await message.answer(part_text, parse_mode="Markdown")
+            msg = await message.answer(
+                part_text,
+                parse_mode="Markdown",
+                reply_markup=older_kb if i == 0 else None,
+            )
             new_messages_to_delete.append(msg.message_id)
     main_message = await message.answer(
         text=main_text,
@@ -271,4 +353,5 @@ async def message_to_support(message: Message, state: FSMContext):
         main_message_id=main_message.message_id,
         last_hint_id=None,
         user_messages=[],
+        transcript_cursor=transcript["latest"] if new_messages_to_delete else None,
     )
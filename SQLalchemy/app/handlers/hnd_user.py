@@ -22,24 +22,13 @@ from models import AdminPermission
 from aiogram.exceptions import TelegramBadRequest
 from utils.states import BookDetailsState, UserSearchBook
 from utils.admin_utils import PermissionChecker
+from utils.message_cleanup import delete_messages
 from aiogram.fsm.context import FSMContext
 import asyncio
 
 user_router = Router()
 
 
-async def delete_messages(bot, chat_id: int, message_ids: list):
-    for message_id in message_ids:
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-            # await asyncio.sleep(0.1)
-        except Exception as e:
-            if "message to delete not found" not in str(
-                e
-            ) and "message can't be deleted" not in str(e):
-                print(f"Ошибка удаления сообщения {message_id}: {e}")
-
-
 GENRES = {
     "fantasy": "Фэнтази🚀",
     "horror": "Ужасы👻",
@@ -86,10 +75,10 @@ async def cmd_start(message: Message, state: FSMContext):
         "username": message.from_user.username,
         "user_first_name": message.from_user.first_name,
     }
-    is_admin = await AdminQueries.is_user_admin(int(message.from_user.id))
-    user = await UserQueries.get_user_if_exist(user_data)
+    user = await UserQueries.register_user(user_data)
+    is_admin = user["is_admin"]
     text = f"""
-📖 Привет {user.user_first_name}, Я — Book Bot *DEMO*, твой персональный помощник в мире книг.  
+📖 Привет {user['user_first_name']}, Я — Book Bot *DEMO*, твой персональный помощник в мире книг.  
 
     Как работает бот - https://youtu.be/UZgf7kV-oJU
 
@@ -215,17 +204,16 @@ async def check_reviews(callback: CallbackQuery):
 @user_router.callback_query(F.data.startswith("orders_"))
 async def orders_pagination(callback: CallbackQuery):
     telegram_id = callback.from_user.id
-    if callback.data.startswith("orders_prev_"):
-        parts = callback.data.split("_")
-        offset = int(parts[2])
-        limit = int(parts[3])
-    elif callback.data.startswith("orders_next_"):
-        parts = callback.data.split("_")
-        offset = int(parts[2])
-        limit = int(parts[3])
+    # orders_{prev|next}_{offset}_{limit}_{cursor}
+    parts = callback.data.split("_")
+    offset = int(parts[2])
+    limit = int(parts[3])
+    cursor = parts[4] if len(parts) > 4 else None
     await callback.message.edit_text(
         "📦 Ваши заказы:",
-        reply_markup=await UserKeyboards.kb_my_orders(telegram_id, offset, limit),
+        reply_markup=await UserKeyboards.kb_my_orders(
+            telegram_id, offset, limit, cursor
+        ),
     )
     await callback.answer()
 
@@ -260,20 +248,21 @@ async def cart(callback: CallbackQuery, state: FSMContext):
             bot = callback.bot
             await delete_messages(bot, callback.message.chat.id, [last_hint_id])
         await state.clear()
-    total_price, cart_data = await OrderQueries.get_cart_total(telegram_id)
+    cart_view = await OrderQueries.get_cart_view(telegram_id)
+    total_price = cart_view["total_price"]
     list_of_books = []
-    for book_data in cart_data:
+    for book_data in cart_view["items"]:
         books_inside = (
             f"\n📖{book_data['book']} {book_data['quantity']}шт.  {book_data['price']}₽"
         )
         list_of_books.append(books_inside)
-    user_balance = await UserQueries.get_user_balance(telegram_id)
+    user_balance = cart_view["user_balance"]
+    has_address = cart_view["has_address"]
     await callback.answer("Корзина")
     if photo_message_id:
         bot = callback.message.bot
         await delete_messages(bot, callback.message.chat.id, [photo_message_id])
         if total_price > 1:
-            has_address = await OrderQueries.has_address(telegram_id)
             if has_address:
                 main_message = await callback.message.answer(
                     f"    🛒Корзина\n{''.join(list_of_books)}\n\n💳 Ваш баланс - {user_balance}₽\n💵 Сумма корзины -  {total_price}₽",
@@ -292,7 +281,6 @@ async def cart(callback: CallbackQuery, state: FSMContext):
         await state.update_data(main_message_id=main_message.message_id)
         return
     if total_price > 1:
-        has_address = await OrderQueries.has_address(telegram_id)
         if has_address:
             await callback.message.edit_text(
                 f"    🛒Корзина\n{''.join(list_of_books)}\n\n💳 Ваш баланс - {user_balance}₽\n💵 Сумма корзины -  {total_price}₽",
@@ -384,7 +372,7 @@ async def book_details(callback: CallbackQuery, state: FSMContext):
         if last_hint_id:
             bot = callback.message.bot
             await delete_messages(bot, callback.message.chat.id, [last_hint_id])
-        book_data = await BookQueries.get_book_info(book_id)
+        book_data = await BookQueries.get_book_card(book_id)
         if not book_data:
             await callback.answer(
                 "Не удалось найти книгу. Повторите попытку позже", show_alert=True
@@ -395,11 +383,11 @@ async def book_details(callback: CallbackQuery, state: FSMContext):
         else:
             text = await get_book_details(book_data)
         genre_in_text = GENRES.get(book_data["book_genre"], book_data["book_genre"])
-        book_cover = await BookQueries.has_cover(book_id)
-        admin = await AdminQueries.is_user_admin(telegram_id)
+        book_cover = book_data["book_photo_id"]
+        admin = await AdminQueries.get_admin_identity(telegram_id)
         if admin:
             can_manage_book_data = PermissionChecker.has_permission(
-                admin.permissions, AdminPermission.MANAGE_BOOKS
+                admin["permissions"], AdminPermission.MANAGE_BOOKS
             )
         else:
             can_manage_book_data = False
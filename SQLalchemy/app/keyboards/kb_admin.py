@@ -1,5 +1,6 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from utils.admin_utils import PermissionChecker
+from utils.pagination import page_cursors, build_page_callback
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from models import AdminPermission, AppealStatus, OrderStatus, BookGenre
 from datetime import datetime
@@ -997,6 +998,9 @@ class KbAdmin:
         total_count: int = 0,
         items_per_page: int = 10,
     ) -> InlineKeyboardMarkup:
+        prev_cursor, next_cursor = page_cursors(
+            orders_data, "created_date", "order_id"
+        )
         builder = InlineKeyboardBuilder()
         for order in orders_data:
             order_id = order.get("order_id")
@@ -1027,7 +1031,9 @@ class KbAdmin:
                 pagination_buttons.append(
                     InlineKeyboardButton(
                         text="⬅️ Назад",
-                        callback_data=f"page_admin_orders_{order_type}_{page - 1}",
+                        callback_data=build_page_callback(
+                            f"page_admin_orders_{order_type}", page - 1, prev_cursor
+                        ),
                     )
                 )
             pagination_buttons.append(
@@ -1039,7 +1045,9 @@ class KbAdmin:
                 pagination_buttons.append(
                     InlineKeyboardButton(
                         text="Вперед ➡️",
-                        callback_data=f"page_admin_orders_{order_type}_{page + 1}",
+                        callback_data=build_page_callback(
+                            f"page_admin_orders_{order_type}", page + 1, next_cursor
+                        ),
                     )
                 )
             builder.row(*pagination_buttons)
@@ -1120,10 +1128,11 @@ class KbAdmin:
         total_count: int = 0,
         items_per_page: int = 10,
     ) -> InlineKeyboardMarkup:
+        prev_cursor, next_cursor = page_cursors(admin_data, "created_at", "admin_id")
         builder = InlineKeyboardBuilder()
         for admin in admin_data:
             admin_id = admin.get("admin_id")
-            admin_name = admin.name
+            admin_name = admin.get("name")
             button_text = f"{admin_name}"
             if len(button_text) > 40:
                 button_text = button_text[:37] + "..."
@@ -1138,7 +1147,9 @@ class KbAdmin:
                 pagination_buttons.append(
                     InlineKeyboardButton(
                         text="⬅️ Назад",
-                        callback_data=f"page_admin_see_admins_{admin_lvl}_{page - 1}",
+                        callback_data=build_page_callback(
+                            f"page_admin_see_admins_{admin_lvl}", page - 1, prev_cursor
+                        ),
                     )
                 )
             pagination_buttons.append(
@@ -1150,7 +1161,9 @@ class KbAdmin:
                 pagination_buttons.append(
                     InlineKeyboardButton(
                         text="Вперед ➡️",
-                        callback_data=f"page_admin_see_admins_{admin_lvl}_{page + 1}",
+                        callback_data=build_page_callback(
+                            f"page_admin_see_admins_{admin_lvl}", page + 1, next_cursor
+                        ),
                     )
                 )
             builder.row(*pagination_buttons)
@@ -1346,6 +1359,7 @@ class KbAdmin:
         page_callback: str = "admin_all_closed_appeals_page_",
         back_callback: str = "support_my_closed",
     ) -> InlineKeyboardMarkup:
+        prev_cursor, next_cursor = page_cursors(appeals_data, "updated_at", "appeal_id")
         builder = InlineKeyboardBuilder()
         for appeal in appeals_data:
             appeal_id = appeal.get("appeal_id")
@@ -1379,7 +1393,9 @@ class KbAdmin:
                 pagination_buttons.append(
                     InlineKeyboardButton(
                         text="⬅️",
-                        callback_data=f"{page_callback}_{page - 1}",
+                        callback_data=build_page_callback(
+                            page_callback, page - 1, prev_cursor
+                        ),
                     )
                 )
             pagination_buttons.append(
@@ -1391,7 +1407,9 @@ class KbAdmin:
                 pagination_buttons.append(
                     InlineKeyboardButton(
                         text="➡️",
-                        callback_data=f"{page_callback}_{page + 1}",
+                        callback_data=build_page_callback(
+                            page_callback, page + 1, next_cursor
+                        ),
                     )
                 )
             builder.row(*pagination_buttons)
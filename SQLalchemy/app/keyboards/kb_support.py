@@ -89,6 +89,22 @@ class SupportKeyboards:
 
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+    @staticmethod
+    async def kb_older_history(appeal_id: int, older: str) -> InlineKeyboardMarkup:
+        # кнопка на первой части переписки, если показаны не все сообщения
+        if not older:
+            return None
+        return InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="📜 Показать более ранние сообщения",
+                        callback_data=f"appeal_older_{appeal_id}_{older}",
+                    )
+                ]
+            ]
+        )
+
     @staticmethod
     async def kb_appeal_cooldown(last_appeal_id: int) -> InlineKeyboardMarkup:
         keyboard = [
@@ -1,5 +1,6 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from queries.orm import OrderQueries
+from utils.pagination import page_cursors
 from typing import Dict, List
 
 
@@ -295,10 +296,11 @@ class UserKeyboards:
 
     @staticmethod
     async def kb_my_orders(
-        telegram_id: int, offset: int = 0, limit: int = 5
+        telegram_id: int, offset: int = 0, limit: int = 5, cursor: str = None
     ) -> InlineKeyboardMarkup:
-        orders = await OrderQueries.get_user_orders(telegram_id, limit, offset)
+        orders = await OrderQueries.get_user_orders(telegram_id, limit, offset, cursor)
         total_orders = await OrderQueries.get_user_orders_count(telegram_id)
+        prev_cursor, next_cursor = page_cursors(orders, "created_date", "order_id")
         keyboard = []
         for order in orders:
             order_id = order["order_id"]
@@ -318,14 +320,16 @@ class UserKeyboards:
             navigation_buttons.append(
                 InlineKeyboardButton(
                     text="⬅️ Назад",
-                    callback_data=f"orders_prev_{offset - limit}_{limit}",
+                    callback_data=f"orders_prev_{offset - limit}_{limit}"
+                    + (f"_{prev_cursor}" if prev_cursor else ""),
                 )
             )
         if offset + limit < total_orders:
             navigation_buttons.append(
                 InlineKeyboardButton(
                     text="Дальше ➡️",
-                    callback_data=f"orders_next_{offset + limit}_{limit}",
+                    callback_data=f"orders_next_{offset + limit}_{limit}"
+                    + (f"_{next_cursor}" if next_cursor else ""),
                 )
             )
         if navigation_buttons:
@@ -1,7 +1,9 @@
 from queries.core import (
     create_tables,
+    rebuild_book_ratings,
     insert_data_author,
     select_books,
+    stats_refresh_loop,
     update_user_name,
     update_username,
 )
@@ -9,11 +11,28 @@ from queries.orm import BookQueries, AuthorQueries, DBData, UserQueries, SaleQue
 from schemas import AuthorCreate
 import asyncio
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from config import TOKEN
 from handlers import setup_router
+from middleware.mw_session import DBSessionMiddleware
+from middleware.mw_throttle import setup_throttle
+from utils.fsm_storage import FSMBatchMiddleware, PostgresStorage
+from utils.notifications import notification_dispatcher
+from utils.payment_expiry import payment_expiry
+
+# сколько при остановке ждать уведомления, запущенные последними апдейтами
+SHUTDOWN_NOTIFICATIONS_TIMEOUT = 30
 
 bot = Bot(token=TOKEN)
-dp = Dispatcher()
+fsm_storage = PostgresStorage()
+# FSMBatchMiddleware пишет состояние в конце апдейта - апдейты одного
+# пользователя выполняются по очереди, иначе поздняя запись затрет раннюю
+dp = Dispatcher(
+    storage=fsm_storage, events_isolation=SimpleEventIsolation(), disable_fsm=True
+)
+setup_throttle(dp)
+dp.update.outer_middleware(DBSessionMiddleware())
+dp.update.outer_middleware(FSMBatchMiddleware(fsm_storage))
 
 setup_router(dp)
 
@@ -21,9 +40,24 @@ setup_router(dp)
 async def main():
     await create_tables()
     await DBData.fake_data()
+    await rebuild_book_ratings()
     await SaleQueries.add_on_sale([1, 7, 15, 17, 20, 27, 30, 37, 40, 47, 51, 57], 0.2)
     await SaleQueries.add_on_sale([2, 12, 22, 32, 42, 52], 0.1)
-    await dp.start_polling(bot)
+    stats_task = asyncio.create_task(stats_refresh_loop())
+    payment_task = asyncio.create_task(payment_expiry.run(bot))
+    try:
+        # сессию закрываем сами - после отправки отложенных уведомлений
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        for task in (stats_task, payment_task):
+            task.cancel()
+        await asyncio.gather(stats_task, payment_task, return_exceptions=True)
+        dropped = await notification_dispatcher.wait_pending(
+            SHUTDOWN_NOTIFICATIONS_TIMEOUT
+        )
+        if dropped:
+            print(f"Не отправлено уведомлений при остановке: {dropped}")
+        await bot.session.close()
 
 
 if __name__ == "__main__":
@@ -20,9 +20,9 @@ class AdminMiddleware(BaseMiddleware):
         data["admin_permissions"] = 0
         data["admin_name"] = "Администратор"
         if user_id and not event.from_user.is_bot:
-            admin_data = await AdminQueries.get_admin_by_telegram_id(user_id)
+            admin_data = await AdminQueries.get_admin_identity(user_id)
             data["is_admin"] = admin_data is not None
             if admin_data:
-                data["admin_permissions"] = admin_data.permissions
-                data["admin_name"] = admin_data.name
+                data["admin_permissions"] = admin_data["permissions"]
+                data["admin_name"] = admin_data["name"]
         return await handler(event, data)
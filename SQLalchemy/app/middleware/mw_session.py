@@ -0,0 +1,20 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from typing import Callable, Dict, Any, Awaitable
+from database import request_session_scope
+
+
+class DBSessionMiddleware(BaseMiddleware):
+    # Одна сессия на апдейт: все вызовы *Queries внутри хендлера (и
+    # AdminMiddleware) берут ее через use_session() вместо открытия своей,
+    # поэтому апдейт занимает одно соединение из пула. В хендлер сессия
+    # приходит аргументом session.
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with request_session_scope() as session:
+            data["session"] = session
+            return await handler(event, data)
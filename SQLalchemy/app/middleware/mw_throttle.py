@@ -0,0 +1,111 @@
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import Update
+from typing import Callable, Dict, Any, Awaitable, Optional
+from utils.cache import TTLCache
+from utils.rate_limit import TokenBucket
+
+# префикс callback_data -> (токенов в секунду, размер пачки). Берется самый
+# длинный подходящий префикс, остальные кнопки - по DEFAULT_CALLBACK_LIMIT.
+# Дорогие кнопки (запросы в базу + edit_text) ограничены сильнее.
+CALLBACK_LIMITS = {
+    "book_": (2, 5),
+    "genre_": (2, 5),
+    "orders_": (1, 3),
+    "add_to_cart_book_": (2, 4),
+}
+DEFAULT_CALLBACK_LIMIT = (4, 8)
+THROTTLED_TEXT = "⏳ Слишком часто, подождите секунду"
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    # Анти-флуд для нажатий inline-кнопок, стоит на dp.update раньше
+    # FSMContextMiddleware (см. setup_throttle), чтобы отброшенный callback не
+    # читал состояние из PostgresStorage и не занимал соединение из пула.
+    # - повтор того же callback_data, пока первый еще обрабатывается,
+    #   не запускает хендлер второй раз, а только гасит часики callback.answer()
+    # - на пользователя и префикс свой TokenBucket; без токена - короткий
+    #   answer без хендлера
+    def __init__(
+        self,
+        limits: Optional[Dict[str, tuple]] = None,
+        default_limit: tuple = DEFAULT_CALLBACK_LIMIT,
+    ):
+        self.limits = CALLBACK_LIMITS if limits is None else limits
+        # длинные префиксы первыми: "add_to_cart_book_" раньше "book_"
+        self._prefixes = sorted(self.limits, key=len, reverse=True)
+        self.default_limit = default_limit
+        self._buckets = TTLCache(ttl=600, maxsize=50_000)
+        self._in_flight: set = set()
+        self.passed = 0
+        self.throttled = 0
+        self.coalesced = 0
+
+    def _prefix(self, data: str) -> str:
+        for prefix in self._prefixes:
+            if data.startswith(prefix):
+                return prefix
+        return ""
+
+    def _bucket(self, user_id: int, prefix: str) -> TokenBucket:
+        key = (user_id, prefix)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate, capacity = self.limits.get(prefix, self.default_limit)
+            bucket = TokenBucket(rate, capacity)
+        # продлеваем жизнь активным пользователям
+        self._buckets.set(key, bucket)
+        return bucket
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = event.callback_query
+        if callback is None or callback.data is None:
+            return await handler(event, data)
+        key = (callback.from_user.id, callback.data)
+        if key in self._in_flight:
+            self.coalesced += 1
+            await self._answer(callback)
+            return None
+        if not self._bucket(key[0], self._prefix(callback.data)).try_acquire():
+            self.throttled += 1
+            await self._answer(callback, THROTTLED_TEXT)
+            return None
+        self.passed += 1
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+
+    @staticmethod
+    async def _answer(callback, text: Optional[str] = None):
+        try:
+            await callback.answer(text)
+        except Exception:
+            # запрос мог уже устареть - ответ тут не важен
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "passed": self.passed,
+            "throttled": self.throttled,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "buckets": len(self._buckets),
+        }
+
+
+def setup_throttle(
+    dp: Dispatcher, throttle: Optional[ThrottleMiddleware] = None
+) -> ThrottleMiddleware:
+    # Dispatcher сам ставит FSMContextMiddleware первым, а тот до любого
+    # middleware делает get_state(). Поэтому Dispatcher создается с
+    # disable_fsm=True, и dp.fsm регистрируется здесь, после анти-флуда.
+    throttle = throttle or ThrottleMiddleware()
+    dp.update.outer_middleware(throttle)
+    dp.update.outer_middleware(dp.fsm)
+    return throttle
@@ -3,6 +3,7 @@ from sqlalchemy import (
     String,
     ForeignKey,
     CheckConstraint,
+    Computed,
     text,
     Numeric,
     BigInteger,
@@ -10,14 +11,19 @@ from sqlalchemy import (
     Float,
     JSON,
     Index,
+    Sequence,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from database import Base
 from typing import List, Annotated, Optional
 from enum import Enum, IntFlag
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
+# старение очереди обращений: каждые 6 часов ожидания поднимают обращение на
+# один уровень приоритета, чтобы low не висели вечно за потоком critical
+APPEAL_AGING = timedelta(hours=6)
+
 intpk = Annotated[int, mapped_column(primary_key=True, autoincrement=True)]
 
 
@@ -89,6 +95,13 @@ class AppealStatus(str, Enum):
     CLOSED_BY_ADMIN = "closed_by_admin"
 
 
+class PaymentStatus(str, Enum):
+    PENDING = "pending"
+    PAID = "paid"
+    TIMEOUT = "timeout"
+    CANCELLED = "cancelled"
+
+
 class AdminPermission(IntFlag):
     NONE = 0
     MANAGE_SUPPORT = 1  # 00000001 - Управление поддержкой
@@ -108,6 +121,14 @@ class AdminPermission(IntFlag):
 
 class Author(Base):
     __tablename__ = "authors"
+    __table_args__ = (
+        Index(
+            "ix_authors_author_name_trgm",
+            "author_name",
+            postgresql_using="gin",
+            postgresql_ops={"author_name": "gin_trgm_ops"},
+        ),
+    )
     author_id: Mapped[intpk]
     author_name: Mapped[str] = mapped_column(String(90), index=True)
     author_country: Mapped[str] = mapped_column(String(80), index=True, nullable=True)
@@ -119,6 +140,21 @@ class Author(Base):
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        Index(
+            "ix_books_book_title_trgm",
+            "book_title",
+            postgresql_using="gin",
+            postgresql_ops={"book_title": "gin_trgm_ops"},
+        ),
+        # листинг жанра: WHERE book_genre = ... ORDER BY sale_value DESC, book_title
+        Index(
+            "ix_books_genre_listing",
+            "book_genre",
+            text("sale_value DESC"),
+            "book_title",
+        ),
+    )
     book_id: Mapped[intpk]
     book_title: Mapped[str] = mapped_column(
         index=True,
@@ -165,6 +201,16 @@ class Book(Base):
         index=True,
         nullable=True,
     )
+    # агрегаты по опубликованным отзывам, поддерживаются в ReviewQueries
+    rating_sum: Mapped[int] = mapped_column(Integer, server_default="0")
+    rating_count: Mapped[int] = mapped_column(Integer, server_default="0")
+    avg_rating: Mapped[Optional[float]] = mapped_column(
+        Float,
+        Computed(
+            "CASE WHEN rating_count > 0 THEN rating_sum::float / rating_count END",
+            persisted=True,
+        ),
+    )
     author: Mapped["Author"] = relationship(back_populates="author_books")
     reviews: Mapped[List["Review"]] = relationship(
         back_populates="reviewed_book", cascade="all, delete-orphan"
@@ -174,8 +220,9 @@ class Book(Base):
 class Cart(Base):
     __tablename__ = "carts"
     cart_id: Mapped[intpk]
+    # одна корзина на пользователя - нужно для UPSERT при регистрации
     telegram_id: Mapped[int] = mapped_column(
-        BigInteger, ForeignKey("users.telegram_id")
+        BigInteger, ForeignKey("users.telegram_id"), unique=True
     )
     user: Mapped["User"] = relationship(back_populates="cart")
     items: Mapped[List["CartItem"]] = relationship(back_populates="cart")
@@ -222,6 +269,9 @@ class User(Base):
 
 class Admin(Base):
     __tablename__ = "admins"
+    __table_args__ = (
+        Index("ix_admins_role_created_at", "role_name", "created_at", "admin_id"),
+    )
     admin_id: Mapped[intpk]
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True)
     name: Mapped[Optional[str]]
@@ -256,6 +306,16 @@ class Review(Base):
 
 class OrderData(Base):
     __tablename__ = "order_data"
+    __table_args__ = (
+        # keyset-пагинация по (created_date, order_id)
+        Index("ix_order_data_status_created", "status", "created_date", "order_id"),
+        Index(
+            "ix_order_data_telegram_id_created",
+            "telegram_id",
+            "created_date",
+            "order_id",
+        ),
+    )
     order_id: Mapped[intpk]
     address_id: Mapped[int] = mapped_column(ForeignKey("users_addresses.address_id"))
     telegram_id: Mapped[int] = mapped_column(
@@ -275,6 +335,32 @@ class OrderData(Base):
     )
     admin_id_who_canceled: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
     user: Mapped["User"] = relationship(back_populates="order_data")
+    items: Mapped[List["OrderItem"]] = relationship(
+        back_populates="order", cascade="all, delete-orphan"
+    )
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_order_id_position", "order_id", "position"),
+        Index("ix_order_items_book_id_order_id", "book_id", "order_id"),
+    )
+    order_item_id: Mapped[intpk]
+    order_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("order_data.order_id", ondelete="CASCADE")
+    )
+    # NULL - книга удалена: позиция заказа остается, цена сохранена в unit_price
+    book_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("books.book_id", ondelete="SET NULL"), nullable=True
+    )
+    quantity: Mapped[int] = mapped_column(Integer, CheckConstraint("quantity > 0"))
+    unit_price: Mapped[int] = mapped_column(
+        Integer, CheckConstraint("unit_price >= 0")
+    )  # цена за штуку на момент покупки
+    position: Mapped[int] = mapped_column(Integer, server_default="1")
+    order: Mapped["OrderData"] = relationship(back_populates="items")
+    book: Mapped["Book"] = relationship()
 
 
 class UserAddress(Base):
@@ -297,10 +383,24 @@ class UserAddress(Base):
     user: Mapped["User"] = relationship(back_populates="address")
 
 
+# Общий порядок сообщений обращения для user_messages и admin_messages.
+# created_date хранится с точностью до секунды, а id у таблиц свои, поэтому
+# keyset-курсор переписки (get_appeal_transcript) идет по этому номеру.
+support_message_seq = Sequence("support_message_seq", metadata=Base.metadata)
+support_message_seq_column = Annotated[
+    int,
+    mapped_column(
+        BigInteger, server_default=support_message_seq.next_value(), nullable=False
+    ),
+]
+
+
 class AdminMessage(Base):
     __tablename__ = "admin_messages"
-    __table_args__ = (Index("ix_admin_messages_appeal_id", "appeal_id"),)
+    # переписка обращения читается окнами по seq (get_appeal_transcript)
+    __table_args__ = (Index("ix_admin_messages_appeal_seq", "appeal_id", "seq"),)
     message_id: Mapped[intpk]
+    seq: Mapped[support_message_seq_column]
     admin_message: Mapped[str] = mapped_column(String(500))
     admin_id: Mapped[int] = mapped_column(Integer, ForeignKey("admins.admin_id"))
     appeal_id: Mapped[int] = mapped_column(
@@ -313,7 +413,13 @@ class AdminMessage(Base):
 
 class UserMessage(Base):
     __tablename__ = "user_messages"
+    __table_args__ = (
+        Index("ix_user_messages_appeal_seq", "appeal_id", "seq"),
+        # последнее сообщение пользователя для кулдауна (холодный путь)
+        Index("ix_user_messages_telegram_created", "telegram_id", "created_date"),
+    )
     message_id: Mapped[intpk]
+    seq: Mapped[support_message_seq_column]
     telegram_id: Mapped[int] = mapped_column(
         BigInteger, ForeignKey("users.telegram_id")
     )
@@ -328,6 +434,18 @@ class UserMessage(Base):
 
 class SupportAppeal(Base):
     __tablename__ = "support_appeals"
+    __table_args__ = (
+        Index(
+            "ix_support_appeals_admin_updated",
+            "assigned_admin_id",
+            "updated_at",
+            "appeal_id",
+        ),
+        # очередь новых обращений (AdminQueries.claim_next_appeal)
+        Index("ix_support_appeals_queue", "status", "queue_key"),
+        # кулдаун и список обращений пользователя
+        Index("ix_support_appeals_telegram_created", "telegram_id", "created_date"),
+    )
     appeal_id: Mapped[intpk]
     telegram_id: Mapped[int] = mapped_column(
         BigInteger, ForeignKey("users.telegram_id")
@@ -350,7 +468,52 @@ class SupportAppeal(Base):
     priority: Mapped[str] = mapped_column(
         String(10), server_default=PriorityStatus.NORMAL
     )
+    # Место в очереди: каждый уровень приоритета сдвигает обращение на
+    # APPEAL_AGING раньше. Порядок по queue_key ASC совпадает с порядком по
+    # "ранг + ожидание / APPEAL_AGING" DESC, но не зависит от now(), поэтому
+    # claim_next_appeal берет первую строку из индекса без сортировки.
+    # Строковый priority по алфавиту не сортируется ("normal" > "critical").
+    queue_key: Mapped[datetime] = mapped_column(
+        Computed(
+            "created_date - (CASE priority WHEN 'critical' THEN 3 "
+            "WHEN 'high' THEN 2 WHEN 'normal' THEN 1 ELSE 0 END) "
+            f"* INTERVAL '{int(APPEAL_AGING.total_seconds())} seconds'",
+            persisted=True,
+        ),
+    )
     admin_initiative: Mapped[bool] = mapped_column(
         Boolean, server_default=text("FALSE")
     )
     admin_visit: Mapped[bool] = mapped_column(Boolean, server_default=text("FALSE"))
+
+
+class FSMState(Base):
+    # состояние FSM aiogram, переживает перезапуск бота и общее для процессов
+    __tablename__ = "fsm_states"
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    data: Mapped[str] = mapped_column(String, server_default="{}")
+    # txid транзакции, записавшей строку - для условной записи в PostgresStorage
+    version: Mapped[int] = mapped_column(BigInteger, server_default="0")
+    updated_at: Mapped[updated_at]
+
+
+class PendingPayment(Base):
+    # инвойсы Telegram Payments: payload инвойса = payment_id, переживают
+    # перезапуск, поэтому без внешних ключей на пересоздаваемые таблицы
+    __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_status_expires_at", "status", "expires_at"),
+    )
+    payment_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    telegram_id: Mapped[int] = mapped_column(BigInteger)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    address_id: Mapped[int] = mapped_column(Integer)
+    amount: Mapped[int] = mapped_column(Integer)  # в копейках, как в инвойсе
+    invoice_message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    status: Mapped[PaymentStatus] = mapped_column(
+        String(20), default=PaymentStatus.PENDING
+    )
+    created_at: Mapped[created_at]
+    updated_at: Mapped[updated_at]
+    expires_at: Mapped[datetime]
@@ -0,0 +1,165 @@
+# notifications_check.py
+# Проверка NotificationDispatcher на подставном боте: FakeBot записывает время
+# каждого send_message и по заданию отвечает как Telegram на флуд - исключением
+# с retry_after (TelegramRetryAfter, 429). Проверяется:
+# - в один чат не чаще per_chat_rate, на всех - не чаще global_rate
+# - 429 повторяется после retry_after, но не больше max_retries раз
+# - прочие ошибки не повторяются
+# - wait_pending дожидается задач из spawn и отменяет не успевшие за timeout
+#
+#   python notifications_check.py
+#
+# База, бот и aiogram не нужны.
+
+import argparse
+import asyncio
+import sys
+import time
+from utils.notifications import NotificationDispatcher
+
+# допуск на неточность asyncio.sleep
+SLACK = 0.02
+
+
+class RetryAfter(Exception):
+    # как aiogram.exceptions.TelegramRetryAfter: диспетчер смотрит только retry_after
+    def __init__(self, retry_after: float):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class FakeBot:
+    def __init__(self, flood: dict = None, broken: set = None, retry_after: float = 0.1):
+        self.flood = dict(flood or {})  # chat_id -> сколько раз ответить 429
+        self.broken = broken or set()  # chat_id, куда отправка всегда падает
+        self.retry_after = retry_after
+        self.calls = []  # (chat_id, время вызова)
+        self.delivered = []  # (chat_id, время доставки)
+
+    async def send_message(self, chat_id: int, **kwargs):
+        now = time.monotonic()
+        self.calls.append((chat_id, now))
+        if chat_id in self.broken:
+            raise RuntimeError("Bad Request: chat not found")
+        if self.flood.get(chat_id, 0) > 0:
+            self.flood[chat_id] -= 1
+            raise RetryAfter(self.retry_after)
+        self.delivered.append((chat_id, now))
+        return True
+
+
+def times(records: list, chat_id: int) -> list:
+    return [at for chat, at in records if chat == chat_id]
+
+
+async def check_per_chat_rate(rate: float) -> list:
+    dispatcher = NotificationDispatcher(global_rate=1000, per_chat_rate=rate)
+    bot = FakeBot()
+    await asyncio.gather(*(dispatcher.send_message(bot, 1, text="x") for _ in range(5)))
+    sent = times(bot.delivered, 1)
+    gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+    if len(sent) != 5:
+        return [f"в чат доставлено {len(sent)} из 5"]
+    if min(gaps) < 1 / rate - SLACK:
+        return [f"в один чат чаще {rate}/с: интервал {min(gaps):.3f}с"]
+    return []
+
+
+async def check_global_rate(rate: float, chats: int) -> list:
+    dispatcher = NotificationDispatcher(global_rate=rate, per_chat_rate=1000)
+    bot = FakeBot()
+    started = time.monotonic()
+    delivered = await dispatcher.broadcast(bot, [*range(chats), 0, 1])
+    elapsed = time.monotonic() - started
+    errors = []
+    if delivered != chats:
+        errors.append(f"broadcast доставил {delivered} из {chats} (повторы чатов не шлются)")
+    # ведро начинается полным: capacity сразу, дальше rate в секунду
+    if chats > rate + rate * (elapsed + SLACK):
+        errors.append(f"{chats} сообщений за {elapsed:.2f}с при лимите {rate}/с")
+    return errors
+
+
+async def check_retry_after(max_retries: int, retry_after: float) -> list:
+    dispatcher = NotificationDispatcher(
+        global_rate=1000, per_chat_rate=1000, max_retries=max_retries
+    )
+    bot = FakeBot(flood={1: max_retries, 2: max_retries + 1}, retry_after=retry_after)
+    ok, exhausted = await asyncio.gather(
+        dispatcher.send_message(bot, 1, text="x"),
+        dispatcher.send_message(bot, 2, text="x"),
+    )
+    errors = []
+    if not ok or not times(bot.delivered, 1):
+        errors.append("после 429 сообщение не доставлено")
+    else:
+        calls = times(bot.calls, 1)
+        if calls[-1] - calls[0] < max_retries * retry_after - SLACK:
+            errors.append("повтор после 429 раньше retry_after")
+    if exhausted or len(times(bot.calls, 2)) != max_retries + 1:
+        errors.append(
+            f"при постоянном 429 {len(times(bot.calls, 2))} попыток, ждали {max_retries + 1}"
+        )
+    stats = dispatcher.stats()
+    if (stats["sent"], stats["failed"], stats["retried"]) != (1, 1, 2 * max_retries):
+        errors.append(f"неверная статистика после 429: {stats}")
+    return errors
+
+
+async def check_other_errors() -> list:
+    dispatcher = NotificationDispatcher(global_rate=1000, per_chat_rate=1000)
+    bot = FakeBot(broken={7})
+    delivered = await dispatcher.broadcast(bot, [7, 8])
+    errors = []
+    if delivered != 1 or len(times(bot.calls, 7)) != 1:
+        errors.append("ошибка, отличная от 429, повторяется или ломает рассылку")
+    if dispatcher.stats()["retried"]:
+        errors.append("retried растет без 429")
+    return errors
+
+
+async def check_wait_pending() -> list:
+    dispatcher = NotificationDispatcher(global_rate=1000, per_chat_rate=1000)
+    bot = FakeBot(flood={2: 1}, retry_after=10)
+    dispatcher.spawn(dispatcher.send_message(bot, 1, text="x"))
+    dispatcher.spawn(dispatcher.send_message(bot, 2, text="x"))
+    dropped = await dispatcher.wait_pending(timeout=0.2)
+    errors = []
+    if times(bot.delivered, 1) == [] or dropped != 1:
+        errors.append(f"wait_pending: отменено {dropped}, ждали 1")
+    if dispatcher.stats()["pending_tasks"]:
+        errors.append("после wait_pending остались задачи")
+    return errors
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Проверка NotificationDispatcher")
+    parser.add_argument("--chat-rate", type=float, default=20)
+    parser.add_argument("--global-rate", type=float, default=50)
+    parser.add_argument("--chats", type=int, default=150)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    checks = {
+        "лимит на чат": check_per_chat_rate(args.chat_rate),
+        "общий лимит": check_global_rate(args.global_rate, args.chats),
+        "429 retry_after": check_retry_after(args.max_retries, args.retry_after),
+        "прочие ошибки": check_other_errors(),
+        "wait_pending": check_wait_pending(),
+    }
+    errors = []
+    for title, check in checks.items():
+        errors += [f"{title}: {error}" for error in await check]
+    for error in errors:
+        print(f"❌ {error}")
+    if not errors:
+        print(f"✅ {len(checks)} проверок NotificationDispatcher пройдены")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
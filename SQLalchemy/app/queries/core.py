@@ -1,3 +1,4 @@
+import asyncio
 from database import Base, async_engine
 from sqlalchemy import insert, select, update, text
 from sqlalchemy.exc import SQLAlchemyError
@@ -27,10 +28,221 @@ async def update_username(user_id: int, new_user_name: str):
         await conn.commit()
 
 
+# Статистика для дашбордов читается из материализованных представлений с
+# дневными агрегатами: чтение стоит O(дней), а не O(всех заказов). Представления
+# пересчитываются фоновой задачей раз в STATS_REFRESH_INTERVAL секунд.
+STATS_REFRESH_INTERVAL = 300
+STATS_STALE_AFTER = STATS_REFRESH_INTERVAL * 2
+
+STATS_VIEWS = {
+    "stats_orders_daily": (
+        """
+        SELECT
+            DATE(created_date) AS day,
+            status,
+            COUNT(*) AS orders_count,
+            COALESCE(SUM(price), 0) AS revenue
+        FROM order_data
+        GROUP BY DATE(created_date), status
+        """,
+        "day, status",
+    ),
+    "stats_appeals_daily": (
+        """
+        SELECT
+            DATE(created_date) AS day,
+            status,
+            priority,
+            COALESCE(assigned_admin_id, 0) AS admin_id,
+            COUNT(*) AS appeals_count,
+            COUNT(*) FILTER (
+                WHERE updated_at < NOW() - INTERVAL '24 hours'
+            ) AS overdue_count
+        FROM support_appeals
+        GROUP BY DATE(created_date), status, priority, COALESCE(assigned_admin_id, 0)
+        """,
+        "day, status, priority, admin_id",
+    ),
+    "stats_admin_messages_daily": (
+        """
+        SELECT
+            DATE(created_date) AS day,
+            admin_id,
+            COUNT(*) AS messages_count
+        FROM admin_messages
+        GROUP BY DATE(created_date), admin_id
+        """,
+        "day, admin_id",
+    ),
+    # однострочный срез по небольшим справочникам + время последнего пересчета
+    "stats_totals": (
+        """
+        SELECT
+            1 AS snapshot_id,
+            (SELECT COUNT(*) FROM users) AS total_users,
+            (SELECT COUNT(*) FROM admins) AS total_admins,
+            (SELECT COUNT(*) FROM books) AS total_books,
+            (SELECT COUNT(*) FROM books WHERE book_status = 'out of stock') AS out_of_stock_books,
+            (SELECT jsonb_object_agg(book_genre, genre_count) FROM (
+                SELECT book_genre, COUNT(*) AS genre_count
+                FROM books
+                WHERE book_genre IS NOT NULL
+                GROUP BY book_genre
+            ) genre_counts) AS books_by_genre,
+            (SELECT jsonb_object_agg(role_name, role_count) FROM (
+                SELECT role_name, COUNT(*) AS role_count
+                FROM admins
+                GROUP BY role_name
+            ) role_counts) AS admins_by_role,
+            NOW() AS refreshed_at
+        """,
+        "snapshot_id",
+    ),
+}
+
+
+PERSISTENT_TABLES = {"fsm_states", "payments"}
+
+
+async def drop_stats_views(conn):
+    for view in STATS_VIEWS:
+        await conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {view} CASCADE"))
+
+
+async def create_stats_views(conn):
+    for view, (query, unique_columns) in STATS_VIEWS.items():
+        await conn.execute(
+            text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS {query}")
+        )
+        # уникальный индекс обязателен для REFRESH ... CONCURRENTLY
+        await conn.execute(
+            text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{view} ON {view} ({unique_columns})"
+            )
+        )
+
+
+async def refresh_stats_views():
+    # CONCURRENTLY не блокирует чтение дашбордов во время пересчета
+    async with async_engine.begin() as conn:
+        for view in STATS_VIEWS:
+            await conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+
+
+async def stats_refresh_loop(interval: int = STATS_REFRESH_INTERVAL):
+    while True:
+        try:
+            await refresh_stats_views()
+        except Exception as e:
+            print(f"Ошибка обновления статистики: {e}")
+        await asyncio.sleep(interval)
+
+
 async def create_tables():
     async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+        # представления зависят от таблиц - удаляем их до drop_all
+        await drop_stats_views(conn)
+        # FSM пользователей и незавершенные платежи переживают перезапуск
+        await conn.run_sync(
+            lambda sync_conn: Base.metadata.drop_all(
+                sync_conn,
+                tables=[
+                    table
+                    for table in Base.metadata.sorted_tables
+                    if table.name not in PERSISTENT_TABLES
+                ],
+            )
+        )
+        # pg_trgm нужен для GIN-индексов поиска по названию книги и автору
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        # fsm_states не пересоздается - колонку версии добавляем к старой таблице
+        await conn.execute(
+            text(
+                "ALTER TABLE fsm_states "
+                "ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0"
+            )
+        )
+        await create_stats_views(conn)
+
+
+async def backfill_order_items(batch_size: int = 1000) -> int:
+    # Разовый перенос старых заказов из JSON-колонок order_data.book_id/quantity
+    # в order_items пачками по batch_size, каждая пачка - отдельная транзакция
+    # (python seeding.py --backfill-order-items). Берутся только заказы без
+    # строк в order_items, так что повторный запуск продолжает с места обрыва.
+    # Позиции, чьей книги уже нет в books, переносятся с book_id NULL и ценой 0 -
+    # иначе заказ навсегда остался бы неполным: NOT EXISTS ниже не дает
+    # перенести его второй раз.
+    select_batch = text("""
+        SELECT o.order_id FROM order_data o
+        WHERE o.order_id > :last_id
+            AND NOT EXISTS (
+                SELECT 1 FROM order_items oi WHERE oi.order_id = o.order_id
+            )
+        ORDER BY o.order_id
+        LIMIT :batch_size
+    """)
+    insert_batch = text("""
+        INSERT INTO order_items (order_id, book_id, quantity, unit_price, position)
+        SELECT
+            o.order_id,
+            b.book_id,
+            COALESCE(items.quantity::int, 1),
+            COALESCE(b.book_price, 0),
+            items.idx
+        FROM order_data o
+        CROSS JOIN LATERAL ROWS FROM (
+            json_array_elements_text(o.book_id),
+            json_array_elements_text(o.quantity)
+        ) WITH ORDINALITY AS items(book_id, quantity, idx)
+        LEFT JOIN books b ON b.book_id = items.book_id::int
+        WHERE o.order_id > :last_id AND o.order_id <= :max_id
+            AND items.book_id IS NOT NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM order_items oi WHERE oi.order_id = o.order_id
+            )
+    """)
+    last_id = 0
+    inserted = 0
+    while True:
+        async with async_engine.begin() as conn:
+            result = await conn.execute(
+                select_batch, {"last_id": last_id, "batch_size": batch_size}
+            )
+            order_ids = result.scalars().all()
+            if not order_ids:
+                break
+            result = await conn.execute(
+                insert_batch, {"last_id": last_id, "max_id": order_ids[-1]}
+            )
+            inserted += result.rowcount
+        last_id = order_ids[-1]
+    return inserted
+
+
+async def rebuild_book_ratings() -> int:
+    # разовый пересчет books.rating_sum/rating_count по опубликованным отзывам -
+    # после массовой загрузки отзывов в обход ReviewQueries
+    async with async_engine.begin() as conn:
+        result = await conn.execute(
+            text("""
+                UPDATE books b
+                SET rating_sum = COALESCE(r.rating_sum, 0),
+                    rating_count = COALESCE(r.rating_count, 0)
+                FROM books b2
+                LEFT JOIN (
+                    SELECT book_id, SUM(review_rating) AS rating_sum, COUNT(*) AS rating_count
+                    FROM reviews
+                    WHERE published AND review_rating > 0
+                    GROUP BY book_id
+                ) r ON r.book_id = b2.book_id
+                WHERE b.book_id = b2.book_id
+                    AND (b.rating_sum, b.rating_count)
+                        IS DISTINCT FROM (COALESCE(r.rating_sum, 0), COALESCE(r.rating_count, 0))
+            """)
+        )
+        return result.rowcount
 
 
 async def insert_data_author(author_data):
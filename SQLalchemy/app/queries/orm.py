@@ -1,4 +1,4 @@
-from database import AsyncSessionLocal
+from database import AsyncSessionLocal, use_session
 from models import (
     Author,
     Book,
@@ -12,6 +12,7 @@ from models import (
     CartItem,
     UserAddress,
     OrderData,
+    OrderItem,
     AdminMessage,
     UserMessage,
     SupportAppeal,
@@ -19,18 +20,43 @@ from models import (
     AdminPermission,
     PriorityStatus,
     AdminRole,
+    PendingPayment,
+    PaymentStatus,
 )
 from faker import Faker
 import random
 from datetime import datetime, timedelta
-from sqlalchemy import case, select, text, func, and_, update, or_
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy import (
+    case,
+    select,
+    text,
+    func,
+    and_,
+    update,
+    or_,
+    delete,
+    exists,
+    insert,
+    literal,
+    union,
+    values,
+    column,
+    Integer,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, List, Tuple
 import math
+from decimal import Decimal
 from typing import Optional
 from authors import REAL_AUTHORS
 from books import REAL_BOOKS
 from review_generator_simple import generate_reviews
+from queries.core import STATS_STALE_AFTER
+from utils.cache import TTLCache
+from utils.pagination import NEXT, PREV, decode_cursor, encode_cursor, fetch_page
+from utils.throttle import SlidingWindow
 
 fake = Faker("ru_RU")
 
@@ -51,11 +77,29 @@ admin_role_dict = {
     "new": AdminRole.NEW,
 }
 
+# telegram_id -> {"total_price": ..., "items": [...]}, обновляется при add/del корзины
+cart_cache = TTLCache(ttl=120, maxsize=10_000)
+# telegram_id -> {"admin_id", "permissions", "name", "role_name"} или None (не админ)
+admin_cache = TTLCache(ttl=300, maxsize=10_000)
+_NOT_CACHED = object()
+# счетчики для заголовков списков - приблизительные, живут 30 секунд
+count_cache = TTLCache(ttl=30, maxsize=10_000)
+# book_id -> карточка книги для book_details (поля, автор, обложка, рейтинг),
+# сбрасывается при правках книги, скидок, обложки и отзывов
+book_card_cache = TTLCache(ttl=600, maxsize=5_000)
+# сколько последних сообщений обращения показывать за раз
+TRANSCRIPT_WINDOW = 50
+# название позиции заказа, книги которой уже нет в books
+DELETED_BOOK_TITLE = "Книга удалена"
+# кулдауны поддержки: одно обращение в час, одно сообщение в 2 минуты
+appeal_throttle = SlidingWindow(limit=1, window=timedelta(hours=1))
+message_throttle = SlidingWindow(limit=1, window=timedelta(minutes=2))
+
 
 class AuthorQueries:
     @staticmethod
     async def add_author():
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             author = Author(author_name="Rick Ruben", author_country="USA")
             author_se = Author(author_name="Dante Alighieri", author_country="Italy")
             book = Book(
@@ -72,7 +116,7 @@ class AuthorQueries:
 
     @staticmethod
     async def get_author(id=None):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             if id:
                 author = await session.get(Author, {"author_id": id})
                 print(f"Имя - {author.author_name}, Страна - {author.author_country}")
@@ -87,7 +131,7 @@ class AuthorQueries:
 
     @staticmethod
     async def get_author_with_books(author_id: int) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = text("""
                 SELECT 
                     a.author_id, a.author_name, a.author_country,
@@ -118,7 +162,7 @@ class AuthorQueries:
 
     @staticmethod
     async def made_author_get_id(author_name: str) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             author = Author(
                 author_name=author_name,
             )
@@ -130,7 +174,7 @@ class AuthorQueries:
 
     @staticmethod
     async def get_author_data(author_id: int) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Author)
                 .options(selectinload(Author.author_books))
@@ -147,7 +191,7 @@ class AuthorQueries:
 
     @staticmethod
     async def add_data_to_column(author_id: int, value: str, column: str):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             await session.execute(
                 update(Author)
                 .where(Author.author_id == author_id)
@@ -155,10 +199,12 @@ class AuthorQueries:
             )
             await session.flush()
             await session.commit()
+            # имя/страна автора есть в карточках всех его книг
+            BookQueries._invalidate_book_cards()
 
     @staticmethod
     async def check_author_completion(author_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     Author.author_name,
@@ -174,17 +220,18 @@ class AuthorQueries:
 
     @staticmethod
     async def delete_author(author_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             author = await session.scalar(
                 select(Author).where(Author.author_id == author_id)
             )
             await session.delete(author)
             await session.commit()
+            BookQueries._invalidate_book_cards()
             return True
 
     @staticmethod
     async def get_book_author_id(book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Book.author_id).where(Book.book_id == book_id)
             )
@@ -193,7 +240,7 @@ class AuthorQueries:
 
     @staticmethod
     async def assigned_new_author_to_book(new_author_id: int, book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             await session.execute(
                 update(Book)
                 .where(Book.book_id == book_id)
@@ -201,12 +248,13 @@ class AuthorQueries:
             )
             await session.flush()
             await session.commit()
+            BookQueries._invalidate_book_cards([book_id])
 
 
 class BookQueries:
     @staticmethod
     async def get_book(book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book = await session.get(Book, book_id)
             print(
                 f"Название - {book.book_title}, Год - {book.book_year}, Цена - {book.book_price}\n"
@@ -244,19 +292,16 @@ class BookQueries:
 
     @staticmethod
     async def get_book_by_genre(genre: str):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = (
                 select(
                     Book.book_id,
                     Book.book_title,
                     Book.book_on_sale,
                     Book.sale_value,
-                    func.avg(Review.review_rating).label("book_rating"),
+                    Book.avg_rating.label("book_rating"),
                 )
-                .select_from(Book)
-                .outerjoin(Review)
                 .where(and_(Book.book_genre == genre, Book.book_in_stock))
-                .group_by(Book.book_id, Book.book_title)
                 .order_by(Book.sale_value.desc(), Book.book_title)
             )
             result = await session.execute(query)
@@ -264,7 +309,7 @@ class BookQueries:
 
     @staticmethod
     async def get_book_info(book_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book_id_int = int(book_id)
             query = (
                 select(
@@ -278,21 +323,12 @@ class BookQueries:
                     Book.sale_value,
                     Author.author_name,
                     Author.author_country,
-                    func.avg(Review.review_rating).label("book_rating"),
-                    func.count(Review.review_id).label("reviews_count"),
+                    Book.avg_rating.label("book_rating"),
+                    Book.rating_count.label("reviews_count"),
                 )
                 .select_from(Book)
                 .join(Author, Book.author_id == Author.author_id, isouter=True)
-                .join(
-                    Review,
-                    and_(Review.book_id == Book.book_id, Review.published),
-                    isouter=True,
-                )
                 .where(Book.book_id == book_id_int)
-                .group_by(
-                    Book.book_id,
-                    Author.author_id,
-                )
             )
             result = await session.execute(query)
             book_data = result.mappings().first()
@@ -303,27 +339,71 @@ class BookQueries:
 
             return book_data
 
+    @staticmethod
+    async def get_book_card(
+        book_id, session: Optional[AsyncSession] = None
+    ) -> Optional[dict]:
+        # все для экрана book_details одним запросом: поля книги, автор,
+        # обложка и рейтинг (денормализован в books)
+        book_id = int(book_id)
+        book_card = book_card_cache.get(book_id, _NOT_CACHED)
+        if book_card is not _NOT_CACHED:
+            return book_card
+        async with use_session(session) as session:
+            query = (
+                select(
+                    Book.book_id,
+                    Book.book_title,
+                    Book.book_year,
+                    Book.book_quantity,
+                    Book.book_price,
+                    Book.book_genre,
+                    Book.book_on_sale,
+                    Book.sale_value,
+                    Book.book_photo_id,
+                    Author.author_name,
+                    Author.author_country,
+                    func.coalesce(Book.avg_rating, 0.0).label("book_rating"),
+                    Book.rating_count.label("reviews_count"),
+                )
+                .select_from(Book)
+                .join(Author, Book.author_id == Author.author_id, isouter=True)
+                .where(Book.book_id == book_id)
+            )
+            result = await session.execute(query)
+            row = result.mappings().first()
+        book_card = dict(row) if row else None
+        book_card_cache.set(book_id, book_card)
+        return book_card
+
+    @staticmethod
+    def _invalidate_book_cards(book_ids=None):
+        # без аргументов - сбросить все карточки (например, после правки автора)
+        if book_ids is None:
+            book_card_cache.clear()
+            return
+        for book_id in book_ids:
+            book_card_cache.invalidate(int(book_id))
+
+    @staticmethod
+    def book_card_cache_stats() -> dict:
+        return book_card_cache.stats()
+
     @staticmethod
     async def get_book_reviews(book_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book_id_int = int(book_id)
             book_query = (
                 select(
                     Book.book_id,
                     Book.book_title,
                     Author.author_name,
-                    func.avg(Review.review_rating).label("avg_rating"),
-                    func.count(Review.review_id).label("reviews_count"),
+                    Book.avg_rating,
+                    Book.rating_count.label("reviews_count"),
                 )
                 .select_from(Book)
                 .join(Author, Book.author_id == Author.author_id, isouter=True)
-                .join(
-                    Review,
-                    and_(Review.book_id == Book.book_id, Review.published),
-                    isouter=True,
-                )  # OUTER JOIN
                 .where(Book.book_id == book_id_int)
-                .group_by(Book.book_id, Book.book_title, Author.author_name)
             )
             book_result = await session.execute(book_query)
             book_info = book_result.mappings().first()
@@ -347,7 +427,7 @@ class BookQueries:
 
     @staticmethod
     async def full_book_review(review_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = select(
                 Review.review_rating,
                 Review.review_title,
@@ -359,28 +439,43 @@ class BookQueries:
             reviews = reviews_result.mappings().first()
             return reviews
 
+    @staticmethod
+    async def _adjust_stock(session, deltas) -> list[int]:
+        # Изменение остатков одним UPDATE ... FROM (VALUES ...) на любое число
+        # книг: deltas - пары (book_id, изменение), отрицательное - списание.
+        # book_in_stock пересчитывается в том же запросе.
+        totals = {}
+        for book_id, delta in deltas:
+            if book_id is not None and delta:
+                totals[book_id] = totals.get(book_id, 0) + int(delta)
+        if not totals:
+            return []
+        stock = values(
+            column("book_id", Integer),
+            column("delta", Integer),
+            name="stock",
+        ).data(sorted(totals.items()))
+        new_quantity = func.coalesce(Book.book_quantity, 0) + stock.c.delta
+        await session.execute(
+            update(Book)
+            .where(Book.book_id == stock.c.book_id)
+            .values(book_quantity=new_quantity, book_in_stock=new_quantity > 0)
+        )
+        return list(totals)
+
     @staticmethod
     async def decrease_book_value(book_data):
-        async with AsyncSessionLocal() as session:
-            for book in book_data:
-                book_id = book.get("book_id")
-                quantity_to_decrease = book.get("quantity")
-                await session.execute(
-                    update(Book)
-                    .where(Book.book_id == book_id)
-                    .values(
-                        book_quantity=Book.book_quantity - quantity_to_decrease,
-                        book_in_stock=case(
-                            (Book.book_quantity - quantity_to_decrease > 0, True),
-                            else_=False,
-                        ),
-                    )
-                )
+        async with use_session() as session:
+            book_ids = await BookQueries._adjust_stock(
+                session,
+                ((book.get("book_id"), -book.get("quantity", 0)) for book in book_data),
+            )
             await session.commit()
+            BookQueries._invalidate_book_cards(book_ids)
 
     @staticmethod
     async def check_book_availability(book_id: int, telegram_id: int) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book_result = await session.execute(
                 select(Book.book_quantity, Book.book_title, Book.book_in_stock).where(
                     Book.book_id == book_id
@@ -415,7 +510,7 @@ class BookQueries:
 
     @staticmethod
     async def more_than_zero_books(book_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Book.book_quantity).where(Book.book_id == book_id)
             )
@@ -424,7 +519,7 @@ class BookQueries:
 
     @staticmethod
     async def check_book_done(book_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(select(Book).where(Book.book_id == book_id))
             book = result.scalar_one_or_none()
             if not book:
@@ -441,7 +536,7 @@ class BookQueries:
 
     @staticmethod
     async def check_books_availability(book_data) -> tuple[bool, list]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book_ids = [book["book_id"] for book in book_data]
             result = await session.execute(
                 select(Book.book_id, Book.book_quantity, Book.book_title).where(
@@ -471,24 +566,14 @@ class BookQueries:
 
     @staticmethod
     async def add_books_back_when_canceled_order(books: list):
-        async with AsyncSessionLocal() as session:
-            for book_id, quantity in books:
-                result = await session.execute(
-                    select(Book.book_quantity).where(Book.book_id == book_id)
-                )
-                current_quantity = result.scalar_one_or_none()
-                if current_quantity is not None:
-                    await session.execute(
-                        update(Book)
-                        .where(Book.book_id == book_id)
-                        .values(book_quantity=Book.book_quantity + quantity)
-                    )
-                await session.flush()
+        async with use_session() as session:
+            book_ids = await BookQueries._adjust_stock(session, books)
             await session.commit()
+            BookQueries._invalidate_book_cards(book_ids)
 
     @staticmethod
     async def has_cover(book_id: int) -> str:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Book.book_photo_id).where(Book.book_id == book_id)
             )
@@ -496,7 +581,7 @@ class BookQueries:
 
     @staticmethod
     async def get_books_for_admin() -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
                 total_books_result = await session.execute(
                     select(func.count(Book.book_id))
@@ -555,12 +640,13 @@ class BookQueries:
                     ],
                 }
             except Exception as e:
+                await session.rollback()
                 print(f"Error in get_books_for_admin: {e}")
                 return {}
 
     @staticmethod
     async def made_book_with_admin_id_get_book_id(author_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book = Book(author_id=author_id)
             session.add(book)
             await session.commit()
@@ -569,7 +655,7 @@ class BookQueries:
 
     @staticmethod
     async def get_book_info_for_new(book_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = (
                 select(
                     Book.book_id,
@@ -591,7 +677,7 @@ class BookQueries:
 
     @staticmethod
     async def get_book_sale_info(book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = select(
                 Book.book_id,
                 Book.book_title,
@@ -604,14 +690,14 @@ class BookQueries:
 
     @staticmethod
     async def get_book_price(book_id: int) -> Optional[int]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = select(Book.book_price).where(Book.book_id == book_id)
             result = await session.execute(query)
             return result.scalar_one_or_none()
 
     @staticmethod
     async def remove_book_sale(book_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
                 stmt = select(Book).where(Book.book_id == book_id)
                 result = await session.execute(stmt)
@@ -622,6 +708,7 @@ class BookQueries:
                 book.sale_value = None
                 book.updated_at = datetime.now()
                 await session.commit()
+                BookQueries._invalidate_book_cards([book_id])
                 return True
             except Exception as e:
                 await session.rollback()
@@ -630,7 +717,7 @@ class BookQueries:
 
     @staticmethod
     async def update_book_sale(book_id: int, sale_percent: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
                 sale_value = sale_percent / 100
                 stmt = select(Book).where(Book.book_id == book_id)
@@ -642,6 +729,7 @@ class BookQueries:
                 book.sale_value = sale_value
                 book.updated_at = datetime.now()
                 await session.commit()
+                BookQueries._invalidate_book_cards([book_id])
                 return True
             except Exception as e:
                 await session.rollback()
@@ -650,38 +738,85 @@ class BookQueries:
 
     @staticmethod
     async def has_sale(book_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = await session.execute(
                 select(Book.book_on_sale).where(Book.book_id == book_id)
             )
             return query.scalar_one_or_none()
 
+    @staticmethod
+    def _book_search_stmt(search_query: str, only_available: bool = False):
+        # pg_trgm: ILIKE '%q%' и word_similarity (<%) обслуживаются GIN-индексами
+        # по book_title и author_name, <% дает терпимость к опечаткам
+        search_query = search_query.strip()
+        escaped = (
+            search_query.replace("\\", "\\\\")
+            .replace("%", "\\%")
+            .replace("_", "\\_")
+        )
+        pattern = f"%{escaped}%"
+        query_literal = literal(search_query)
+        matched_books = union(
+            select(Book.book_id).where(
+                or_(
+                    Book.book_title.ilike(pattern, escape="\\"),
+                    query_literal.op("<%", is_comparison=True)(Book.book_title),
+                )
+            ),
+            select(Book.book_id)
+            .join(Author, Book.author_id == Author.author_id)
+            .where(
+                or_(
+                    Author.author_name.ilike(pattern, escape="\\"),
+                    query_literal.op("<%", is_comparison=True)(Author.author_name),
+                )
+            ),
+        ).subquery()
+        rank = func.greatest(
+            func.word_similarity(search_query, Book.book_title),
+            func.word_similarity(search_query, Author.author_name),
+        ).label("rank")
+        stmt = (
+            select(
+                Book.book_id,
+                Book.book_title,
+                Author.author_name,
+                Book.book_price,
+                Book.book_quantity,
+                Book.book_in_stock,
+                rank,
+            )
+            .select_from(Book)
+            .join(matched_books, matched_books.c.book_id == Book.book_id)
+            .join(Author, Book.author_id == Author.author_id, isouter=True)
+        )
+        if only_available:
+            stmt = stmt.where(
+                and_(
+                    Book.book_in_stock == True,
+                    Book.book_status == BookStatus.IN_STOCK,
+                )
+            )
+        return stmt.order_by(rank.desc(), Book.book_title)
+
     @staticmethod
     async def search_books_by_title_for_admin(
         title_query: str, limit: int = 20
     ) -> List[Dict]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
-                stmt = (
-                    select(Book.book_id, Book.book_title, Author.author_name)
-                    .join(Author, Book.author_id == Author.author_id)
-                    .where(Book.book_title.ilike(f"%{title_query}%"))
-                    .order_by(Book.book_title)
-                    .limit(limit)
-                )
-                result = await session.execute(stmt)
-                rows = result.fetchall()
-                books_list = []
-                for row in rows:
-                    books_list.append(
-                        {
-                            "book_id": row.book_id,
-                            "book_title": row.book_title,
-                            "author_name": row.author_name,
-                        }
-                    )
-                return books_list
+                stmt = BookQueries._book_search_stmt(title_query)
+                result = await session.execute(stmt.limit(limit))
+                return [
+                    {
+                        "book_id": row.book_id,
+                        "book_title": row.book_title,
+                        "author_name": row.author_name,
+                    }
+                    for row in result.all()
+                ]
             except Exception as e:
+                await session.rollback()
                 print(f"Error in search_books_by_title_for_admin: {e}")
                 return []
 
@@ -689,72 +824,51 @@ class BookQueries:
     async def search_books_by_title_with_pagination(
         title_query: str, offset: int = 0, limit: int = 10
     ) -> Tuple[List[Dict], int]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
-                stmt = (
-                    select(Book)
-                    .options(selectinload(Book.author))
-                    .where(Book.book_title.ilike(f"%{title_query}%"))
-                    .order_by(Book.book_title)
-                    .offset(offset)
-                    .limit(limit)
-                )
-                result = await session.execute(stmt)
-                books = result.scalars().all()
-                books_list = []
-                for book in books:
-                    books_list.append(
-                        {
-                            "book_id": book.book_id,
-                            "book_title": book.book_title,
-                            "author_name": book.author.author_name
-                            if book.author
-                            else None,
-                        }
-                    )
-                count_stmt = select(func.count(Book.book_id)).where(
-                    Book.book_title.ilike(f"%{title_query}%")
+                stmt = BookQueries._book_search_stmt(title_query)
+                result = await session.execute(stmt.offset(offset).limit(limit))
+                books_list = [
+                    {
+                        "book_id": row.book_id,
+                        "book_title": row.book_title,
+                        "author_name": row.author_name,
+                    }
+                    for row in result.all()
+                ]
+                total_count = await session.scalar(
+                    select(func.count()).select_from(stmt.order_by(None).subquery())
                 )
-                total_count = await session.scalar(count_stmt)
                 return books_list, total_count
             except Exception as e:
+                await session.rollback()
                 print(f"Error in search_books_by_title_with_pagination: {e}")
                 return [], 0
 
     @staticmethod
     async def search_books_by_title(title_query: str, limit: int = 20) -> List[Dict]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
-                stmt = (
-                    select(Book)
-                    .options(selectinload(Book.author))
-                    .where(Book.book_title.ilike(f"%{title_query}%"))
-                    .order_by(Book.book_title)
-                    .limit(limit)
-                )
-                result = await session.execute(stmt)
-                books = result.scalars().all()
-                books_list = []
-                for book in books:
-                    books_list.append(
-                        {
-                            "book_id": book.book_id,
-                            "book_title": book.book_title,
-                            "author_name": book.author.author_name
-                            if book.author
-                            else None,
-                            "book_price": book.book_price,
-                            "book_in_stock": book.book_in_stock,
-                        }
-                    )
-                return books_list
+                stmt = BookQueries._book_search_stmt(title_query)
+                result = await session.execute(stmt.limit(limit))
+                return [
+                    {
+                        "book_id": row.book_id,
+                        "book_title": row.book_title,
+                        "author_name": row.author_name,
+                        "book_price": row.book_price,
+                        "book_in_stock": row.book_in_stock,
+                    }
+                    for row in result.all()
+                ]
             except Exception as e:
+                await session.rollback()
                 print(f"Error in search_books_by_title: {e}")
                 return []
 
     @staticmethod
     async def get_books_not_in_stock(limit: int = 50) -> List[Dict]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
                 stmt = (
                     select(Book)
@@ -781,6 +895,7 @@ class BookQueries:
                     )
                 return books_list
             except Exception as e:
+                await session.rollback()
                 print(f"Error in get_books_not_in_stock: {e}")
                 return []
 
@@ -788,57 +903,39 @@ class BookQueries:
     async def search_books_by_title_for_user(
         title_query: str, limit: int = 20
     ) -> List[Dict]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
-                stmt = (
-                    select(Book)
-                    .options(selectinload(Book.author))
-                    .where(
-                        and_(
-                            Book.book_title.ilike(f"%{title_query}%"),
-                            Book.book_in_stock == True,
-                            Book.book_status == BookStatus.IN_STOCK,
-                        )
-                    )
-                    .order_by(Book.book_title)
-                    .limit(limit)
-                )
-                result = await session.execute(stmt)
-                books = result.scalars().all()
-                books_list = []
-                for book in books:
-                    books_list.append(
-                        {
-                            "book_id": book.book_id,
-                            "book_title": book.book_title,
-                            "author_name": book.author.author_name
-                            if book.author
-                            else None,
-                        }
-                    )
-                return books_list
+                stmt = BookQueries._book_search_stmt(title_query, only_available=True)
+                result = await session.execute(stmt.limit(limit))
+                return [
+                    {
+                        "book_id": row.book_id,
+                        "book_title": row.book_title,
+                        "author_name": row.author_name,
+                    }
+                    for row in result.all()
+                ]
             except Exception as e:
+                await session.rollback()
                 print(f"Error in search_books_by_title_for_user: {e}")
                 return []
 
     @staticmethod
     async def get_sale_genre(genre):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     Book.book_id,
                     Book.book_title,
                     Book.book_on_sale,
                     Book.sale_value,
-                    func.avg(Review.review_rating).label("book_rating"),
+                    Book.avg_rating.label("book_rating"),
                 )
                 .where(
                     and_(
                         Book.book_genre == genre, Book.book_on_sale, Book.book_in_stock
                     )
                 )
-                .outerjoin(Review)
-                .group_by(Book.book_id, Book.book_title)
                 .order_by(Book.sale_value.desc(), Book.book_title)
             )
             return result.mappings().all()
@@ -847,7 +944,7 @@ class BookQueries:
 class SaleQueries:
     @staticmethod
     async def add_on_sale(book_ids: list, sale_value: float):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = (
                 update(Book)
                 .where(Book.book_id.in_(book_ids))
@@ -856,11 +953,12 @@ class SaleQueries:
             )
             await session.execute(stmt)
             await session.commit()
+            BookQueries._invalidate_book_cards(book_ids)
             return True
 
     @staticmethod
     async def out_of_sale(book_ids: list):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = (
                 update(Book)
                 .where(Book.book_id.in_(book_ids))
@@ -869,6 +967,7 @@ class SaleQueries:
             )
             await session.execute(stmt)
             await session.commit()
+            BookQueries._invalidate_book_cards(book_ids)
             return True
 
 
@@ -882,7 +981,7 @@ class UserQueries:
 
     @staticmethod
     async def draft_reviews(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             has_draft = await session.execute(
                 select(Review.review_id).where(
                     and_(Review.telegram_id == telegram_id, Review.published.is_(False))
@@ -895,7 +994,7 @@ class UserQueries:
 
     @staticmethod
     async def published_check(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             has_published = await session.execute(
                 select(Review.review_id).where(
                     and_(Review.telegram_id == telegram_id, Review.published)
@@ -908,7 +1007,7 @@ class UserQueries:
 
     @staticmethod
     async def get_user_published_reviews(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             reviews_query = (
                 select(
                     Review.review_id,
@@ -928,7 +1027,7 @@ class UserQueries:
 
     @staticmethod
     async def get_user_draft(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             drafts = await session.execute(
                 select(
                     Review.review_id,
@@ -949,7 +1048,7 @@ class UserQueries:
 
     @staticmethod
     async def get_user_balance(telegram_id) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             balance = int(
                 await session.scalar(
                     select(User.user_balance).where(User.telegram_id == telegram_id)
@@ -958,28 +1057,52 @@ class UserQueries:
             return balance
 
     @staticmethod
-    async def get_user_if_exist(user_data: dict):
-        async with AsyncSessionLocal() as session:
-            user = await session.execute(
-                select(User).where(User.telegram_id == user_data["telegram_id"])
+    async def register_user(
+        user_data: dict, session: Optional[AsyncSession] = None
+    ) -> dict:
+        # /start одним запросом: UPSERT пользователя, корзина (если ее еще нет)
+        # и признак админа. Повторный и параллельный /start безопасны -
+        # конфликт по telegram_id превращается в обновление имени.
+        user_insert = pg_insert(User).values(
+            telegram_id=user_data["telegram_id"],
+            username=user_data["username"],
+            user_first_name=user_data["user_first_name"],
+            user_balance=0,
+        )
+        registered = (
+            user_insert.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={
+                    "username": user_insert.excluded.username,
+                    "user_first_name": user_insert.excluded.user_first_name,
+                },
             )
-            user = user.scalar_one_or_none()
-            if not user:
-                user = User(
-                    telegram_id=user_data["telegram_id"],
-                    username=user_data["username"],
-                    user_first_name=user_data["user_first_name"],
-                )
-                await session.flush()
-                cart = Cart(telegram_id=user_data["telegram_id"])
-                session.add_all([user, cart])
+            .returning(User.telegram_id, User.user_first_name, User.user_balance)
+            .cte("registered_user")
+        )
+        cart_insert = (
+            pg_insert(Cart)
+            .from_select(["telegram_id"], select(registered.c.telegram_id))
+            .on_conflict_do_nothing(index_elements=[Cart.telegram_id])
+            .cte("registered_cart")
+        )
+        stmt = select(
+            registered.c.telegram_id,
+            registered.c.user_first_name,
+            registered.c.user_balance,
+            exists()
+            .where(Admin.telegram_id == registered.c.telegram_id)
+            .label("is_admin"),
+        ).add_cte(cart_insert)
+        async with use_session(session) as session:
+            result = await session.execute(stmt)
+            user = dict(result.mappings().one())
             await session.commit()
-            await session.refresh(user)
             return user
 
     @staticmethod
     async def updata_user_balance(telegram_id, value):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = (
                 update(User)
                 .where(User.telegram_id == telegram_id)
@@ -993,7 +1116,7 @@ class UserQueries:
 class ReviewQueries:
     @staticmethod
     async def new_review(telegram_id: int, book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             new_review = Review(
                 book_id=book_id,
                 review_rating=0,
@@ -1011,7 +1134,7 @@ class ReviewQueries:
 
     @staticmethod
     async def check_review_finished(review_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     Review.review_rating, Review.review_title, Review.review_body
@@ -1029,21 +1152,64 @@ class ReviewQueries:
                 ]
             )
 
+    @staticmethod
+    def _rating_contribution(rating, published) -> tuple[int, int]:
+        # вклад отзыва в (rating_sum, rating_count) книги
+        if published and rating:
+            return rating, 1
+        return 0, 0
+
+    @staticmethod
+    async def _apply_rating_delta(session, book_id: int, before, after):
+        sum_delta = after[0] - before[0]
+        count_delta = after[1] - before[1]
+        if not sum_delta and not count_delta:
+            return
+        await session.execute(
+            update(Book)
+            .where(Book.book_id == book_id)
+            .values(
+                rating_sum=Book.rating_sum + sum_delta,
+                rating_count=Book.rating_count + count_delta,
+            )
+        )
+
     @staticmethod
     async def add_value_column(review_id: int, column, data):
-        async with AsyncSessionLocal() as session:
-            await session.execute(
+        async with use_session() as session:
+            # блокируем отзыв, чтобы дельта рейтинга считалась от актуального состояния
+            before_result = await session.execute(
+                select(Review.review_rating, Review.published)
+                .where(Review.review_id == review_id)
+                .with_for_update()
+            )
+            before = before_result.first()
+            result = await session.execute(
                 update(Review)
                 .where(Review.review_id == review_id)
                 .values({column: data})
-            )
+                .returning(Review.book_id, Review.review_rating, Review.published)
+            )
+            after = result.first()
+            if before and after:
+                await ReviewQueries._apply_rating_delta(
+                    session,
+                    after.book_id,
+                    ReviewQueries._rating_contribution(*before),
+                    ReviewQueries._rating_contribution(
+                        after.review_rating, after.published
+                    ),
+                )
             await session.commit()
+            # публикация или правка отзыва меняет рейтинг в карточке книги
+            if after:
+                BookQueries._invalidate_book_cards([after.book_id])
             is_finished = await ReviewQueries.check_review_finished(review_id)
             return is_finished
 
     @staticmethod
     async def review_get_next_empty_field(review_id: int) -> str:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Review).where(Review.review_id == review_id)
             )
@@ -1057,20 +1223,32 @@ class ReviewQueries:
 
     @staticmethod
     async def delete_review_sure(review_id, telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
                 result = await session.execute(
-                    select(Review).where(
+                    select(Review)
+                    .where(
                         and_(
                             Review.review_id == review_id,
                             Review.telegram_id == telegram_id,
                         )
                     )
+                    .with_for_update()
                 )
                 review = result.scalar_one_or_none()
                 if review:
+                    book_id = review.book_id
+                    await ReviewQueries._apply_rating_delta(
+                        session,
+                        book_id,
+                        ReviewQueries._rating_contribution(
+                            review.review_rating, review.published
+                        ),
+                        (0, 0),
+                    )
                     await session.delete(review)
                     await session.commit()
+                    BookQueries._invalidate_book_cards([book_id])
                     return True
                 return False
             except Exception as e:
@@ -1079,7 +1257,7 @@ class ReviewQueries:
 
     @staticmethod
     async def review_exist(telegram_id: int, book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             review = await session.execute(
                 select(Review.review_id).where(
                     and_(Review.telegram_id == telegram_id, Review.book_id == book_id)
@@ -1090,7 +1268,7 @@ class ReviewQueries:
 
     @staticmethod
     async def check_review_completion(review_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     Review.review_rating,
@@ -1109,7 +1287,7 @@ class ReviewQueries:
 class SupportQueries:
     @staticmethod
     async def check_if_exist(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             ticket = await session.execute(
                 select(SupportAppeal).where(SupportAppeal.telegram_id == telegram_id)
             )
@@ -1118,7 +1296,7 @@ class SupportQueries:
 
     @staticmethod
     async def get_appeals_count(telegram_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(func.count(SupportAppeal.appeal_id)).where(
                     SupportAppeal.telegram_id == telegram_id
@@ -1130,7 +1308,7 @@ class SupportQueries:
     async def get_small_appeals_paginated(
         telegram_id: int, page: int = 0, limit: int = 5
     ):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     SupportAppeal.appeal_id,
@@ -1147,7 +1325,7 @@ class SupportQueries:
 
     @staticmethod
     async def create_new_appeal(telegram_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             appeal = SupportAppeal(
                 telegram_id=telegram_id,
                 priority=PriorityStatus.NORMAL,
@@ -1156,79 +1334,53 @@ class SupportQueries:
             await session.flush()
             appeal_id = appeal.appeal_id
             await session.commit()
-            return appeal_id
-
-    @staticmethod
-    async def can_create_appeal(telegram_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(SupportAppeal.created_date)
-                .where(SupportAppeal.telegram_id == telegram_id)
-                .order_by(SupportAppeal.created_date.desc())
-                .limit(1)
-            )
-            last_appeal = result.scalar_one_or_none()
-            if not last_appeal:
-                return True
-            # return True  # DEBUG  no cooldown at all
-            time_passed = datetime.utcnow() - last_appeal
-            return time_passed.total_seconds() >= 3600
-
-    @staticmethod
-    async def get_cooldown_minutes(telegram_id: int) -> int:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(SupportAppeal.created_date)
-                .where(SupportAppeal.telegram_id == telegram_id)
-                .order_by(SupportAppeal.created_date.desc())
-                .limit(1)
-            )
-            last_appeal = result.scalar_one_or_none()
-            if not last_appeal:
-                return 0
-            time_passed = datetime.utcnow() - last_appeal
-            remaining_seconds = 3600 - time_passed.total_seconds()
-            if remaining_seconds <= 0:
-                return 0
-            return math.ceil(remaining_seconds / 60)
+        appeal_throttle.hit(telegram_id)
+        return appeal_id
+
+    @staticmethod
+    async def _cooldown_seconds(
+        throttle: SlidingWindow, model, telegram_id: int, session=None
+    ) -> int:
+        remaining = throttle.remaining(telegram_id)
+        if remaining is None:
+            # холодный путь: последние события из базы по индексу
+            # (telegram_id, created_date), дальше ответы из памяти
+            async with use_session(session) as session:
+                result = await session.execute(
+                    select(model.created_date)
+                    .where(
+                        model.telegram_id == telegram_id,
+                        model.created_date > datetime.utcnow() - throttle.window,
+                    )
+                    .order_by(model.created_date.desc())
+                    .limit(throttle.limit)
+                )
+                throttle.load(telegram_id, result.scalars().all())
+            remaining = throttle.remaining(telegram_id)
+        return math.ceil(remaining)
 
     @staticmethod
-    async def message_cooldown(telegram_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(UserMessage.created_date)
-                .where(UserMessage.telegram_id == telegram_id)
-                .order_by(UserMessage.created_date.desc())
-                .limit(1)
-            )
-            last_message = result.scalar_one_or_none()
-            if not last_message:
-                return True
-            # return True  # DEBUG для дебага , убирает cooldown для пользовательских сообщений
-            time_passed = datetime.utcnow() - last_message
-            return time_passed.total_seconds() >= 120
+    async def appeal_cooldown_seconds(
+        telegram_id: int, session: Optional[AsyncSession] = None
+    ) -> int:
+        # 0 - можно создавать обращение, иначе сколько секунд ждать
+        # return 0  # DEBUG  no cooldown at all
+        return await SupportQueries._cooldown_seconds(
+            appeal_throttle, SupportAppeal, telegram_id, session
+        )
 
     @staticmethod
-    async def get_message_cooldown_seconds(telegram_id: int) -> str:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(UserMessage.created_date)
-                .where(UserMessage.telegram_id == telegram_id)
-                .order_by(UserMessage.created_date.desc())
-                .limit(1)
-            )
-            last_message = result.scalar_one_or_none()
-            if not last_message:
-                return 0
-            time_passed = datetime.utcnow() - last_message
-            remaining_seconds = 120 - time_passed.total_seconds()
-            if remaining_seconds <= 0:
-                return 0
-            return int(remaining_seconds)
+    async def message_cooldown_seconds(
+        telegram_id: int, session: Optional[AsyncSession] = None
+    ) -> int:
+        # return 0  # DEBUG для дебага , убирает cooldown для пользовательских сообщений
+        return await SupportQueries._cooldown_seconds(
+            message_throttle, UserMessage, telegram_id, session
+        )
 
     @staticmethod
     async def get_last_appeal_id(telegram_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(SupportAppeal.appeal_id)
                 .where(SupportAppeal.telegram_id == telegram_id)
@@ -1240,7 +1392,7 @@ class SupportQueries:
 
     @staticmethod
     async def check_appeal_status(appeal_id: int) -> str:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(SupportAppeal.status).where(SupportAppeal.appeal_id == appeal_id)
             )
@@ -1249,20 +1401,72 @@ class SupportQueries:
 
     @staticmethod
     async def get_appeal_full(appeal_id: int):
-        async with AsyncSessionLocal() as session:
+        # только само обращение - переписку отдает get_appeal_transcript
+        async with use_session() as session:
             result = await session.execute(
-                select(SupportAppeal)
-                .where(SupportAppeal.appeal_id == appeal_id)
-                .options(
-                    selectinload(SupportAppeal.user_messages),
-                    selectinload(SupportAppeal.admin_messages),
-                )
+                select(SupportAppeal).where(SupportAppeal.appeal_id == appeal_id)
             )
             return result.scalar_one_or_none()
 
+    @staticmethod
+    async def get_appeal_transcript(
+        appeal_id: int, limit: int = TRANSCRIPT_WINDOW, cursor: Optional[str] = None
+    ) -> dict:
+        # Переписка обращения одним UNION ALL по user_messages и admin_messages
+        # окном в limit сообщений. Без курсора - последние сообщения, курсор
+        # "older" - окно до него, курсор "latest" - все, что появилось после
+        # (дорисовать хвост чата). Сообщения отдаются по порядку.
+        # Keyset идет по seq из общей последовательности support_message_seq:
+        # created_date секундный и не различает сообщения одной секунды.
+        params = {"appeal_id": appeal_id, "limit": limit + 1}
+        user_keyset = admin_keyset = ""
+        order, newer = "DESC", False
+        if cursor:
+            direction, _, seq = decode_cursor(cursor)
+            newer = direction == PREV
+            op = ">" if newer else "<"
+            # фильтр в каждой ветке - обе идут по индексу (appeal_id, seq)
+            user_keyset = f"AND um.seq {op} :seq"
+            admin_keyset = f"AND am.seq {op} :seq"
+            order = "ASC" if newer else "DESC"
+            params.update(seq=seq)
+        stmt = text(f"""
+            SELECT kind, created_date, seq, body, admin_name
+            FROM (
+                SELECT 'user' AS kind, um.created_date, um.seq,
+                       um.message AS body, NULL AS admin_name
+                FROM user_messages um
+                WHERE um.appeal_id = :appeal_id {user_keyset}
+                UNION ALL
+                SELECT 'admin', am.created_date, am.seq,
+                       am.admin_message, a.name
+                FROM admin_messages am
+                LEFT JOIN admins a ON a.admin_id = am.admin_id
+                WHERE am.appeal_id = :appeal_id {admin_keyset}
+            ) transcript
+            ORDER BY seq {order}
+            LIMIT :limit
+        """)
+        async with use_session() as session:
+            rows = (await session.execute(stmt, params)).mappings().all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if not newer:
+            rows = rows[::-1]
+        messages = [dict(row) for row in rows]
+        older = None
+        if has_more and not newer:
+            first = messages[0]
+            older = encode_cursor(NEXT, first["created_date"], first["seq"])
+        latest = cursor if newer else None
+        if messages:
+            last = messages[-1]
+            latest = encode_cursor(PREV, last["created_date"], last["seq"])
+        return {"messages": messages, "older": older, "latest": latest}
+
     @staticmethod
     async def new_user_message(telegram_id, appeal_id, message):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             new_message = UserMessage(
                 telegram_id=telegram_id, message=message, appeal_id=appeal_id
             )
@@ -1273,10 +1477,11 @@ class SupportQueries:
                 .values(admin_visit=False)
             )
             await session.commit()
+        message_throttle.hit(telegram_id)
 
     @staticmethod
     async def close_appeal(appeal_id: int, who_close: str) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             if who_close == "user":
                 new_status = AppealStatus.CLOSED_BY_USER
             elif who_close == "admin":
@@ -1295,7 +1500,7 @@ class SupportQueries:
 
     @staticmethod
     async def has_user_msg(appeal_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(func.count(UserMessage.message_id)).where(
                     UserMessage.appeal_id == appeal_id
@@ -1306,7 +1511,7 @@ class SupportQueries:
 
     @staticmethod
     async def create_admin_initiated_appeal(telegram_id: int, admin_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             appeal = SupportAppeal(
                 telegram_id=telegram_id,
                 assigned_admin_id=admin_id,
@@ -1319,21 +1524,27 @@ class SupportQueries:
             await session.flush()
             appeal_id = appeal.appeal_id
             await session.commit()
-            return appeal_id
+        appeal_throttle.hit(telegram_id)
+        return appeal_id
 
 
 class OrderQueries:
     @staticmethod
     async def add_book_to_cart(telegram_id, book_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             cart = await session.execute(
                 select(Cart).where(Cart.telegram_id == telegram_id)
             )
             cart = cart.scalar_one_or_none()
             book_price = await session.execute(
-                select(Book.book_price, Book.book_on_sale, Book.sale_value).where(
-                    Book.book_id == book_id
-                )
+                select(
+                    Book.book_title,
+                    Book.book_price,
+                    Book.book_on_sale,
+                    Book.sale_value,
+                    Book.book_quantity,
+                    Book.book_in_stock,
+                ).where(Book.book_id == book_id)
             )
             book_price_info = book_price.mappings().first()
             full_price = float(book_price_info.get("book_price"))
@@ -1354,72 +1565,187 @@ class OrderQueries:
             existing_item = existing_item.scalars().first()
             if existing_item:
                 existing_item.quantity += 1
+                item_price = existing_item.price
             else:
                 if book_price_info["book_on_sale"]:
-                    cart_item = CartItem(
-                        book_id=book_id,
-                        cart_id=cart.cart_id,
-                        quantity=1,
-                        price=new_price,
-                    )
+                    item_price = new_price
                 else:
-                    cart_item = CartItem(
-                        book_id=book_id,
-                        cart_id=cart.cart_id,
-                        quantity=1,
-                        price=full_price,
-                    )
+                    item_price = full_price
+                cart_item = CartItem(
+                    book_id=book_id,
+                    cart_id=cart.cart_id,
+                    quantity=1,
+                    price=item_price,
+                )
                 session.add(cart_item)
             await session.commit()
+            cart_summary = cart_cache.get(telegram_id)
+            if cart_summary is not None:
+                OrderQueries._add_item_to_cart_summary(
+                    cart_summary, book_id, int(item_price), book_price_info
+                )
             return True
 
     @staticmethod
-    async def get_cart_total(telegram_id: int):
-        async with AsyncSessionLocal() as session:
-            cart_id = await session.execute(
-                select(Cart.cart_id).where(Cart.telegram_id == telegram_id)
-            )
-            cart_id = cart_id.scalar()
-            cart_items = await session.execute(
-                select(CartItem.price, CartItem.quantity, CartItem.book_id).where(
-                    CartItem.cart_id == cart_id
-                )
+    def _current_book_price(book_price, on_sale, sale_value):
+        if book_price is None:
+            return None
+        if on_sale and sale_value:
+            return round(book_price * (1 - sale_value), 2)
+        return book_price
+
+    @staticmethod
+    def _build_cart_summary(rows) -> dict:
+        total_price = 0
+        items = []
+        for row in rows:
+            if row.book_id is None:
+                continue
+            total_price += row.price * row.quantity
+            available_quantity = row.book_quantity or 0
+            items.append(
+                {
+                    "book_id": row.book_id,
+                    "book": row.book_title,
+                    "price": row.price,
+                    "quantity": row.quantity,
+                    "current_price": OrderQueries._current_book_price(
+                        row.book_price, row.book_on_sale, row.sale_value
+                    ),
+                    "available_quantity": available_quantity,
+                    "in_stock": bool(row.book_in_stock)
+                    and available_quantity >= row.quantity,
+                }
             )
-            total_price = 0
-            books_in_cart = []
-            for price, quantity, book_id in cart_items:
-                total_price += price * quantity
-                book_title = await session.scalar(
-                    select(Book.book_title).where(Book.book_id == book_id)
+        return {"total_price": total_price, "items": items}
+
+    @staticmethod
+    def _add_item_to_cart_summary(
+        cart_summary: dict, book_id: int, price: int, book_info
+    ):
+        cart_summary["total_price"] += price
+        for item in cart_summary["items"]:
+            if item["book_id"] == book_id:
+                item["quantity"] += 1
+                break
+        else:
+            item = {
+                "book_id": book_id,
+                "book": book_info["book_title"],
+                "price": price,
+                "quantity": 1,
+            }
+            cart_summary["items"].append(item)
+        available_quantity = book_info["book_quantity"] or 0
+        item["current_price"] = OrderQueries._current_book_price(
+            book_info["book_price"],
+            book_info["book_on_sale"],
+            book_info["sale_value"],
+        )
+        item["available_quantity"] = available_quantity
+        item["in_stock"] = (
+            bool(book_info["book_in_stock"]) and available_quantity >= item["quantity"]
+        )
+
+    @staticmethod
+    def _cart_items_columns():
+        return (
+            CartItem.book_id,
+            CartItem.price,
+            CartItem.quantity,
+            Book.book_title,
+            Book.book_price,
+            Book.book_on_sale,
+            Book.sale_value,
+            Book.book_quantity,
+            Book.book_in_stock,
+        )
+
+    @staticmethod
+    async def get_cart_summary(telegram_id: int) -> dict:
+        cart_summary = cart_cache.get(telegram_id)
+        if cart_summary is None:
+            async with use_session() as session:
+                result = await session.execute(
+                    select(*OrderQueries._cart_items_columns())
+                    .select_from(Cart)
+                    .join(CartItem, CartItem.cart_id == Cart.cart_id)
+                    .join(Book, Book.book_id == CartItem.book_id, isouter=True)
+                    .where(Cart.telegram_id == telegram_id)
+                    .order_by(CartItem.cart_items_id)
                 )
-                books_in_cart.append(
-                    {
-                        "book_id": book_id,
-                        "book": book_title,
-                        "price": price,
-                        "quantity": quantity,
-                    }
+                cart_summary = OrderQueries._build_cart_summary(result.all())
+            cart_cache.set(telegram_id, cart_summary)
+        return {
+            "total_price": cart_summary["total_price"],
+            "items": [dict(item) for item in cart_summary["items"]],
+        }
+
+    @staticmethod
+    async def get_cart_total(telegram_id: int):
+        cart_summary = await OrderQueries.get_cart_summary(telegram_id)
+        return [cart_summary["total_price"], cart_summary["items"]]
+
+    @staticmethod
+    async def get_cart_view(telegram_id: int) -> dict:
+        has_address = (
+            exists()
+            .where(UserAddress.telegram_id == User.telegram_id)
+            .label("has_address")
+        )
+        cart_summary = cart_cache.get(telegram_id)
+        async with use_session() as session:
+            if cart_summary is not None:
+                result = await session.execute(
+                    select(User.user_balance, has_address).where(
+                        User.telegram_id == telegram_id
+                    )
                 )
-            return [total_price, books_in_cart]
+                rows = result.all()
+            else:
+                result = await session.execute(
+                    select(
+                        User.user_balance,
+                        has_address,
+                        *OrderQueries._cart_items_columns(),
+                    )
+                    .select_from(User)
+                    .join(Cart, Cart.telegram_id == User.telegram_id, isouter=True)
+                    .join(CartItem, CartItem.cart_id == Cart.cart_id, isouter=True)
+                    .join(Book, Book.book_id == CartItem.book_id, isouter=True)
+                    .where(User.telegram_id == telegram_id)
+                    .order_by(CartItem.cart_items_id)
+                )
+                rows = result.all()
+                cart_summary = OrderQueries._build_cart_summary(rows)
+                cart_cache.set(telegram_id, cart_summary)
+        user_balance = rows[0].user_balance if rows else 0
+        return {
+            "total_price": cart_summary["total_price"],
+            "items": [dict(item) for item in cart_summary["items"]],
+            "user_balance": int(user_balance or 0),
+            "has_address": bool(rows[0].has_address) if rows else False,
+        }
 
     @staticmethod
     async def del_cart(telegram_id):
-        async with AsyncSessionLocal() as session:
-            cart = await session.scalar(
-                select(Cart.cart_id).where(Cart.telegram_id == telegram_id)
-            )
-            cart_items = await session.scalar(
-                select(CartItem).where(CartItem.cart_id == cart)
+        async with use_session() as session:
+            result = await session.execute(
+                delete(CartItem).where(
+                    CartItem.cart_id.in_(
+                        select(Cart.cart_id).where(Cart.telegram_id == telegram_id)
+                    )
+                )
             )
-            if cart_items:
-                await session.delete(cart_items)
-                await session.commit()
+            await session.commit()
+            cart_cache.set(telegram_id, {"total_price": 0, "items": []})
+            if result.rowcount:
                 return True, telegram_id
             return False, telegram_id
 
     @staticmethod
     async def delete_address_orm(address_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             address = await session.scalar(
                 select(UserAddress).where(UserAddress.address_id == address_id)
             )
@@ -1429,7 +1755,7 @@ class OrderQueries:
 
     @staticmethod
     async def update_info(telegram_id, address_id, column, data):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             await session.execute(
                 update(UserAddress)
                 .where(
@@ -1448,7 +1774,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_user_address_data(telegram_id, address_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             order_data = await session.execute(
                 select(
                     UserAddress.name,
@@ -1470,7 +1796,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_next_empty_field(address_id: int, telegram_id: int) -> str:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(UserAddress).where(UserAddress.address_id == address_id)
             )
@@ -1490,7 +1816,7 @@ class OrderQueries:
 
     @staticmethod
     async def check_address_completion(address_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     UserAddress.name,
@@ -1517,7 +1843,7 @@ class OrderQueries:
 
     @staticmethod
     async def has_address(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             has_address = await session.execute(
                 select(UserAddress.address_id).where(
                     UserAddress.telegram_id == telegram_id
@@ -1530,7 +1856,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_address_small(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             addresses = await session.execute(
                 select(
                     UserAddress.address_id,
@@ -1545,7 +1871,7 @@ class OrderQueries:
 
     @staticmethod
     async def add_address_get_id(telegram_id):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             new_address = UserAddress(
                 telegram_id=telegram_id,
                 name=None,
@@ -1566,7 +1892,7 @@ class OrderQueries:
 
     @staticmethod
     async def made_order(telegram_id, address_id, price, cart_data):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book_ids = []
             book_quants = []
             for book in cart_data:
@@ -1580,40 +1906,240 @@ class OrderQueries:
                 price=price,
                 book_id=book_ids,
                 quantity=book_quants,
+                items=[
+                    OrderItem(
+                        book_id=book.get("book_id"),
+                        quantity=book.get("quantity"),
+                        unit_price=int(book.get("price") or 0),
+                        position=position,
+                    )
+                    for position, book in enumerate(cart_data, 1)
+                ],
             )
             session.add(new_order)
             await session.flush()
             order_id = new_order.order_id
             await session.commit()
+            count_cache.invalidate(("user_orders", telegram_id))
             return order_id
 
     @staticmethod
-    async def get_user_orders(telegram_id, limit: int = 5, offset: int = 0):
-        async with AsyncSessionLocal() as session:
-            stmt = (
-                select(
-                    OrderData.order_id,
-                    OrderData.status,
-                    OrderData.price,
-                    OrderData.created_date,
+    async def checkout(
+        telegram_id: int, address_id: int, top_up: Decimal = Decimal(0)
+    ) -> dict:
+        # Оформление заказа одной транзакцией. Строки books блокируются
+        # FOR UPDATE по возрастанию book_id (одинаковый порядок у всех
+        # покупателей - нет дедлоков), поэтому два покупателя не могут
+        # продать последний экземпляр дважды: второй ждет блокировку и видит
+        # уже уменьшенный остаток. top_up - сумма, оплаченная через инвойс;
+        # если заказ не прошел, она остается на балансе. Баланс - Numeric(10, 2),
+        # считаем в Decimal: float дал бы копейки погрешности на счете.
+        result = {
+            "status": "ok",
+            "order_id": None,
+            "total_price": 0,
+            "remainder": 0,
+            "insufficient_books": [],
+            "cart_data": [],
+        }
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                balance = await session.scalar(
+                    select(User.user_balance)
+                    .where(User.telegram_id == telegram_id)
+                    .with_for_update()
+                )
+                balance = (balance or Decimal(0)) + Decimal(str(top_up))
+                cart_rows = (
+                    await session.execute(
+                        select(CartItem.book_id, CartItem.quantity, CartItem.price)
+                        .join(Cart, Cart.cart_id == CartItem.cart_id)
+                        .where(
+                            Cart.telegram_id == telegram_id,
+                            CartItem.book_id.is_not(None),
+                        )
+                        .order_by(CartItem.cart_items_id)
+                    )
+                ).all()
+                required = {}
+                for row in cart_rows:
+                    required[row.book_id] = required.get(row.book_id, 0) + row.quantity
+                books = {
+                    row.book_id: row
+                    for row in (
+                        await session.execute(
+                            select(Book.book_id, Book.book_title, Book.book_quantity)
+                            .where(Book.book_id.in_(sorted(required)))
+                            .order_by(Book.book_id)
+                            .with_for_update()
+                        )
+                    ).all()
+                }
+                for book_id, quantity in required.items():
+                    book = books.get(book_id)
+                    if book is None:
+                        result["insufficient_books"].append(
+                            f"❌ Книга ID {book_id} не найдена"
+                        )
+                    elif (book.book_quantity or 0) < quantity:
+                        result["insufficient_books"].append(
+                            f"❌ {book.book_title}: нужно {quantity}, есть {book.book_quantity or 0}"
+                        )
+                cart_data = [
+                    {
+                        "book_id": row.book_id,
+                        "book": books[row.book_id].book_title
+                        if row.book_id in books
+                        else None,
+                        "price": row.price,
+                        "quantity": row.quantity,
+                    }
+                    for row in cart_rows
+                ]
+                total_price = sum(row.price * row.quantity for row in cart_rows)
+                result["cart_data"] = cart_data
+                result["total_price"] = total_price
+                result["remainder"] = balance - total_price
+                if not cart_rows:
+                    result["status"] = "empty_cart"
+                elif result["insufficient_books"]:
+                    result["status"] = "out_of_stock"
+                elif balance < total_price:
+                    result["status"] = "insufficient_funds"
+                if result["status"] != "ok":
+                    if top_up:
+                        await session.execute(
+                            update(User)
+                            .where(User.telegram_id == telegram_id)
+                            .values(user_balance=balance)
+                        )
+                    return result
+                order = OrderData(
+                    address_id=address_id,
+                    telegram_id=telegram_id,
+                    price=int(total_price),
+                    book_id=[item["book_id"] for item in cart_data],
+                    quantity=[item["quantity"] for item in cart_data],
+                    items=[
+                        OrderItem(
+                            book_id=item["book_id"],
+                            quantity=item["quantity"],
+                            unit_price=int(item["price"] or 0),
+                            position=position,
+                        )
+                        for position, item in enumerate(cart_data, 1)
+                    ],
                 )
-                .order_by(OrderData.created_date.desc())
+                session.add(order)
+                await BookQueries._adjust_stock(
+                    session,
+                    ((book_id, -quantity) for book_id, quantity in required.items()),
+                )
+                await session.execute(
+                    update(User)
+                    .where(User.telegram_id == telegram_id)
+                    .values(user_balance=result["remainder"])
+                )
+                await session.execute(
+                    delete(CartItem).where(
+                        CartItem.cart_id.in_(
+                            select(Cart.cart_id).where(Cart.telegram_id == telegram_id)
+                        )
+                    )
+                )
+                await session.flush()
+                result["order_id"] = order.order_id
+        cart_cache.set(telegram_id, {"total_price": 0, "items": []})
+        count_cache.invalidate(("user_orders", telegram_id))
+        BookQueries._invalidate_book_cards(required)
+        return result
+
+    @staticmethod
+    async def get_user_orders(
+        telegram_id, limit: int = 5, offset: int = 0, cursor: Optional[str] = None
+    ):
+        async with use_session() as session:
+            stmt = select(
+                OrderData.order_id,
+                OrderData.status,
+                OrderData.price,
+                OrderData.created_date,
+            ).where(OrderData.telegram_id == telegram_id)
+            return await fetch_page(
+                session,
+                stmt,
+                OrderData.created_date,
+                OrderData.order_id,
+                limit,
+                offset=offset,
+                cursor=cursor,
+            )
+
+    @staticmethod
+    async def get_order_ids_by_book(book_id: int, limit: int = 50) -> list:
+        async with use_session() as session:
+            result = await session.execute(
+                select(OrderItem.order_id)
+                .where(OrderItem.book_id == book_id)
+                .order_by(OrderItem.order_id.desc())
                 .limit(limit)
-                .offset(offset)
             )
-            result = await session.execute(stmt)
-            return result.mappings().all()
+            return result.scalars().all()
 
     @staticmethod
     async def get_user_orders_count(telegram_id: int):
-        async with AsyncSessionLocal() as session:
+        cache_key = ("user_orders", telegram_id)
+        total_count = count_cache.get(cache_key)
+        if total_count is not None:
+            return total_count
+        async with use_session() as session:
             stmt = select(func.count()).where(OrderData.telegram_id == telegram_id)
             result = await session.execute(stmt)
-            return result.scalar()
+            total_count = result.scalar()
+        count_cache.set(cache_key, total_count)
+        return total_count
+
+    @staticmethod
+    async def load_order_items(session, order_id: int) -> list:
+        result = await session.execute(
+            select(
+                OrderItem.book_id,
+                OrderItem.quantity,
+                func.coalesce(Book.book_title, DELETED_BOOK_TITLE).label("book_title"),
+                OrderItem.unit_price.label("book_price"),
+            )
+            .outerjoin(Book, Book.book_id == OrderItem.book_id)
+            .where(OrderItem.order_id == order_id)
+            .order_by(OrderItem.position)
+        )
+        items = result.mappings().all()
+        if items:
+            return items
+        # заказ еще не перенесен в order_items (см. backfill_order_items) -
+        # раскрываем JSON-массивы book_id/quantity на стороне БД одним запросом
+        stmt = text("""
+            SELECT
+                b.book_id,
+                COALESCE(items.quantity::int, 1) AS quantity,
+                COALESCE(b.book_title, :deleted_title) AS book_title,
+                COALESCE(b.book_price, 0) AS book_price
+            FROM order_data o
+            CROSS JOIN LATERAL ROWS FROM (
+                json_array_elements_text(o.book_id),
+                json_array_elements_text(o.quantity)
+            ) WITH ORDINALITY AS items(book_id, quantity, idx)
+            LEFT JOIN books b ON b.book_id = items.book_id::int
+            WHERE o.order_id = :order_id AND items.book_id IS NOT NULL
+            ORDER BY items.idx
+        """)
+        result = await session.execute(
+            stmt, {"order_id": order_id, "deleted_title": DELETED_BOOK_TITLE}
+        )
+        return result.mappings().all()
 
     @staticmethod
     async def get_order_details(order_id: int, telegram_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             order_stmt = (
                 select(
                     OrderData.order_id,
@@ -1653,24 +2179,21 @@ class OrderQueries:
             address = ", ".join(address_parts) if address_parts else "Не указан"
             items_text = ""
             items_list = []
-            for i, book_id in enumerate(order_data["book_id"]):
-                quantity = order_data["quantity"][i]
-                book_stmt = select(Book.book_title, Book.book_price).where(
-                    Book.book_id == book_id
+            order_items = await OrderQueries.load_order_items(
+                session, order_data["order_id"]
+            )
+            for item in order_items:
+                quantity = item["quantity"]
+                item_price = item["book_price"] * quantity
+                items_text += f"• {item['book_title']} - {quantity}шт. × {item['book_price']}₽ = {item_price}₽\n"
+                items_list.append(
+                    {
+                        "book_title": item["book_title"],
+                        "quantity": quantity,
+                        "price": item["book_price"],
+                        "total_price": item_price,
+                    }
                 )
-                book_result = await session.execute(book_stmt)
-                book = book_result.mappings().first()
-                if book:
-                    item_price = book["book_price"] * quantity
-                    items_text += f"• {book['book_title']} - {quantity}шт. × {book['book_price']}₽ = {item_price}₽\n"
-                    items_list.append(
-                        {
-                            "book_title": book["book_title"],
-                            "quantity": quantity,
-                            "price": book["book_price"],
-                            "total_price": item_price,
-                        }
-                    )
             return {
                 "order_id": order_data["order_id"],
                 "status": order_data["status"],
@@ -1686,7 +2209,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_user_money_back(user_telegram_id: int, amount_money: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(User.user_balance).where(User.telegram_id == user_telegram_id)
             )
@@ -1701,7 +2224,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_user_telegram_id_by_order_id(order_id: int) -> Optional[int]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = select(OrderData.telegram_id).where(OrderData.order_id == order_id)
             result = await session.execute(query)
             telegram_id = result.scalar_one_or_none()
@@ -1709,7 +2232,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_order_with_user(order_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = (
                 select(OrderData)
                 .where(OrderData.order_id == order_id)
@@ -1720,7 +2243,7 @@ class OrderQueries:
 
     @staticmethod
     async def get_order_with_user_data(order_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = (
                 select(OrderData)
                 .where(OrderData.order_id == order_id)
@@ -1733,7 +2256,7 @@ class OrderQueries:
     async def check_cart_quantity_limit(
         telegram_id: int, book_id: int, quantity_to_add: int = 1
     ) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             cart_query = (
                 select(func.sum(CartItem.quantity))
                 .join(Cart, Cart.cart_id == CartItem.cart_id)
@@ -1754,19 +2277,121 @@ class OrderQueries:
             }
 
 
+class PaymentQueries:
+    @staticmethod
+    async def create_payment(
+        payment_id: str,
+        telegram_id: int,
+        chat_id: int,
+        address_id: int,
+        amount: int,
+        expires_at: datetime,
+    ):
+        async with use_session() as session:
+            session.add(
+                PendingPayment(
+                    payment_id=payment_id,
+                    telegram_id=telegram_id,
+                    chat_id=chat_id,
+                    address_id=address_id,
+                    amount=amount,
+                    expires_at=expires_at,
+                )
+            )
+            await session.commit()
+
+    @staticmethod
+    async def set_invoice_message(payment_id: str, invoice_message_id: int):
+        async with use_session() as session:
+            await session.execute(
+                update(PendingPayment)
+                .where(PendingPayment.payment_id == payment_id)
+                .values(invoice_message_id=invoice_message_id)
+            )
+            await session.commit()
+
+    @staticmethod
+    async def get_pending_payment(payment_id: str) -> Optional[dict]:
+        # поиск по первичному ключу - payload инвойса
+        async with use_session() as session:
+            result = await session.execute(
+                select(
+                    PendingPayment.payment_id,
+                    PendingPayment.telegram_id,
+                    PendingPayment.address_id,
+                    PendingPayment.amount,
+                    PendingPayment.invoice_message_id,
+                ).where(
+                    PendingPayment.payment_id == payment_id,
+                    PendingPayment.status == PaymentStatus.PENDING,
+                )
+            )
+            row = result.mappings().first()
+            return dict(row) if row else None
+
+    @staticmethod
+    async def finish_payment(payment_id: str, status: PaymentStatus) -> Optional[dict]:
+        # переводим только из pending - платеж завершается ровно один раз, даже
+        # если таймаут и оплата пришли одновременно или ботов несколько
+        async with use_session() as session:
+            result = await session.execute(
+                update(PendingPayment)
+                .where(
+                    PendingPayment.payment_id == payment_id,
+                    PendingPayment.status == PaymentStatus.PENDING,
+                )
+                .values(status=status)
+                .returning(
+                    PendingPayment.telegram_id,
+                    PendingPayment.chat_id,
+                    PendingPayment.address_id,
+                    PendingPayment.invoice_message_id,
+                )
+            )
+            row = result.mappings().first()
+            await session.commit()
+            return dict(row) if row else None
+
+    @staticmethod
+    async def get_pending_expirations() -> list:
+        async with use_session() as session:
+            result = await session.execute(
+                select(PendingPayment.payment_id, PendingPayment.expires_at).where(
+                    PendingPayment.status == PaymentStatus.PENDING
+                )
+            )
+            return result.all()
+
+    @staticmethod
+    async def delete_finished_payments(older_than: datetime) -> int:
+        async with use_session() as session:
+            result = await session.execute(
+                delete(PendingPayment).where(
+                    PendingPayment.status != PaymentStatus.PENDING,
+                    PendingPayment.updated_at < older_than,
+                )
+            )
+            await session.commit()
+            return result.rowcount
+
+
 class AdminQueries:
     @staticmethod
     async def set_admin_new_name(admin_id: int, admin_name: str) -> bool:
-        async with AsyncSessionLocal() as session:
-            await session.execute(
-                update(Admin).where(Admin.admin_id == admin_id).values(name=admin_name)
+        async with use_session() as session:
+            result = await session.execute(
+                update(Admin)
+                .where(Admin.admin_id == admin_id)
+                .values(name=admin_name)
+                .returning(Admin.telegram_id)
             )
             await session.commit()
+            AdminQueries._invalidate_admin_cache(result.scalars().all())
             return True
 
     @staticmethod
     async def delete_book(book_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
                 result = await session.execute(
                     select(Book).where(Book.book_id == book_id)
@@ -1775,6 +2400,7 @@ class AdminQueries:
                 if book:
                     await session.delete(book)
                     await session.commit()
+                    BookQueries._invalidate_book_cards([book_id])
                     return True
                 return False
             except Exception as e:
@@ -1783,18 +2409,19 @@ class AdminQueries:
 
     @staticmethod
     async def made_new_admin_get_id(telegram_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             admin = Admin(
                 telegram_id=telegram_id,
             )
             session.add(admin)
             await session.commit()
             await session.refresh(admin)
+            admin_cache.invalidate(telegram_id)
             return admin.admin_id
 
     @staticmethod
     async def is_user_in_db(username: str):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(User).where(User.username == username)
             )
@@ -1802,7 +2429,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_admins_with_permission(required_permission: AdminPermission) -> list:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin.telegram_id).where(
                     Admin.permissions.op("&")(required_permission.value)
@@ -1814,7 +2441,7 @@ class AdminQueries:
 
     @staticmethod
     async def admin_visited(appeal_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             await session.execute(
                 update(SupportAppeal)
                 .where(SupportAppeal.appeal_id == appeal_id)
@@ -1824,16 +2451,46 @@ class AdminQueries:
 
     @staticmethod
     async def get_admin_by_telegram_id(telegram_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin).where(Admin.telegram_id == telegram_id)
             )
             admin = result.scalar_one_or_none()
             return admin
 
+    @staticmethod
+    async def get_admin_identity(
+        telegram_id: int, session: Optional[AsyncSession] = None
+    ) -> Optional[dict]:
+        admin_identity = admin_cache.get(telegram_id, _NOT_CACHED)
+        if admin_identity is not _NOT_CACHED:
+            return admin_identity
+        async with use_session(session) as session:
+            result = await session.execute(
+                select(
+                    Admin.admin_id,
+                    Admin.permissions,
+                    Admin.name,
+                    Admin.role_name,
+                ).where(Admin.telegram_id == telegram_id)
+            )
+            row = result.mappings().first()
+        admin_identity = dict(row) if row else None
+        admin_cache.set(telegram_id, admin_identity)
+        return admin_identity
+
+    @staticmethod
+    def _invalidate_admin_cache(telegram_ids):
+        for telegram_id in telegram_ids:
+            admin_cache.invalidate(telegram_id)
+
+    @staticmethod
+    def admin_cache_stats() -> dict:
+        return admin_cache.stats()
+
     @staticmethod
     async def get_username_by_telegram_id(telegram_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(User.username).where(User.telegram_id == telegram_id)
             )
@@ -1841,7 +2498,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_admin_by_id(admin_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin).where(Admin.admin_id == admin_id)
             )
@@ -1849,7 +2506,7 @@ class AdminQueries:
 
     @staticmethod
     async def has_closed_appeals(admin_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             exists_query = (
                 select(1)
                 .where(
@@ -1865,7 +2522,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_order_status(order_id: int) -> str:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(OrderData.status).where(OrderData.order_id == order_id)
             )
@@ -1873,22 +2530,47 @@ class AdminQueries:
 
     @staticmethod
     async def canceling_order_with_reason(order_id: int, admin_id: int, reason) -> bool:
+        # Отмена, возврат книг на склад и денег на баланс - одна транзакция с
+        # постоянным числом запросов независимо от размера заказа. Условие на
+        # статус не дает вернуть товар дважды при повторном нажатии.
         async with AsyncSessionLocal() as session:
-            await session.execute(
-                update(OrderData)
-                .where(OrderData.order_id == order_id)
-                .values(
-                    status=OrderStatus.CANCELLED,
-                    admin_id_who_canceled=admin_id,
-                    reason_to_cancellation=reason,
+            async with session.begin():
+                canceled = (
+                    await session.execute(
+                        update(OrderData)
+                        .where(
+                            OrderData.order_id == order_id,
+                            OrderData.status.not_in(
+                                [OrderStatus.CANCELLED, OrderStatus.COMPLETED]
+                            ),
+                        )
+                        .values(
+                            status=OrderStatus.CANCELLED,
+                            admin_id_who_canceled=admin_id,
+                            reason_to_cancellation=reason,
+                        )
+                        .returning(OrderData.telegram_id, OrderData.price)
+                    )
+                ).first()
+                if not canceled:
+                    return False
+                # load_order_items читает и заказы, еще не перенесенные в
+                # order_items (JSON-массивы book_id/quantity)
+                items = await OrderQueries.load_order_items(session, order_id)
+                book_ids = await BookQueries._adjust_stock(
+                    session, [(item["book_id"], item["quantity"]) for item in items]
                 )
-            )
-            await session.commit()
-            return True
+                await session.execute(
+                    update(User)
+                    .where(User.telegram_id == canceled.telegram_id)
+                    .values(user_balance=User.user_balance + canceled.price)
+                )
+        BookQueries._invalidate_book_cards(book_ids)
+        return True
 
     @staticmethod
     async def count_appeals_in_work(admin_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(func.count(SupportAppeal.appeal_id)).where(
                     and_(
@@ -1901,41 +2583,51 @@ class AdminQueries:
 
     @staticmethod
     async def get_closed_appeals(
-        admin_id: int, page: int = 0, items_per_page: int = 10
+        admin_id: int,
+        page: int = 0,
+        items_per_page: int = 10,
+        cursor: Optional[str] = None,
     ) -> tuple[list, int]:
-        async with AsyncSessionLocal() as session:
-            total_count = await session.execute(
-                select(func.count(SupportAppeal.appeal_id)).where(
-                    SupportAppeal.assigned_admin_id == admin_id,
-                    SupportAppeal.status.in_(
-                        [AppealStatus.CLOSED_BY_ADMIN, AppealStatus.CLOSED_BY_USER]
-                    ),
-                )
-            )
-            total_count = total_count.scalar()
-            result = await session.execute(
+        async with use_session() as session:
+            closed_filter = and_(
+                SupportAppeal.assigned_admin_id == admin_id,
+                SupportAppeal.status.in_(
+                    [AppealStatus.CLOSED_BY_ADMIN, AppealStatus.CLOSED_BY_USER]
+                ),
+            )
+            cache_key = ("closed_appeals", admin_id)
+            total_count = count_cache.get(cache_key)
+            if total_count is None:
+                total_count = await session.scalar(
+                    select(func.count(SupportAppeal.appeal_id)).where(closed_filter)
+                )
+                count_cache.set(cache_key, total_count)
+            stmt = (
                 select(
                     SupportAppeal.appeal_id,
                     SupportAppeal.updated_at,
                     SupportAppeal.status,
                     User.username,
                 )
-                .where(
-                    SupportAppeal.assigned_admin_id == admin_id,
-                    SupportAppeal.status.in_(
-                        [AppealStatus.CLOSED_BY_ADMIN, AppealStatus.CLOSED_BY_USER]
-                    ),
-                )
+                .where(closed_filter)
                 .join(User, User.telegram_id == SupportAppeal.telegram_id)
-                .order_by(SupportAppeal.updated_at.desc())
-                .offset(page * items_per_page)
-                .limit(items_per_page)
             )
-            return result.mappings().all(), total_count
+            appeals = await fetch_page(
+                session,
+                stmt,
+                SupportAppeal.updated_at,
+                SupportAppeal.appeal_id,
+                items_per_page,
+                offset=page * items_per_page,
+                cursor=cursor,
+            )
+            return appeals, total_count
 
     @staticmethod
-    async def is_user_admin(telegram_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+    async def is_user_admin(
+        telegram_id: int, session: Optional[AsyncSession] = None
+    ) -> bool:
+        async with use_session(session) as session:
             result = await session.execute(
                 select(Admin).where(Admin.telegram_id == telegram_id)
             )
@@ -1943,7 +2635,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_admin_name(telegram_id: int) -> str:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin).where(Admin.telegram_id == telegram_id)
             )
@@ -1966,7 +2658,7 @@ class AdminQueries:
 
     @staticmethod
     async def appeal_in_work_for_kb(admin_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     SupportAppeal.appeal_id, SupportAppeal.admin_visit, User.username
@@ -1984,39 +2676,72 @@ class AdminQueries:
             return appeals_data
 
     @staticmethod
-    async def get_new_appeal():
-        async with AsyncSessionLocal() as session:
-            appeal = await session.execute(
-                select(SupportAppeal)
-                .options(
-                    selectinload(SupportAppeal.user_messages),
-                    selectinload(SupportAppeal.admin_messages),
-                    selectinload(SupportAppeal.user),
-                )
-                .where(
-                    and_(
-                        SupportAppeal.assigned_admin_id.is_(None),
+    async def has_new_appeal() -> bool:
+        # только проверка перед правилами: само обращение берет
+        # claim_next_appeal. EXISTS по (status, queue_key) читает одну строку
+        # индекса ix_support_appeals_queue, без загрузки переписки
+        async with use_session() as session:
+            result = await session.execute(
+                select(
+                    exists().where(
                         SupportAppeal.status == AppealStatus.NEW,
+                        SupportAppeal.assigned_admin_id.is_(None),
                     )
                 )
-                .order_by(SupportAppeal.priority.desc(), SupportAppeal.created_date)
-                .limit(1)
             )
-            new_appeal = appeal.scalar_one_or_none()
-            return new_appeal
+            return result.scalar()
+
+    @staticmethod
+    def _appeal_queue_order():
+        # см. SupportAppeal.queue_key - идет по индексу ix_support_appeals_queue
+        return (SupportAppeal.queue_key,)
+
+    @staticmethod
+    async def claim_next_appeal(admin_telegram_id: int) -> Optional[int]:
+        # Взять следующее обращение одним UPDATE: подзапрос блокирует строку
+        # FOR UPDATE SKIP LOCKED, поэтому админы, нажавшие "взять" одновременно,
+        # получают разные обращения и не ждут друг друга.
+        admin_id = (
+            select(Admin.admin_id)
+            .where(Admin.telegram_id == admin_telegram_id)
+            .scalar_subquery()
+        )
+        next_appeal = (
+            select(SupportAppeal.appeal_id)
+            .where(
+                SupportAppeal.status == AppealStatus.NEW,
+                SupportAppeal.assigned_admin_id.is_(None),
+            )
+            .order_by(*AdminQueries._appeal_queue_order())
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with use_session() as session:
+            appeal_id = await session.scalar(
+                update(SupportAppeal)
+                .where(
+                    SupportAppeal.appeal_id == next_appeal,
+                    exists().where(Admin.telegram_id == admin_telegram_id),
+                )
+                .values(
+                    assigned_admin_id=admin_id,
+                    status=AppealStatus.IN_WORK,
+                    admin_visit=True,
+                    updated_at=datetime.now(),
+                )
+                .returning(SupportAppeal.appeal_id)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return appeal_id
 
     @staticmethod
     async def get_admin_appeal_by_id(appeal_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(SupportAppeal)
-                .options(
-                    selectinload(SupportAppeal.user_messages),
-                    selectinload(SupportAppeal.admin_messages).selectinload(
-                        AdminMessage.admin
-                    ),
-                    selectinload(SupportAppeal.user),
-                )
+                .options(selectinload(SupportAppeal.user))
                 .where(SupportAppeal.appeal_id == appeal_id)
             )
             appeal_data = result.scalar_one_or_none()
@@ -2024,7 +2749,7 @@ class AdminQueries:
 
     @staticmethod
     async def assign_appeal_to_admin(appeal_id: int, admin_telegram_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             admin_query = select(Admin.admin_id).where(
                 Admin.telegram_id == admin_telegram_id
             )
@@ -2050,7 +2775,7 @@ class AdminQueries:
     async def admin_support_to_user(
         admin_id: int, appeal_id: int, message: str
     ) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             admin_msg = AdminMessage(
                 admin_message=message, admin_id=admin_id, appeal_id=appeal_id
             )
@@ -2069,7 +2794,7 @@ class AdminQueries:
 
     @staticmethod
     async def appeal_exists(appeal_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(SupportAppeal.appeal_id).where(
                     SupportAppeal.appeal_id == appeal_id
@@ -2079,7 +2804,7 @@ class AdminQueries:
 
     @staticmethod
     async def is_assigned_admin(appeal_id: int, admin_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             appeal = await session.execute(
                 select(SupportAppeal.appeal_id)
                 .where(
@@ -2100,46 +2825,45 @@ class AdminQueries:
         has_admin_permission: bool,
         page: int = 0,
         items_per_page: int = 10,
+        cursor: Optional[str] = None,
     ) -> tuple[list, int]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = (
-                select(SupportAppeal)
-                .join(SupportAppeal.user)
+                select(
+                    SupportAppeal.appeal_id,
+                    SupportAppeal.created_date,
+                    SupportAppeal.updated_at,
+                    SupportAppeal.status,
+                    func.coalesce(User.username, "Без username").label("username"),
+                )
+                .join(User, User.telegram_id == SupportAppeal.telegram_id)
                 .where(User.username == username)
             )
             if not has_admin_permission:
                 query = query.where(SupportAppeal.assigned_admin_id == admin_id)
-            total_count = await session.execute(
-                select(func.count()).select_from(query.subquery())
-            )
-            total_count = total_count.scalar()
-            result = await session.execute(
-                query.options(joinedload(SupportAppeal.user))
-                .order_by(SupportAppeal.updated_at.desc())
-                .offset(page * items_per_page)
-                .limit(items_per_page)
-            )
-            appeals = result.scalars().all()
-            appeals_data = []
-            for appeal in appeals:
-                appeals_data.append(
-                    {
-                        "appeal_id": appeal.appeal_id,
-                        "created_date": appeal.created_date,
-                        "updated_at": appeal.updated_at,
-                        "status": appeal.status,
-                        "username": appeal.user.username
-                        if appeal.user
-                        else "Без username",
-                    }
+            cache_key = ("appeals_by_username", username, admin_id, has_admin_permission)
+            total_count = count_cache.get(cache_key)
+            if total_count is None:
+                total_count = await session.scalar(
+                    select(func.count()).select_from(query.subquery())
                 )
-            return appeals_data, total_count
+                count_cache.set(cache_key, total_count)
+            appeals = await fetch_page(
+                session,
+                query,
+                SupportAppeal.updated_at,
+                SupportAppeal.appeal_id,
+                items_per_page,
+                offset=page * items_per_page,
+                cursor=cursor,
+            )
+            return [dict(appeal) for appeal in appeals], total_count
 
     @staticmethod
     async def has_appeals_by_username(
         username: str, admin_id: int, has_admin_permission: bool
     ) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = (
                 select(SupportAppeal.appeal_id)
                 .join(SupportAppeal.user)
@@ -2153,7 +2877,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_admins_info() -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin.permissions, func.count(Admin.admin_id)).group_by(
                     Admin.permissions
@@ -2175,7 +2899,11 @@ class AdminQueries:
 
     @staticmethod
     async def get_total_count_admins_by_lvl(admin_lvl) -> int:
-        async with AsyncSessionLocal() as session:
+        cache_key = ("admins", admin_lvl)
+        total_count = count_cache.get(cache_key)
+        if total_count is not None:
+            return total_count
+        async with use_session() as session:
             result = await session.execute(
                 select(func.count(Admin.admin_id)).where(
                     Admin.role_name
@@ -2184,11 +2912,13 @@ class AdminQueries:
                     )  # dict on top of the all orm queries
                 )
             )
-            return result.scalar() or 0
+            total_count = result.scalar() or 0
+        count_cache.set(cache_key, total_count)
+        return total_count
 
     @staticmethod
     async def get_admin_role_by_admin_id(admin_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin.role_name).where(Admin.admin_id == admin_id)
             )
@@ -2196,21 +2926,23 @@ class AdminQueries:
 
     @staticmethod
     async def delete_admin(admin_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = (
                 update(Admin)
                 .where(Admin.admin_id == admin_id)
                 .values(permissions=AdminPermission.NONE, role_name=AdminRole.DELETED)
+                .returning(Admin.telegram_id)
             )
-            await session.execute(stmt)
+            result = await session.execute(stmt)
             await session.commit()
+            AdminQueries._invalidate_admin_cache(result.scalars().all())
             return True
 
     @staticmethod
     async def update_admin_permissions_and_role(
         admin_id: int, permissions: int, role: str
     ):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             admin = await session.execute(
                 select(Admin).where(Admin.admin_id == admin_id)
             )
@@ -2220,29 +2952,41 @@ class AdminQueries:
             admin.permissions = permissions
             admin.role_name = role
             admin.updated_at = datetime.utcnow()
+            telegram_id = admin.telegram_id
             await session.commit()
+            admin_cache.invalidate(telegram_id)
             return True
 
     @staticmethod
     async def get_admins_paginated(
-        admin_lvl: str, page: int = 0, items_per_page: int = 10
+        admin_lvl: str,
+        page: int = 0,
+        items_per_page: int = 10,
+        cursor: Optional[str] = None,
     ) -> list:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(
-                    Admin.admin_id,
-                    Admin.name,
-                )
-                .where(Admin.role_name == admin_role_dict.get(admin_lvl))
-                .order_by(Admin.created_at.desc())
-                .offset(page * items_per_page)
-                .limit(items_per_page)
+        async with use_session() as session:
+            stmt = select(
+                Admin.admin_id,
+                Admin.name,
+                Admin.created_at,
+            ).where(Admin.role_name == admin_role_dict.get(admin_lvl))
+            return await fetch_page(
+                session,
+                stmt,
+                Admin.created_at,
+                Admin.admin_id,
+                items_per_page,
+                offset=page * items_per_page,
+                cursor=cursor,
             )
-            return result.mappings().all()
 
     @staticmethod
     async def get_admin_orders_count(order_type: str) -> int:
-        async with AsyncSessionLocal() as session:
+        cache_key = ("admin_orders", order_type)
+        total_count = count_cache.get(cache_key)
+        if total_count is not None:
+            return total_count
+        async with use_session() as session:
             result = await session.execute(
                 select(func.count(OrderData.order_id)).where(
                     OrderData.status
@@ -2251,11 +2995,13 @@ class AdminQueries:
                     )  # dict on top of the all orm
                 )
             )
-            return result.scalar() or 0
+            total_count = result.scalar() or 0
+        count_cache.set(cache_key, total_count)
+        return total_count
 
     @staticmethod
     async def get_telegram_id_by_username(username: str) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(User.telegram_id).where(User.username == username)
             )
@@ -2263,7 +3009,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_admin_orders_count_telegram_id(telegram_id: int) -> int:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(func.count(OrderData.order_id)).where(
                     OrderData.telegram_id == telegram_id
@@ -2275,7 +3021,7 @@ class AdminQueries:
     async def admin_get_user_orders_by_telegram_id_small(
         telegram_id: int, page: int = 0, items_per_page: int = 10
     ) -> list:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     OrderData.order_id,
@@ -2295,10 +3041,13 @@ class AdminQueries:
 
     @staticmethod
     async def get_admin_orders_paginated(
-        order_type: str, page: int = 0, items_per_page: int = 10
+        order_type: str,
+        page: int = 0,
+        items_per_page: int = 10,
+        cursor: Optional[str] = None,
     ) -> list:
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
+        async with use_session() as session:
+            stmt = (
                 select(
                     OrderData.order_id,
                     OrderData.price,
@@ -2311,15 +3060,20 @@ class AdminQueries:
                     OrderData.status == order_type_to_admin_orders_dict.get(order_type)
                 )
                 .join(User, User.telegram_id == OrderData.telegram_id)
-                .order_by(OrderData.created_date.desc())
-                .offset(page * items_per_page)
-                .limit(items_per_page)
             )
-            return result.mappings().all()
+            return await fetch_page(
+                session,
+                stmt,
+                OrderData.created_date,
+                OrderData.order_id,
+                items_per_page,
+                offset=page * items_per_page,
+                cursor=cursor,
+            )
 
     @staticmethod
     async def get_order_details(order_id: int) -> Optional[dict]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     OrderData.order_id,
@@ -2353,23 +3107,18 @@ class AdminQueries:
                 return None
             books_info = []
             if order.book_id and order.quantity:
-                for i, book_id in enumerate(order.book_id):
-                    book_result = await session.execute(
-                        select(Book.book_title, Book.book_price).where(
-                            Book.book_id == book_id
-                        )
-                    )
-                    book = book_result.mappings().first()
-                    if book:
-                        quantity = order.quantity[i] if i < len(order.quantity) else 1
-                        books_info.append(
-                            {
-                                "book_id": book_id,
-                                "title": book.book_title,
-                                "price": book.book_price,
-                                "quantity": quantity,
-                            }
-                        )
+                order_items = await OrderQueries.load_order_items(
+                    session, order.order_id
+                )
+                books_info = [
+                    {
+                        "book_id": item["book_id"],
+                        "title": item["book_title"],
+                        "price": item["book_price"],
+                        "quantity": item["quantity"],
+                    }
+                    for item in order_items
+                ]
             return {
                 "order_id": order.order_id,
                 "total_price": order.price,
@@ -2398,7 +3147,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_order_new_status(order_id: int, new_status) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = (
                 update(OrderData)
                 .where(OrderData.order_id == order_id)
@@ -2410,7 +3159,7 @@ class AdminQueries:
 
     @staticmethod
     async def get_admin_by_username(username: str):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(Admin)
                 .join(User, Admin.telegram_id == User.telegram_id)
@@ -2420,7 +3169,7 @@ class AdminQueries:
 
     @staticmethod
     async def check_if_author_exist(author_name: str):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             result = await session.execute(
                 select(
                     Author.author_id, Author.author_name, Author.author_country
@@ -2430,26 +3179,28 @@ class AdminQueries:
 
     @staticmethod
     async def add_value_to_new_book(book_id: int, column: str, value) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             await session.execute(
                 update(Book).where(Book.book_id == book_id).values({column: value})
             )
             await session.flush()
             await session.commit()
+            BookQueries._invalidate_book_cards([book_id])
 
     @staticmethod
     async def assign_new_author_to_book(book_id: int, author_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             stmt = (
                 update(Book).where(Book.book_id == book_id).values(author_id=author_id)
             )
             await session.execute(stmt)
             await session.commit()
+            BookQueries._invalidate_book_cards([book_id])
             return True
 
     @staticmethod
     async def get_next_step_in_book_changes(book_id: int):
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             query = select(
                 case(
                     (Book.book_title.is_(None), "title"),
@@ -2466,12 +3217,81 @@ class AdminQueries:
             return result.scalar_one_or_none()
 
 
+# агрегаты по заказам из дневного среза stats_orders_daily
+_ORDERS_ROLLUP_QUERY = """
+    SELECT
+        -- Реализованная выручка (доставленные заказы)
+        COALESCE(SUM(revenue) FILTER (WHERE status = :completed AND day = CURRENT_DATE), 0) AS realized_revenue_today,
+        COALESCE(SUM(revenue) FILTER (WHERE status = :completed AND day >= DATE_TRUNC('month', CURRENT_DATE)), 0) AS realized_revenue_month,
+        COALESCE(SUM(revenue) FILTER (WHERE status = :completed), 0) AS realized_revenue_total,
+
+        -- Общий объем продаж (все заказы)
+        COALESCE(SUM(revenue) FILTER (WHERE day = CURRENT_DATE), 0) AS total_sales_today,
+        COALESCE(SUM(revenue) FILTER (WHERE day >= DATE_TRUNC('month', CURRENT_DATE)), 0) AS total_sales_month,
+        COALESCE(SUM(revenue), 0) AS total_sales_total,
+
+        -- Ожидаемая выручка (заказы в процессе)
+        COALESCE(SUM(revenue) FILTER (WHERE status IN (:delivering, :processing) AND day = CURRENT_DATE), 0) AS expected_revenue_today,
+        COALESCE(SUM(revenue) FILTER (WHERE status IN (:delivering, :processing) AND day >= DATE_TRUNC('month', CURRENT_DATE)), 0) AS expected_revenue_month,
+        COALESCE(SUM(revenue) FILTER (WHERE status IN (:delivering, :processing)), 0) AS expected_revenue_total,
+
+        -- Заказы
+        COALESCE(SUM(orders_count) FILTER (WHERE day = CURRENT_DATE), 0) AS orders_today,
+        COALESCE(SUM(orders_count) FILTER (WHERE day >= DATE_TRUNC('month', CURRENT_DATE)), 0) AS orders_month,
+        COALESCE(SUM(orders_count), 0) AS orders_total,
+        COALESCE(SUM(orders_count) FILTER (WHERE status = :delivering), 0) AS delivering_orders,
+        COALESCE(SUM(orders_count) FILTER (WHERE status = :processing), 0) AS processing_orders,
+        COALESCE(SUM(orders_count) FILTER (WHERE status = :completed), 0) AS completed_orders,
+        COALESCE(SUM(orders_count) FILTER (WHERE status = :cancelled AND day = CURRENT_DATE), 0) AS cancelled_today,
+        COALESCE(SUM(orders_count) FILTER (WHERE status = :cancelled AND day >= DATE_TRUNC('month', CURRENT_DATE)), 0) AS cancelled_month,
+        COALESCE(SUM(orders_count) FILTER (WHERE status = :cancelled), 0) AS cancelled_total
+    FROM stats_orders_daily
+"""
+
+_ORDER_STATUS_PARAMS = {
+    "completed": OrderStatus.COMPLETED.value,
+    "delivering": OrderStatus.DELIVERING.value,
+    "processing": OrderStatus.PROCESSING.value,
+    "cancelled": OrderStatus.CANCELLED.value,
+}
+
+_ORDERS_ROLLUP_KEYS = (
+    "orders_today",
+    "orders_month",
+    "orders_total",
+    "delivering_orders",
+    "processing_orders",
+    "completed_orders",
+    "cancelled_today",
+    "cancelled_month",
+    "cancelled_total",
+)
+
+
 class StatisticsQueries:
+    @staticmethod
+    async def _snapshot_info(session) -> Dict[str, Any]:
+        # время последнего пересчета срезов - для индикатора свежести в тексте
+        result = await session.execute(
+            text("""
+                SELECT refreshed_at, EXTRACT(EPOCH FROM NOW() - refreshed_at) AS age
+                FROM stats_totals
+            """)
+        )
+        row = result.first()
+        if not row:
+            return {"snapshot_at": None, "snapshot_age": None, "snapshot_stale": True}
+        age = int(row.age)
+        return {
+            "snapshot_at": row.refreshed_at.astimezone(),
+            "snapshot_age": age,
+            "snapshot_stale": age > STATS_STALE_AFTER,
+        }
+
     @staticmethod
     async def get_admin_support_statistics(telegram_id: int) -> dict:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             today = datetime.now().date()
-            today_start = datetime.combine(today, datetime.min.time())
             admin_query = select(Admin.admin_id, Admin.name).where(
                 Admin.telegram_id == telegram_id
             )
@@ -2483,45 +3303,43 @@ class StatisticsQueries:
             sql_query = text("""
                 SELECT 
                     -- ОБЩАЯ статистика системы
-                    COUNT(sa.appeal_id) as total_appeals,
-                    COUNT(CASE WHEN sa.created_date >= :today_start THEN 1 END) as appeals_today,
+                    COALESCE(SUM(appeals_count), 0) as total_appeals,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE day = CURRENT_DATE), 0) as appeals_today,
                     
                     -- Общая статистика по статусам за сегодня
-                    COUNT(CASE WHEN sa.created_date >= :today_start AND sa.status = 'new' THEN 1 END) as new_today,
-                    COUNT(CASE WHEN sa.created_date >= :today_start AND sa.status = 'in_work' THEN 1 END) as in_work_today,
-                    COUNT(CASE WHEN sa.created_date >= :today_start AND sa.status = 'closed_by_admin' THEN 1 END) as closed_by_admin_today,
-                    COUNT(CASE WHEN sa.created_date >= :today_start AND sa.status = 'closed_by_user' THEN 1 END) as closed_by_user_today,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE day = CURRENT_DATE AND status = 'new'), 0) as new_today,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE day = CURRENT_DATE AND status = 'in_work'), 0) as in_work_today,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE day = CURRENT_DATE AND status = 'closed_by_admin'), 0) as closed_by_admin_today,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE day = CURRENT_DATE AND status = 'closed_by_user'), 0) as closed_by_user_today,
                     
                     -- Статистика по приоритетам (только новые и в работе)
-                    COUNT(CASE WHEN sa.priority = 'critical' AND sa.status IN ('new', 'in_work') THEN 1 END) as critical_count,
-                    COUNT(CASE WHEN sa.priority = 'high' AND sa.status IN ('new', 'in_work') THEN 1 END) as high_count,
-                    COUNT(CASE WHEN sa.priority = 'normal' AND sa.status IN ('new', 'in_work') THEN 1 END) as normal_count,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE priority = 'critical' AND status IN ('new', 'in_work')), 0) as critical_count,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE priority = 'high' AND status IN ('new', 'in_work')), 0) as high_count,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE priority = 'normal' AND status IN ('new', 'in_work')), 0) as normal_count,
                     
                     -- ПЕРСОНАЛЬНАЯ статистика админа (обращения, которые он взял)
-                    COUNT(CASE WHEN sa.assigned_admin_id = :admin_id AND sa.status = 'in_work' THEN 1 END) as admin_active,
-                    COUNT(CASE WHEN sa.assigned_admin_id = :admin_id AND sa.status = 'closed_by_admin' THEN 1 END) as admin_closed,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE admin_id = :admin_id AND status = 'in_work'), 0) as admin_active,
+                    COALESCE(SUM(appeals_count) FILTER (WHERE admin_id = :admin_id AND status = 'closed_by_admin'), 0) as admin_closed,
                     
                     -- Статистика ответов админа (количество сообщений, которые он отправил сегодня)
-                    (SELECT COUNT(am.message_id) 
-                    FROM admin_messages am 
-                    WHERE am.admin_id = :admin_id 
-                    AND am.created_date >= :today_start) as admin_responses_today,
+                    (SELECT COALESCE(SUM(messages_count), 0)
+                    FROM stats_admin_messages_daily
+                    WHERE admin_id = :admin_id
+                    AND day = CURRENT_DATE) as admin_responses_today,
                     
                     -- Обращения, которые админ взял, но не ответил более 24 часов
-                    COUNT(CASE WHEN 
-                        sa.assigned_admin_id = :admin_id 
-                        AND sa.status = 'in_work' 
-                        AND sa.updated_at < NOW() - INTERVAL '24 hours'
-                        THEN 1 END) as admin_overdue
+                    COALESCE(SUM(overdue_count) FILTER (WHERE admin_id = :admin_id AND status = 'in_work'), 0) as admin_overdue
                     
-                FROM support_appeals sa
+                FROM stats_appeals_daily
             """)
-            params = {"today_start": today_start, "admin_id": admin_id}
+            params = {"admin_id": admin_id}
             result = await session.execute(sql_query, params)
             row = result.fetchone()
+            snapshot = await StatisticsQueries._snapshot_info(session)
             today_closed_total = (row.closed_by_admin_today or 0) + (
                 row.closed_by_user_today or 0
             )
+            generated_at = snapshot["snapshot_at"] or datetime.now()
             return {
                 # Общая статистика системы
                 "total_appeals": row.total_appeals or 0,
@@ -2543,112 +3361,41 @@ class StatisticsQueries:
                 "admin_overdue_appeals": row.admin_overdue or 0,
                 # Временные метки
                 "stats_date": today.strftime("%d.%m.%Y"),
-                "generated_at": datetime.now().strftime("%H:%M"),
+                "generated_at": generated_at.strftime("%H:%M"),
+                **snapshot,
             }
 
     @staticmethod
     async def get_comprehensive_stats() -> Dict[str, Any]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
-                query = text("""
-                    WITH revenue_stats AS (
-                        SELECT 
-                            -- Реализованная выручка (доставленные заказы)
-                            COALESCE(SUM(CASE WHEN status = 'Доставлен✅' AND DATE(created_date) = CURRENT_DATE THEN price ELSE 0 END), 0) as realized_revenue_today,
-                            COALESCE(SUM(CASE WHEN status = 'Доставлен✅' AND created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN price ELSE 0 END), 0) as realized_revenue_month,
-                            COALESCE(SUM(CASE WHEN status = 'Доставлен✅' THEN price ELSE 0 END), 0) as realized_revenue_total,
-                            
-                            -- Общий объем продаж (все заказы)
-                            COALESCE(SUM(CASE WHEN DATE(created_date) = CURRENT_DATE THEN price ELSE 0 END), 0) as total_sales_today,
-                            COALESCE(SUM(CASE WHEN created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN price ELSE 0 END), 0) as total_sales_month,
-                            COALESCE(SUM(price), 0) as total_sales_total,
-                            
-                            -- Ожидаемая выручка (заказы в процессе)
-                            COALESCE(SUM(CASE WHEN status IN ('🚚Доставляется', 'В обработке⌛') AND DATE(created_date) = CURRENT_DATE THEN price ELSE 0 END), 0) as expected_revenue_today,
-                            COALESCE(SUM(CASE WHEN status IN ('🚚Доставляется', 'В обработке⌛') AND created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN price ELSE 0 END), 0) as expected_revenue_month,
-                            COALESCE(SUM(CASE WHEN status IN ('🚚Доставляется', 'В обработке⌛') THEN price ELSE 0 END), 0) as expected_revenue_total
-                        FROM order_data
-                    ),
-                    order_stats AS (
-                        SELECT 
-                            COUNT(CASE WHEN DATE(created_date) = CURRENT_DATE THEN 1 END) as orders_today,
-                            COUNT(CASE WHEN created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN 1 END) as orders_month,
-                            COUNT(*) as orders_total,
-                            COUNT(CASE WHEN status = '🚚Доставляется' THEN 1 END) as delivering_orders,
-                            COUNT(CASE WHEN status = 'В обработке⌛' THEN 1 END) as processing_orders,
-                            COUNT(CASE WHEN status = 'Доставлен✅' THEN 1 END) as completed_orders,
-                            COUNT(CASE WHEN status = 'Отменен❌' AND DATE(created_date) = CURRENT_DATE THEN 1 END) as cancelled_today,
-                            COUNT(CASE WHEN status = 'Отменен❌' AND created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN 1 END) as cancelled_month,
-                            COUNT(CASE WHEN status = 'Отменен❌' THEN 1 END) as cancelled_total
-                        FROM order_data
-                    ),
-                    user_stats AS (
-                        SELECT COUNT(*) as total_users FROM users
-                    ),
-                    admin_stats AS (
-                        SELECT COUNT(*) as total_admins FROM admins
-                    ),
-                    genre_stats AS (
-                        SELECT 
-                            json_object_agg(book_genre, genre_count) as genres
-                        FROM (
-                            SELECT book_genre, COUNT(*) as genre_count
-                            FROM books 
-                            WHERE book_genre IS NOT NULL 
-                            GROUP BY book_genre
-                        ) genre_counts
-                    ),
-                    book_stats AS (
-                        SELECT 
-                            COUNT(*) as total_books,
-                            COUNT(CASE WHEN book_status = 'out of stock' THEN 1 END) as out_of_stock_books
-                        FROM books
-                    ),
+                query = text(f"""
+                    WITH order_stats AS ({_ORDERS_ROLLUP_QUERY}),
                     appeal_stats AS (
                         SELECT 
-                            COUNT(*) as active_appeals,
-                            COUNT(CASE WHEN priority = 'critical' THEN 1 END) as critical_appeals
-                        FROM support_appeals 
+                            COALESCE(SUM(appeals_count), 0) as active_appeals,
+                            COALESCE(SUM(appeals_count) FILTER (WHERE priority = 'critical'), 0) as critical_appeals
+                        FROM stats_appeals_daily 
                         WHERE status IN ('new', 'in_work')
-                    ),
-                    role_stats AS (
-                        SELECT 
-                            json_object_agg(role_name, role_count) as roles
-                        FROM (
-                            SELECT role_name, COUNT(*) as role_count
-                            FROM admins 
-                            GROUP BY role_name
-                        ) role_counts
                     )
                     
                     SELECT 
-                        rev.realized_revenue_today, rev.realized_revenue_month, rev.realized_revenue_total,
-                        rev.total_sales_today, rev.total_sales_month, rev.total_sales_total,
-                        rev.expected_revenue_today, rev.expected_revenue_month, rev.expected_revenue_total,
-                        os.orders_today, os.orders_month, os.orders_total, 
-                        os.delivering_orders, os.processing_orders, os.completed_orders,
-                        os.cancelled_today, os.cancelled_month, os.cancelled_total,
-                        us.total_users,
-                        ads.total_admins,
-                        bs.total_books,
-                        bs.out_of_stock_books,
-                        gs.genres as books_by_genre,
+                        os.*,
                         aps.active_appeals,
                         aps.critical_appeals,
-                        rls.roles as admins_by_role
-                    FROM revenue_stats rev,
-                        order_stats os, 
-                        user_stats us, 
-                        admin_stats ads, 
-                        book_stats bs, 
-                        genre_stats gs,
-                        appeal_stats aps,
-                        role_stats rls
+                        t.total_users,
+                        t.total_admins,
+                        t.total_books,
+                        t.out_of_stock_books,
+                        t.books_by_genre,
+                        t.admins_by_role
+                    FROM order_stats os, appeal_stats aps, stats_totals t
                 """)
-                result = await session.execute(query)
+                result = await session.execute(query, _ORDER_STATUS_PARAMS)
                 row = result.mappings().first()
                 if not row:
                     return {"error": "No data found"}
+                snapshot = await StatisticsQueries._snapshot_info(session)
                 return {
                     # Выручка
                     "realized_revenue_today": row["realized_revenue_today"] or 0,
@@ -2661,15 +3408,7 @@ class StatisticsQueries:
                     "expected_revenue_month": row["expected_revenue_month"] or 0,
                     "expected_revenue_total": row["expected_revenue_total"] or 0,
                     # Заказы
-                    "orders_today": row["orders_today"] or 0,
-                    "orders_month": row["orders_month"] or 0,
-                    "orders_total": row["orders_total"] or 0,
-                    "delivering_orders": row["delivering_orders"] or 0,
-                    "processing_orders": row["processing_orders"] or 0,
-                    "completed_orders": row["completed_orders"] or 0,
-                    "cancelled_today": row["cancelled_today"] or 0,
-                    "cancelled_month": row["cancelled_month"] or 0,
-                    "cancelled_total": row["cancelled_total"] or 0,
+                    **{key: row[key] or 0 for key in _ORDERS_ROLLUP_KEYS},
                     # Остальное
                     "total_users": row["total_users"] or 0,
                     "total_admins": row["total_admins"] or 0,
@@ -2679,11 +3418,51 @@ class StatisticsQueries:
                     "active_appeals": row["active_appeals"] or 0,
                     "critical_appeals": row["critical_appeals"] or 0,
                     "admins_by_role": row["admins_by_role"] or {},
+                    # Свежесть среза
+                    **snapshot,
                 }
             except Exception as e:
+                await session.rollback()
                 print(f"Error getting statistics: {e}")
                 return {"error": str(e)}
 
+    @staticmethod
+    async def get_best_sellers(limit: int = 10) -> List[Dict]:
+        async with use_session() as session:
+            sold = func.sum(OrderItem.quantity).label("sold_quantity")
+            result = await session.execute(
+                select(OrderItem.book_id, Book.book_title, sold)
+                .join(OrderData, OrderData.order_id == OrderItem.order_id)
+                .join(Book, Book.book_id == OrderItem.book_id)
+                .where(OrderData.status != OrderStatus.CANCELLED)
+                .group_by(OrderItem.book_id, Book.book_title)
+                .order_by(sold.desc())
+                .limit(limit)
+            )
+            return [dict(row) for row in result.mappings().all()]
+
+    @staticmethod
+    async def get_revenue_per_book(limit: int = 10) -> List[Dict]:
+        async with use_session() as session:
+            revenue = func.sum(OrderItem.quantity * OrderItem.unit_price).label(
+                "revenue"
+            )
+            result = await session.execute(
+                select(
+                    OrderItem.book_id,
+                    Book.book_title,
+                    func.sum(OrderItem.quantity).label("sold_quantity"),
+                    revenue,
+                )
+                .join(OrderData, OrderData.order_id == OrderItem.order_id)
+                .join(Book, Book.book_id == OrderItem.book_id)
+                .where(OrderData.status != OrderStatus.CANCELLED)
+                .group_by(OrderItem.book_id, Book.book_title)
+                .order_by(revenue.desc())
+                .limit(limit)
+            )
+            return [dict(row) for row in result.mappings().all()]
+
     @staticmethod
     async def _get_admins_by_role(session):
         """Дополнительный запрос для получения админов по ролям"""
@@ -2695,44 +3474,24 @@ class StatisticsQueries:
 
     @staticmethod
     async def orders_statistic() -> Dict[str, Any]:
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             try:
-                query = text("""
-                    WITH order_stats AS (
-                        SELECT 
-                            COUNT(CASE WHEN DATE(created_date) = CURRENT_DATE THEN 1 END) as orders_today,
-                            COUNT(CASE WHEN created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN 1 END) as orders_month,
-                            COUNT(*) as orders_total,
-                            COUNT(CASE WHEN status = '🚚Доставляется' THEN 1 END) as delivering_orders,
-                            COUNT(CASE WHEN status = 'В обработке⌛' THEN 1 END) as processing_orders,
-                            COUNT(CASE WHEN status = 'Доставлен✅' THEN 1 END) as completed_orders,
-                            COUNT(CASE WHEN status = 'Отменен❌' AND DATE(created_date) = CURRENT_DATE THEN 1 END) as cancelled_today,
-                            COUNT(CASE WHEN status = 'Отменен❌' AND created_date >= DATE_TRUNC('month', CURRENT_DATE) THEN 1 END) as cancelled_month,
-                            COUNT(CASE WHEN status = 'Отменен❌' THEN 1 END) as cancelled_total
-                        FROM order_data
-                    )
-                    SELECT * FROM order_stats
-                """)
-
-                result = await session.execute(query)
+                result = await session.execute(
+                    text(_ORDERS_ROLLUP_QUERY), _ORDER_STATUS_PARAMS
+                )
                 row = result.mappings().first()
 
                 if not row:
                     return {"error": "No data found"}
 
+                snapshot = await StatisticsQueries._snapshot_info(session)
                 return {
-                    "orders_today": row["orders_today"] or 0,
-                    "orders_month": row["orders_month"] or 0,
-                    "orders_total": row["orders_total"] or 0,
-                    "delivering_orders": row["delivering_orders"] or 0,
-                    "processing_orders": row["processing_orders"] or 0,
-                    "completed_orders": row["completed_orders"] or 0,
-                    "cancelled_today": row["cancelled_today"] or 0,
-                    "cancelled_month": row["cancelled_month"] or 0,
-                    "cancelled_total": row["cancelled_total"] or 0,
+                    **{key: row[key] or 0 for key in _ORDERS_ROLLUP_KEYS},
+                    **snapshot,
                 }
 
             except Exception as e:
+                await session.rollback()
                 print(f"Error getting orders statistics: {e}")
                 return {"error": str(e)}
 
@@ -2740,7 +3499,7 @@ class StatisticsQueries:
 class DBData:
     @staticmethod
     async def add_other_data():
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             book = Book(
                 book_title="La Divina Commedi",
                 book_year=1321,
@@ -2788,7 +3547,7 @@ class DBData:
 
     @staticmethod
     async def fake_data():
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             # Создаем основного пользователя и админа
             user = User(
                 username="@sentrybuster",
@@ -2836,46 +3595,58 @@ class DBData:
             # session.add_all(books)
             # await session.flush()
 
-            for author_data in REAL_AUTHORS:
-                author = Author(
-                    author_name=author_data["author_name"],
-                    author_country=author_data["author_country"],
-                    author_add_date=author_data.get("author_add_date", datetime.now()),
-                )
-                session.add(author)
-                await session.flush()
-            await session.commit()
-
-            for book_data in REAL_BOOKS:
-                book = Book(
-                    book_title=book_data["book_title"],
-                    book_year=book_data["book_year"],
-                    author_id=book_data["author_id"],
-                    book_status=book_data["book_status"],
-                    book_price=book_data["book_price"],
-                    book_photo_id=book_data["book_photo_id"],
-                    book_in_stock=book_data["book_in_stock"],
-                    book_genre=book_data["book_genre"],
-                    book_quantity=book_data["book_quantity"],
-                )
-                session.add(book)
-                await session.flush()
+            # Авторы и книги - многострочными INSERT, порядок сохраняется,
+            # поэтому author_id из REAL_BOOKS совпадают с id из REAL_AUTHORS
+            await session.execute(
+                insert(Author),
+                [
+                    {
+                        "author_name": author_data["author_name"],
+                        "author_country": author_data["author_country"],
+                        "author_add_date": author_data.get(
+                            "author_add_date", datetime.now()
+                        ),
+                    }
+                    for author_data in REAL_AUTHORS
+                ],
+            )
+            book_columns = (
+                "book_title",
+                "book_year",
+                "author_id",
+                "book_status",
+                "book_price",
+                "book_photo_id",
+                "book_in_stock",
+                "book_genre",
+                "book_quantity",
+            )
+            await session.execute(
+                insert(Book),
+                [
+                    {column: book_data[column] for column in book_columns}
+                    for book_data in REAL_BOOKS
+                ],
+            )
             await session.commit()
 
             # Создаем дополнительных пользователей
-            users = []
-            for _ in range(25):
-                user = User(
-                    username=fake.user_name()[:30],
-                    user_first_name=fake.name()[:30],
-                    telegram_id=random.randint(38712, 129312239),
-                )
-                cart = Cart(telegram_id=user.telegram_id)
-                user.cart = cart
-                users.append(user)
-                session.add(user)
-
-            await session.flush()
+            telegram_ids = random.sample(range(38712, 129312239), 25)
+            await session.execute(
+                insert(User),
+                [
+                    {
+                        "username": fake.user_name()[:30],
+                        "user_first_name": fake.name()[:30],
+                        "telegram_id": telegram_id,
+                    }
+                    for telegram_id in telegram_ids
+                ],
+            )
+            await session.execute(
+                insert(Cart),
+                [{"telegram_id": telegram_id} for telegram_id in telegram_ids],
+            )
 
             # # Создаем отзывы
             # book_ids = [book.book_id for book in books]
@@ -3110,7 +3881,7 @@ class DBData:
     @staticmethod
     async def clear_all_data():
         """Очистка ВСЕХ тестовых данных"""
-        async with AsyncSessionLocal() as session:
+        async with use_session() as session:
             # Удаляем в правильном порядке (сначала дочерние таблицы)
             tables = [
                 AdminMessage,
@@ -3129,4 +3900,7 @@ class DBData:
                 await session.execute(table.__table__.delete())
 
             await session.commit()
+            cart_cache.clear()
+            admin_cache.clear()
+            book_card_cache.clear()
             print("✅ Все тестовые данные очищены ✅")
@@ -3,12 +3,12 @@
 import random
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from models import Review, Book, User
 from review_templates import REVIEW_TEMPLATES
 
 
-def generate_review(rating: int):
+def generate_review(rating: int, rng: random.Random = random):
     """Генерация одного отзыва на основе рейтинга"""
     if rating >= 4:
         pool = REVIEW_TEMPLATES["positive"]
@@ -17,10 +17,24 @@ def generate_review(rating: int):
     else:
         pool = REVIEW_TEMPLATES["negative"]
 
-    review = random.choice(pool)
+    review = rng.choice(pool)
     return review["title"], review["body"]
 
 
+def generate_rating(rng: random.Random = random) -> int:
+    """Рейтинг с перекосом в положительную сторону"""
+    rand = rng.random()
+    if rand <= 0.40:  # 40% - 5
+        return 5
+    elif rand <= 0.70:  # 30% - 4
+        return 4
+    elif rand <= 0.90:  # 20% - 3
+        return 3
+    elif rand <= 0.95:  # 5% - 2
+        return 2
+    return 1  # 5% - 1
+
+
 async def generate_reviews(session: AsyncSession):
     """Простая генерация отзывов для всех книг"""
 
@@ -45,19 +59,7 @@ async def generate_reviews(session: AsyncSession):
         for _ in range(random.randint(5, 8)):
             user_id = random.choice(user_ids)
 
-            # Генерируем рейтинг
-            rand = random.random()
-            if rand <= 0.40:  # 40% - 5
-                rating = 5
-            elif rand <= 0.70:  # 30% - 4
-                rating = 4
-            elif rand <= 0.90:  # 20% - 3
-                rating = 3
-            elif rand <= 0.95:  # 5% - 2
-                rating = 2
-            else:  # 5% - 1
-                rating = 1
-
+            rating = generate_rating()
             title, body = generate_review(rating)
 
             # Случайная дата за последний год
@@ -67,22 +69,22 @@ async def generate_reviews(session: AsyncSession):
                 days=random_days, hours=random_hours
             )
 
-            review = Review(
-                book_id=book_id,
-                telegram_id=user_id,
-                review_rating=rating,
-                review_title=title,
-                review_body=body,
-                finished=True,
-                published=True,
-                created_at=created_at,
-                updated_at=created_at,
+            reviews.append(
+                {
+                    "book_id": book_id,
+                    "telegram_id": user_id,
+                    "review_rating": rating,
+                    "review_title": title,
+                    "review_body": body,
+                    "finished": True,
+                    "published": True,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                }
             )
 
-            reviews.append(review)
-
-    # Добавляем все отзывы
-    session.add_all(reviews)
+    # Добавляем все отзывы одним многострочным INSERT вместо ORM-объектов
+    await session.execute(insert(Review), reviews)
     await session.commit()
 
     print(f"✅ Сгенерировано {len(reviews)} отзывов для {len(book_ids)} книг")
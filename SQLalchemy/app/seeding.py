@@ -0,0 +1,497 @@
+# seeding.py
+# Генератор больших объемов тестовых данных для нагрузочных прогонов.
+# Строки генерируются пачками и пишутся через COPY (asyncpg
+# copy_records_to_table), один и тот же --seed дает одинаковый набор данных
+# на одинаковой исходной базе.
+#
+#   python seeding.py --users 50000 --books 5000 --reviews 1000000 --orders 200000 --appeals 20000
+#   python seeding.py --rebuild-ratings
+#   python seeding.py --backfill-order-items
+
+import argparse
+import asyncio
+import json
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from faker import Faker
+from sqlalchemy import text
+from database import async_engine
+from models import (
+    AppealStatus,
+    BookGenre,
+    BookStatus,
+    OrderStatus,
+    Payment,
+    PriorityStatus,
+)
+from queries.core import (
+    backfill_order_items,
+    rebuild_book_ratings,
+    refresh_stats_views,
+)
+from review_generator_simple import generate_rating, generate_review
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_SEED = 42
+# диапазон telegram_id сгенерированных пользователей, чтобы не пересекаться с
+# реальными аккаунтами из fake_data
+SEED_TELEGRAM_ID_START = 9_000_000_000
+# все даты отсчитываются от фиксированного момента - иначе данные зависят от
+# времени запуска
+SEED_NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+ORDER_STATUS_WEIGHTS = {
+    OrderStatus.COMPLETED: 60,
+    OrderStatus.DELIVERING: 15,
+    OrderStatus.PROCESSING: 15,
+    OrderStatus.CANCELLED: 10,
+}
+APPEAL_STATUS_WEIGHTS = {
+    AppealStatus.NEW: 40,
+    AppealStatus.IN_WORK: 30,
+    AppealStatus.CLOSED_BY_USER: 15,
+    AppealStatus.CLOSED_BY_ADMIN: 15,
+}
+
+
+def _chunks(total: int, size: int):
+    for start in range(0, total, size):
+        yield start, min(size, total - start)
+
+
+def _weighted(rng: random.Random, weights: dict):
+    return rng.choices(list(weights), weights=list(weights.values()))[0].value
+
+
+class BulkSeeder:
+    def __init__(self, seed: int = DEFAULT_SEED, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.rng = random.Random(seed)
+        self.fake = Faker("ru_RU")
+        self.fake.seed_instance(seed)
+        self.batch_size = batch_size
+
+    def _past(self, max_days: int = 365) -> datetime:
+        return SEED_NOW - timedelta(seconds=self.rng.randint(0, max_days * 86400))
+
+    @staticmethod
+    async def _copy(conn, table: str, columns: tuple, records: list):
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table, records=records, columns=columns
+        )
+
+    @staticmethod
+    async def _reserve_ids(conn, table: str, column: str, count: int) -> list[int]:
+        # id заранее берем из последовательности, чтобы дочерние строки
+        # (позиции заказов, сообщения) ушли в том же COPY-проходе
+        result = await conn.execute(
+            text(
+                "SELECT nextval(pg_get_serial_sequence(:table, :column)) "
+                "FROM generate_series(1, :count)"
+            ),
+            {"table": table, "column": column, "count": count},
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def _scalars(conn, query: str) -> list:
+        result = await conn.execute(text(query))
+        return list(result.scalars().all())
+
+    async def seed_users(self, count: int) -> int:
+        async with async_engine.begin() as conn:
+            max_telegram_id = await self._scalars(
+                conn, "SELECT COALESCE(MAX(telegram_id), 0) FROM users"
+            )
+            start = max(SEED_TELEGRAM_ID_START, max_telegram_id[0] + 1)
+            payments = [payment.value for payment in Payment]
+            for offset, size in _chunks(count, self.batch_size):
+                users, carts, addresses = [], [], []
+                for i in range(offset, offset + size):
+                    telegram_id = start + i
+                    registered = self._past()
+                    users.append(
+                        (
+                            telegram_id,
+                            self.fake.user_name()[:30],
+                            self.fake.first_name()[:50],
+                            registered,
+                            Decimal(self.rng.randint(0, 20000)),
+                        )
+                    )
+                    carts.append((telegram_id,))
+                    addresses.append(
+                        (
+                            telegram_id,
+                            self.fake.first_name(),
+                            f"8{self.rng.randint(10**9, 10**10 - 1)}",
+                            self.fake.city(),
+                            self.fake.street_name(),
+                            str(self.rng.randint(1, 200)),
+                            str(self.rng.randint(1, 500)),
+                            self.rng.choice(payments),
+                            True,
+                            registered,
+                            registered,
+                        )
+                    )
+                await self._copy(
+                    conn,
+                    "users",
+                    (
+                        "telegram_id",
+                        "username",
+                        "user_first_name",
+                        "registration_date",
+                        "user_balance",
+                    ),
+                    users,
+                )
+                await self._copy(conn, "carts", ("telegram_id",), carts)
+                await self._copy(
+                    conn,
+                    "users_addresses",
+                    (
+                        "telegram_id",
+                        "name",
+                        "phone",
+                        "city",
+                        "street",
+                        "house",
+                        "apartment",
+                        "payment",
+                        "is_complete",
+                        "created_date",
+                        "updated_at",
+                    ),
+                    addresses,
+                )
+        return count
+
+    async def seed_books(self, count: int) -> int:
+        genres = [genre.value for genre in BookGenre]
+        async with async_engine.begin() as conn:
+            author_ids = await self._reserve_ids(
+                conn, "authors", "author_id", max(1, count // 20)
+            )
+            await self._copy(
+                conn,
+                "authors",
+                ("author_id", "author_name", "author_country", "author_add_date"),
+                [
+                    (
+                        author_id,
+                        self.fake.name()[:90],
+                        self.fake.country()[:80],
+                        self._past(),
+                    )
+                    for author_id in author_ids
+                ],
+            )
+            for offset, size in _chunks(count, self.batch_size):
+                books = []
+                for _ in range(size):
+                    # ~10% книг закончились
+                    quantity = 0 if self.rng.random() < 0.1 else self.rng.randint(1, 20)
+                    status = BookStatus.IN_STOCK if quantity else BookStatus.OUT_OF_STOCK
+                    books.append(
+                        (
+                            self.fake.sentence(nb_words=3)[:-1],
+                            self.rng.randint(1800, 2024),
+                            self.rng.choice(author_ids),
+                            status.value,
+                            quantity > 0,
+                            self.rng.randint(300, 3000),
+                            self.rng.choice(genres),
+                            quantity,
+                            self._past(),
+                        )
+                    )
+                await self._copy(
+                    conn,
+                    "books",
+                    (
+                        "book_title",
+                        "book_year",
+                        "author_id",
+                        "book_status",
+                        "book_in_stock",
+                        "book_price",
+                        "book_genre",
+                        "book_quantity",
+                        "book_add_date",
+                    ),
+                    books,
+                )
+        return count
+
+    async def seed_reviews(self, count: int) -> int:
+        async with async_engine.begin() as conn:
+            book_ids = await self._scalars(conn, "SELECT book_id FROM books")
+            user_ids = await self._scalars(conn, "SELECT telegram_id FROM users")
+            if not book_ids or not user_ids:
+                print("Нет книг или пользователей для отзывов")
+                return 0
+            for offset, size in _chunks(count, self.batch_size):
+                reviews = []
+                for _ in range(size):
+                    rating = generate_rating(self.rng)
+                    title, body = generate_review(rating, self.rng)
+                    created_at = self._past()
+                    reviews.append(
+                        (
+                            self.rng.choice(book_ids),
+                            self.rng.choice(user_ids),
+                            rating,
+                            title,
+                            body,
+                            True,
+                            True,
+                            created_at,
+                            created_at,
+                        )
+                    )
+                await self._copy(
+                    conn,
+                    "reviews",
+                    (
+                        "book_id",
+                        "telegram_id",
+                        "review_rating",
+                        "review_title",
+                        "review_body",
+                        "finished",
+                        "published",
+                        "created_at",
+                        "updated_at",
+                    ),
+                    reviews,
+                )
+        return count
+
+    async def seed_orders(self, count: int) -> int:
+        async with async_engine.begin() as conn:
+            result = await conn.execute(text("SELECT book_id, book_price FROM books"))
+            prices = {book_id: price or 0 for book_id, price in result.all()}
+            result = await conn.execute(
+                text(
+                    "SELECT telegram_id, address_id FROM users_addresses "
+                    "WHERE is_complete ORDER BY address_id"
+                )
+            )
+            addresses = result.all()
+            if not prices or not addresses:
+                print("Нет книг или адресов для заказов")
+                return 0
+            book_ids = sorted(prices)
+            for offset, size in _chunks(count, self.batch_size):
+                order_ids = await self._reserve_ids(
+                    conn, "order_data", "order_id", size
+                )
+                orders, items = [], []
+                for order_id in order_ids:
+                    telegram_id, address_id = self.rng.choice(addresses)
+                    books = self.rng.sample(
+                        book_ids, min(len(book_ids), self.rng.randint(1, 4))
+                    )
+                    quantities = [self.rng.randint(1, 3) for _ in books]
+                    created = self._past()
+                    orders.append(
+                        (
+                            order_id,
+                            address_id,
+                            telegram_id,
+                            json.dumps(books),
+                            json.dumps(quantities),
+                            sum(prices[b] * q for b, q in zip(books, quantities)),
+                            _weighted(self.rng, ORDER_STATUS_WEIGHTS),
+                            created,
+                            created,
+                        )
+                    )
+                    items.extend(
+                        (order_id, book_id, quantity, prices[book_id], position)
+                        for position, (book_id, quantity) in enumerate(
+                            zip(books, quantities), start=1
+                        )
+                    )
+                await self._copy(
+                    conn,
+                    "order_data",
+                    (
+                        "order_id",
+                        "address_id",
+                        "telegram_id",
+                        "book_id",
+                        "quantity",
+                        "price",
+                        "status",
+                        "created_date",
+                        "updated_at",
+                    ),
+                    orders,
+                )
+                await self._copy(
+                    conn,
+                    "order_items",
+                    ("order_id", "book_id", "quantity", "unit_price", "position"),
+                    items,
+                )
+        return count
+
+    async def seed_appeals(self, count: int) -> int:
+        priorities = [priority.value for priority in PriorityStatus]
+        async with async_engine.begin() as conn:
+            user_ids = await self._scalars(conn, "SELECT telegram_id FROM users")
+            admin_ids = await self._scalars(conn, "SELECT admin_id FROM admins")
+            if not user_ids:
+                print("Нет пользователей для обращений")
+                return 0
+            for offset, size in _chunks(count, self.batch_size):
+                appeal_ids = await self._reserve_ids(
+                    conn, "support_appeals", "appeal_id", size
+                )
+                appeals, user_messages, admin_messages = [], [], []
+                for appeal_id in appeal_ids:
+                    status = _weighted(self.rng, APPEAL_STATUS_WEIGHTS)
+                    admin_id = (
+                        self.rng.choice(admin_ids)
+                        if admin_ids and status != AppealStatus.NEW
+                        else None
+                    )
+                    telegram_id = self.rng.choice(user_ids)
+                    created = self._past(90)
+                    updated = created + timedelta(hours=self.rng.randint(0, 48))
+                    appeals.append(
+                        (
+                            appeal_id,
+                            telegram_id,
+                            created,
+                            updated,
+                            status,
+                            admin_id,
+                            self.rng.choice(priorities),
+                        )
+                    )
+                    for j in range(self.rng.randint(1, 3)):
+                        user_messages.append(
+                            (
+                                telegram_id,
+                                self.fake.sentence(nb_words=12),
+                                created + timedelta(minutes=j * 10),
+                                appeal_id,
+                            )
+                        )
+                    if admin_id:
+                        for k in range(self.rng.randint(1, 2)):
+                            admin_messages.append(
+                                (
+                                    admin_id,
+                                    self.fake.sentence(nb_words=10),
+                                    appeal_id,
+                                    created + timedelta(hours=1 + k),
+                                )
+                            )
+                await self._copy(
+                    conn,
+                    "support_appeals",
+                    (
+                        "appeal_id",
+                        "telegram_id",
+                        "created_date",
+                        "updated_at",
+                        "status",
+                        "assigned_admin_id",
+                        "priority",
+                    ),
+                    appeals,
+                )
+                await self._copy(
+                    conn,
+                    "user_messages",
+                    ("telegram_id", "message", "created_date", "appeal_id"),
+                    user_messages,
+                )
+                if admin_messages:
+                    await self._copy(
+                        conn,
+                        "admin_messages",
+                        ("admin_id", "admin_message", "appeal_id", "created_date"),
+                        admin_messages,
+                    )
+        return count
+
+    async def run(
+        self,
+        users: int = 0,
+        books: int = 0,
+        reviews: int = 0,
+        orders: int = 0,
+        appeals: int = 0,
+    ) -> dict:
+        # порядок важен: отзывы, заказы и обращения ссылаются на книги и пользователей
+        created = {
+            "users": await self.seed_users(users) if users else 0,
+            "books": await self.seed_books(books) if books else 0,
+            "reviews": await self.seed_reviews(reviews) if reviews else 0,
+            "orders": await self.seed_orders(orders) if orders else 0,
+            "appeals": await self.seed_appeals(appeals) if appeals else 0,
+        }
+        # отзывы пишутся COPY в обход ReviewQueries - агрегаты книг пересчитываем
+        if reviews:
+            await rebuild_book_ratings()
+        await refresh_stats_views()
+        return created
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Генерация тестовых данных")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--books", type=int, default=500)
+    parser.add_argument("--reviews", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--appeals", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--rebuild-ratings",
+        action="store_true",
+        help="только пересчитать рейтинги книг по отзывам, без генерации",
+    )
+    parser.add_argument(
+        "--backfill-order-items",
+        action="store_true",
+        help="только перенести старые заказы из JSON-колонок в order_items",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if args.rebuild_ratings:
+        updated = await rebuild_book_ratings()
+        print(f"✅ Пересчитаны рейтинги книг: {updated}")
+        await async_engine.dispose()
+        return
+    if args.backfill_order_items:
+        inserted = await backfill_order_items(args.batch_size)
+        print(f"✅ Перенесено позиций заказов в order_items: {inserted}")
+        await async_engine.dispose()
+        return
+    seeder = BulkSeeder(seed=args.seed, batch_size=args.batch_size)
+    started = datetime.now()
+    created = await seeder.run(
+        users=args.users,
+        books=args.books,
+        reviews=args.reviews,
+        orders=args.orders,
+        appeals=args.appeals,
+    )
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"✅ Сгенерировано за {elapsed:.1f} сек: {created}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,7 @@
 from datetime import datetime
 from models import OrderStatus, Admin, AdminPermission, AdminRole
 from utils.admin_utils import PermissionChecker
+from utils.text_chunker import TELEGRAM_TEXT_LIMIT, chunk_lines, take_lines, utf16_len
 
 
 async def get_book_details(book_data: dict):
@@ -313,44 +314,108 @@ status_dict = {
 }
 
 
-async def text_appeal_split_messages(appeal) -> tuple[list[str], str]:
-    if not appeal:
-        return [], "❌ Обращение не найдено"
+HISTORY_HEADER = "*📝 История переписки:*\n\n"
+
+
+def _history_header(transcript: dict) -> str:
+    if transcript.get("older"):
+        return f"*📝 Последние {len(transcript['messages'])} сообщений переписки:*\n\n"
+    return HISTORY_HEADER
+
+
+def _older_header(appeal_id: int, transcript: dict) -> str:
+    return (
+        f"*📜 Более ранние сообщения обращения #{appeal_id} "
+        f"({len(transcript['messages'])}):*\n\n"
+    )
+
+
+def _continuation_header(appeal_id: int) -> str:
+    return f"*📄 Продолжение истории обращения #{appeal_id}:*\n\n"
+
+
+def _user_transcript_lines(messages):
+    for msg in messages:
+        sender = "👤 Вы" if msg["kind"] == "user" else "🛠 Поддержка"
+        yield f"{sender} ({msg['created_date'].strftime('%H:%M')}):\n{msg['body']}\n\n"
+
+
+def _admin_transcript_lines(messages, admin_name: str = None):
+    for msg in messages:
+        if msg["kind"] == "user":
+            sender = "👤 Пользователь"
+        elif not msg["admin_name"]:
+            sender = "🛠 Поддержка"
+        elif admin_name and msg["admin_name"] == admin_name:
+            sender = f"👨‍💻 {msg['admin_name']} (Вы)"
+        else:
+            sender = f"👨‍💻 {msg['admin_name']}"
+        yield f"{sender} ({msg['created_date'].strftime('%H:%M')}):\n{msg['body']}\n\n"
+
+
+def _split_history(appeal_id: int, header: str, lines) -> list[str]:
+    return chunk_lines(
+        lines, header=header, continuation=_continuation_header(appeal_id)
+    )
+
+
+def _inline_or_split(
+    main_text: str, parts: list[str], transcript: dict
+) -> tuple[list[str], str]:
+    # короткая переписка помещается прямо в главное сообщение; при неполной
+    # истории - нет, кнопка "ранние сообщения" висит на первой части
+    if (
+        not transcript.get("older")
+        and len(parts) == 1
+        and utf16_len(main_text) + 2 + utf16_len(parts[0]) <= TELEGRAM_TEXT_LIMIT
+    ):
+        return [], main_text + "\n\n" + parts[0]
+    return parts, main_text
+
+
+def appeal_header_text(appeal) -> str:
     status_text = status_dict.get(appeal.status, appeal.status)
-    main_text = f"""📨 *Обращение #{appeal.appeal_id}* {status_text}
+    return f"""📨 *Обращение #{appeal.appeal_id}* {status_text}
 📅 Создано: {appeal.created_date.strftime("%d.%m.%Y %H:%M")} 
 """
-    if not appeal.user_messages and not appeal.admin_messages:
+
+
+async def text_appeal_split_messages(appeal, transcript: dict) -> tuple[list[str], str]:
+    if not appeal:
+        return [], "❌ Обращение не найдено"
+    main_text = appeal_header_text(appeal)
+    if not transcript["messages"]:
         return [], main_text + "\n\n📭 *Пока нет сообщений*"
-    all_messages = []
-    for msg in appeal.user_messages:
-        all_messages.append(("👤 Вы", msg.created_date, msg.message))
-    for msg in appeal.admin_messages:
-        all_messages.append(("🛠 Поддержка", msg.created_date, msg.admin_message))
-    all_messages.sort(key=lambda x: x[1])
-    history_text = "*📝 История переписки:*\n\n"
-    for sender, time, text in all_messages:
-        message_line = f"{sender} ({time.strftime('%H:%M')}):\n{text}\n\n"
-        history_text += message_line
-    full_text = main_text + "\n\n" + history_text
-    if len(full_text) <= 4000:
-        return [], full_text
-    message_parts = []
-    current_part = "*📝 История переписки:*\n\n"
-    for sender, time, text in all_messages:
-        message_line = f"{sender} ({time.strftime('%H:%M')}):\n{text}\n\n"
-        if len(current_part) + len(message_line) > 4000:
-            message_parts.append(current_part)
-            current_part = f"*📄 Продолжение истории обращения #{appeal.appeal_id}:*\n\n{message_line}"
-        else:
-            current_part += message_line
-    if current_part and current_part != "*📝 История переписки:*\n\n":
-        message_parts.append(current_part)
-    return message_parts, main_text
+    parts = _split_history(
+        appeal.appeal_id,
+        _history_header(transcript),
+        _user_transcript_lines(transcript["messages"]),
+    )
+    return _inline_or_split(main_text, parts, transcript)
+
+
+def text_appeal_tail_parts(appeal_id: int, transcript: dict) -> list[str]:
+    # новые сообщения, дописываемые под уже показанной перепиской
+    return _split_history(
+        appeal_id,
+        _continuation_header(appeal_id),
+        _user_transcript_lines(transcript["messages"]),
+    )
+
+
+def older_history_parts(
+    appeal_id: int, transcript: dict, admin_name: str = None, for_admin: bool = False
+) -> list[str]:
+    # окно ранних сообщений по кнопке "ранние сообщения"
+    if for_admin:
+        lines = _admin_transcript_lines(transcript["messages"], admin_name)
+    else:
+        lines = _user_transcript_lines(transcript["messages"])
+    return _split_history(appeal_id, _older_header(appeal_id, transcript), lines)
 
 
 async def admin_appeal_split_messages(
-    appeal, admin_name: str = None
+    appeal, transcript: dict, admin_name: str = None
 ) -> tuple[list[str], str]:
     if not appeal:
         return [], "❌ Обращение не найдено"
@@ -371,56 +436,14 @@ async def admin_appeal_split_messages(
 """
     admin_info = f"Администратор {admin_name.capitalize()}"
     main_text += f"{admin_info}\n"
-    if not appeal.user_messages and not appeal.admin_messages:
+    if not transcript["messages"]:
         return [], main_text + "\n\n📭 *Пока нет сообщений*"
-    all_messages = []
-    for msg in appeal.user_messages:
-        all_messages.append(
-            {
-                "type": "user",
-                "sender": "👤 Пользователь",
-                "time": msg.created_date,
-                "text": msg.message,
-            }
-        )
-    for msg in appeal.admin_messages:
-        sender_name = "🛠 Поддержка"
-        if msg.admin and admin_name and msg.admin.name == admin_name:
-            sender_name = f"👨‍💻 {msg.admin.name} (Вы)"
-        elif msg.admin:
-            sender_name = f"👨‍💻 {msg.admin.name}"
-        all_messages.append(
-            {
-                "type": "admin",
-                "sender": sender_name,
-                "time": msg.created_date,
-                "text": msg.admin_message,
-            }
-        )
-    all_messages.sort(key=lambda x: x["time"])
-    history_text = "*📝 История переписки:*\n\n"
-    for msg in all_messages:
-        message_line = (
-            f"{msg['sender']} ({msg['time'].strftime('%H:%M')}):\n{msg['text']}\n\n"
-        )
-        history_text += message_line
-    full_text = main_text + "\n\n" + history_text
-    if len(full_text) <= 4000:
-        return [], full_text
-    message_parts = []
-    current_part = "*📝 История переписки:*\n\n"
-    for msg in all_messages:
-        message_line = (
-            f"{msg['sender']} ({msg['time'].strftime('%H:%M')}):\n{msg['text']}\n\n"
-        )
-        if len(current_part) + len(message_line) > 4000:
-            message_parts.append(current_part)
-            current_part = f"*📄 Продолжение истории обращения #{appeal.appeal_id}:*\n\n{message_line}"
-        else:
-            current_part += message_line
-    if current_part and current_part != "*📝 История переписки:*\n\n":
-        message_parts.append(current_part)
-    return message_parts, main_text
+    parts = _split_history(
+        appeal.appeal_id,
+        _history_header(transcript),
+        _admin_transcript_lines(transcript["messages"], admin_name),
+    )
+    return _inline_or_split(main_text, parts, transcript)
 
 
 async def admin_message_rules() -> str:
@@ -485,6 +508,19 @@ GENRES = {
 }
 
 
+def snapshot_freshness_text(stats: dict) -> str:
+    # статистика читается из срезов, которые пересчитываются в фоне
+    snapshot_at = stats.get("snapshot_at")
+    if snapshot_at is None:
+        return "⚠️ Статистика еще не рассчитана"
+    age_minutes = (stats.get("snapshot_age") or 0) // 60
+    text = f"Данные на {snapshot_at.strftime('%d.%m.%Y %H:%M')}"
+    text += f" ({age_minutes} мин назад)" if age_minutes else " (только что)"
+    if stats.get("snapshot_stale"):
+        text = f"⚠️ {text}, данные устарели"
+    return text
+
+
 async def admin_all_statistic_text(stats: dict) -> str:
     # Текущая дата и время
     current_time = datetime.now().strftime("%d.%m.%Y %H:%M")
@@ -536,6 +572,7 @@ async def admin_all_statistic_text(stats: dict) -> str:
 
     text = f"""<b>📊 Общая статистика магазина</b>
 <i>Обновлено: {current_time}</i>
+<i>{snapshot_freshness_text(stats)}</i>
 
 <b>💰 Финансы:</b>
     • Реализованная выручка:
@@ -577,6 +614,9 @@ async def admin_all_statistic_text(stats: dict) -> str:
     return text
 
 
+ORDER_BOOKS_MORE = "   … и еще {count} поз.\n"
+
+
 async def admin_format_order_details(order_details: dict) -> str:
     order_id = order_details.get("order_id")
     total_price = order_details.get("total_price", 0)
@@ -613,15 +653,16 @@ async def admin_format_order_details(order_details: dict) -> str:
     if address_info.get("apartment"):
         address_parts.append(f"кв. {address_info['apartment']}")
     address_text = ", ".join(address_parts) if address_parts else "Не указан"
-    books_text = ""
+    book_lines = []
     total_items = 0
     for i, book in enumerate(books, 1):
         title = book.get("title", "Неизвестная книга")
         price = book.get("price", 0)
         quantity = book.get("quantity", 1)
         total_items += quantity
-        books_text += f"{i}. {title}\n"
-        books_text += f"   └ {quantity} шт. × {price}₽ = {quantity * price}₽\n"
+        book_lines.append(
+            f"{i}. {title}\n   └ {quantity} шт. × {price}₽ = {quantity * price}₽\n"
+        )
     cancellation_info = ""
     if status == OrderStatus.CANCELLED and reason_to_cancellation:
         admin_display = (
@@ -655,10 +696,21 @@ async def admin_format_order_details(order_details: dict) -> str:
 └ Комментарий: {comment}
 
 <b>📚 Состав заказа:</b>
-{books_text if books_text else "   └ Нет информации о товарах"}"""
-    if cancellation_info:
-        text += cancellation_info
-    return text
+"""
+    if not book_lines:
+        return text + "   └ Нет информации о товарах" + cancellation_info
+    # большой заказ не влезает в одно сообщение с клавиатурой - обрезаем
+    # список книг по целым позициям
+    room = (
+        TELEGRAM_TEXT_LIMIT
+        - utf16_len(text)
+        - utf16_len(cancellation_info)
+        - utf16_len(ORDER_BOOKS_MORE.format(count=len(book_lines)))
+    )
+    books_text, shown = take_lines(book_lines, room)
+    if shown < len(book_lines):
+        books_text += ORDER_BOOKS_MORE.format(count=len(book_lines) - shown)
+    return text + books_text + cancellation_info
 
 
 def admin_order_statistic(stats: dict) -> str:
@@ -675,6 +727,7 @@ def admin_order_statistic(stats: dict) -> str:
 
     text = f"""<b>🛒 УПРАВЛЕНИЕ ЗАКАЗАМИ</b>
 <i>Обновлено: {current_time}</i>
+<i>{snapshot_freshness_text(stats)}</i>
 
 <b>📦 Статистика заказов:</b>
     • Сегодня: {orders_today}
@@ -723,6 +776,7 @@ async def admin_personal_support_statistic(statistic_data: dict) -> str:
 📊 СТАТИСТИКА ПОДДЕРЖКИ
 👤 {admin_name}
 📅 {statistic_data["stats_date"]} {statistic_data["generated_at"]}
+🕒 {snapshot_freshness_text(statistic_data)}
 
 {priority_text}
 {overdue_msg}
@@ -0,0 +1,103 @@
+import time
+from collections import deque
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# сколько последних ожиданий соединения держим для перцентилей
+WAIT_SAMPLES = 1000
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidated = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._waits: deque = deque(maxlen=WAIT_SAMPLES)
+
+    def on_acquire(self, waited: float, overflowed: bool):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+        self.overflow_events += overflowed
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        self._waits.append(waited)
+
+    def on_release(self):
+        self.checked_out = max(0, self.checked_out - 1)
+
+    def _percentile(self, percent: int) -> float:
+        if not self._waits:
+            return 0.0
+        ordered = sorted(self._waits)
+        return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+    def snapshot(self, pool=None) -> dict:
+        data = {
+            "checkouts": self.checkouts,
+            "checked_out": self.checked_out,
+            "max_checked_out": self.max_checked_out,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "invalidated": self.invalidated,
+            "wait_ms_mean": round(self.wait_total / self.checkouts * 1000, 3)
+            if self.checkouts
+            else 0.0,
+            "wait_ms_p95": round(self._percentile(95) * 1000, 3),
+            "wait_ms_max": round(self.wait_max * 1000, 3),
+        }
+        if pool is not None:
+            data.update(
+                pool_size=pool.size(),
+                idle=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    # Пул, который считает время ожидания свободного соединения и выходы за
+    # pool_size. Событие "checkout" срабатывает уже после получения соединения,
+    # поэтому время ожидания меряем вокруг _do_get.
+
+    def _do_get(self):
+        overflow_before = self._overflow
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        # _overflow растет при каждом новом соединении и становится
+        # положительным, только когда открыто больше pool_size
+        overflowed = self._overflow > overflow_before and self._overflow > 0
+        pool_metrics.on_acquire(time.perf_counter() - started, overflowed)
+        return connection
+
+    def _do_return_conn(self, record):
+        pool_metrics.on_release()
+        super()._do_return_conn(record)
+
+
+def install_pool_events(engine):
+    # engine - синхронный движок (для async - async_engine.sync_engine)
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        pool_metrics.connects += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.invalidated += 1
@@ -0,0 +1,332 @@
+import copy
+import json
+from contextvars import ContextVar
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from database import async_engine
+from models import FSMState
+from utils.cache import TTLCache
+
+# короткие ключи для полей, которые есть почти в каждом состоянии
+FIELD_ALIASES = {
+    "messages_to_delete": "~d",
+    "user_messages": "~u",
+    "main_message_id": "~m",
+    "photo_message_id": "~p",
+    "last_hint_id": "~h",
+    "error_msg_id": "~e",
+    "invoice_message_id": "~i",
+}
+_ALIAS_TO_FIELD = {alias: field for field, alias in FIELD_ALIASES.items()}
+# списки id сообщений растут почти монотонно - храним разности соседних id
+DELTA_FIELDS = {"messages_to_delete", "user_messages"}
+# сколько раз при конфликте версий перечитать запись и наложить изменения заново
+WRITE_ATTEMPTS = 5
+# сколько помнить версию, записанную этим процессом (см. PostgresStorage.begin)
+WRITTEN_VERSION_TTL = 60
+
+
+def _is_int_list(value) -> bool:
+    return isinstance(value, list) and all(
+        isinstance(item, int) and not isinstance(item, bool) for item in value
+    )
+
+
+def _encode_value(value):
+    if isinstance(value, Decimal):
+        return {"$dec": str(value)}
+    raise TypeError(f"Тип {type(value).__name__} нельзя сохранить в FSM")
+
+
+def _decode_object(obj: dict):
+    if len(obj) == 1 and "$dec" in obj:
+        return Decimal(obj["$dec"])
+    return obj
+
+
+def dumps_data(data: dict) -> str:
+    payload = {}
+    for field, value in data.items():
+        if value is None:
+            continue  # data.get() вернет None и без ключа
+        alias = FIELD_ALIASES.get(field)
+        if alias is None:
+            payload[field] = value
+        elif field in DELTA_FIELDS:
+            if not _is_int_list(value):
+                payload[field] = value
+                continue
+            payload[alias] = [
+                value[i] - value[i - 1] if i else value[0] for i in range(len(value))
+            ]
+        else:
+            payload[alias] = value
+    return json.dumps(
+        payload, separators=(",", ":"), ensure_ascii=False, default=_encode_value
+    )
+
+
+def loads_data(raw: Optional[str]) -> dict:
+    if not raw:
+        return {}
+    payload = json.loads(raw, object_hook=_decode_object)
+    data = {}
+    for key, value in payload.items():
+        field = _ALIAS_TO_FIELD.get(key)
+        if field is None:
+            data[key] = value
+        elif field in DELTA_FIELDS:
+            total, decoded = 0, []
+            for delta in value:
+                total += delta
+                decoded.append(total)
+            data[field] = decoded
+        else:
+            data[field] = value
+    return data
+
+
+def build_storage_key(key: StorageKey) -> str:
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    thread_id = getattr(key, "thread_id", None)
+    if thread_id:
+        parts.append(f"t{thread_id}")
+    business_connection_id = getattr(key, "business_connection_id", None)
+    if business_connection_id:
+        parts.append(f"b{business_connection_id}")
+    parts.append(key.destiny)
+    return ":".join(parts)
+
+
+class _Batch:
+    def __init__(self):
+        self.records: dict = {}
+        self.closed = False
+
+
+_batch: ContextVar[Optional[_Batch]] = ContextVar("fsm_batch", default=None)
+_prefetched: ContextVar[Optional[tuple]] = ContextVar("fsm_prefetched", default=None)
+
+
+def _new_record(state: Optional[str], data: dict, version: Optional[int]) -> dict:
+    # base_* - то, что прочитано из базы с версией version (None - строки нет):
+    # при конфликте по ним видно, какие поля поменял сам апдейт
+    return {
+        "state": state,
+        "data": data,
+        "dirty": False,
+        "version": version,
+        "base_state": state,
+        "base_data": copy.deepcopy(data),
+    }
+
+
+def _rebase(record: dict, fresh: dict) -> None:
+    # Накладывает изменения record относительно прочитанной версии на свежую
+    # запись fresh: state - если апдейт его менял, data - по полям.
+    state = record["state"] if record["state"] != record["base_state"] else fresh["state"]
+    base, ours, data = record["base_data"], record["data"], fresh["data"]
+    for field in base.keys() | ours.keys():
+        if field not in ours:
+            data.pop(field, None)
+        elif field not in base or base[field] != ours[field]:
+            data[field] = ours[field]
+    record.update(
+        state=state,
+        data=data,
+        version=fresh["version"],
+        base_state=fresh["base_state"],
+        base_data=fresh["base_data"],
+    )
+
+
+class PostgresStorage(BaseStorage):
+    # Внутри апдейта (см. FSMBatchMiddleware) состояние читается из базы один
+    # раз, все get/update_data работают с копией в памяти, а изменения пишутся
+    # в конце. Вне апдейта - запись сразу.
+    # Запись условная: у строки есть version (txid записавшей транзакции,
+    # не повторяется и после удаления строки), UPDATE/DELETE идут с
+    # WHERE version = прочитанная. Если ключ успел записать другой процесс
+    # или задача, запись перечитывается и изменения апдейта накладываются
+    # на нее заново (_rebase) - несколько процессов бота не затирают друг
+    # другу состояние.
+
+    def __init__(self):
+        # ключ -> версия последней записи этого процесса
+        self._written = TTLCache(ttl=WRITTEN_VERSION_TTL, maxsize=100_000)
+
+    async def _load(self, storage_key: str) -> dict:
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                select(FSMState.state, FSMState.data, FSMState.version).where(
+                    FSMState.key == storage_key
+                )
+            )
+            row = result.first()
+        if not row:
+            return _new_record(None, {}, None)
+        return _new_record(row.state, loads_data(row.data), row.version)
+
+    async def _try_write(self, storage_key: str, record: dict) -> bool:
+        version = record["version"]
+        async with async_engine.begin() as conn:
+            if record["state"] is None and not record["data"]:
+                # пустое состояние не храним - таблица не растет от неактивных
+                if version is None:
+                    return True
+                stmt = (
+                    delete(FSMState)
+                    .where(FSMState.key == storage_key, FSMState.version == version)
+                    .returning(FSMState.key)
+                )
+                if (await conn.execute(stmt)).first() is None:
+                    return False
+                new_version = None
+            else:
+                values = {
+                    "state": record["state"],
+                    "data": dumps_data(record["data"]),
+                    "version": func.txid_current(),
+                }
+                if version is None:
+                    stmt = (
+                        insert(FSMState)
+                        .values(key=storage_key, **values)
+                        .on_conflict_do_nothing(index_elements=[FSMState.key])
+                    )
+                else:
+                    stmt = (
+                        update(FSMState)
+                        .where(FSMState.key == storage_key, FSMState.version == version)
+                        .values(updated_at=func.timezone("utc", func.now()), **values)
+                    )
+                new_version = (
+                    await conn.execute(stmt.returning(FSMState.version))
+                ).scalar()
+                if new_version is None:
+                    return False
+        record.update(
+            version=new_version,
+            base_state=record["state"],
+            base_data=copy.deepcopy(record["data"]),
+            dirty=False,
+        )
+        self._written.set(storage_key, new_version)
+        return True
+
+    async def _write(self, records: dict):
+        for storage_key, record in records.items():
+            for _ in range(WRITE_ATTEMPTS):
+                if await self._try_write(storage_key, record):
+                    break
+                _rebase(record, await self._load(storage_key))
+            else:
+                print(f"Ошибка сохранения FSM {storage_key}: конфликт версий")
+
+    async def _record(self, key: StorageKey) -> tuple[str, dict]:
+        storage_key = build_storage_key(key)
+        batch = _batch.get()
+        if batch is not None and not batch.closed:
+            record = batch.records.get(storage_key)
+            if record is None:
+                record = await self._load(storage_key)
+                batch.records[storage_key] = record
+            return storage_key, record
+        record = await self._load(storage_key)
+        _prefetched.set((storage_key, record))
+        return storage_key, record
+
+    async def _save(self, storage_key: str, record: dict):
+        batch = _batch.get()
+        if batch is not None and not batch.closed:
+            record["dirty"] = True
+        else:
+            await self._write({storage_key: record})
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, record = await self._record(key)
+        record["state"] = state.state if isinstance(state, State) else state
+        await self._save(storage_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key, record = await self._record(key)
+        record["data"] = copy.deepcopy(data)
+        await self._save(storage_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        return copy.deepcopy(record["data"])
+
+    async def close(self) -> None:
+        pass
+
+    def begin(self):
+        batch = _Batch()
+        prefetched = _prefetched.get()
+        if prefetched:
+            # FSMContextMiddleware читает состояние до блокировки
+            # SimpleEventIsolation: пока апдейт ждал, предыдущий апдейт того же
+            # пользователя мог записать свое. Прочитанное берем, только если
+            # этот процесс с тех пор не писал ключ другой версией; запись
+            # другого процесса поймает условный UPDATE при flush.
+            storage_key, record = prefetched
+            if self._written.get(storage_key, record["version"]) == record["version"]:
+                batch.records[storage_key] = record
+        _prefetched.set(None)
+        return _batch.set(batch)
+
+    def _close(self, token) -> Optional[_Batch]:
+        batch = _batch.get()
+        _batch.reset(token)
+        if batch is not None:
+            # задачи, созданные в хендлере, унаследовали батч - дальше они пишут напрямую
+            batch.closed = True
+        return batch
+
+    def discard(self, token) -> None:
+        # хендлер упал - недописанное состояние не сохраняем
+        self._close(token)
+
+    async def flush(self, token) -> None:
+        batch = self._close(token)
+        if batch is None:
+            return
+        dirty = {
+            storage_key: record
+            for storage_key, record in batch.records.items()
+            if record["dirty"]
+        }
+        if dirty:
+            await self._write(dirty)
+
+
+class FSMBatchMiddleware(BaseMiddleware):
+    def __init__(self, storage: PostgresStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Состояние пишется в конце апдейта. Апдейты одного пользователя в
+        # процессе идут по очереди (SimpleEventIsolation, см. main.py) - иначе
+        # почти каждая запись уходила бы в конфликт версий и перечитывание.
+        token = self.storage.begin()
+        try:
+            result = await handler(event, data)
+        except BaseException:
+            self.storage.discard(token)
+            raise
+        await self.storage.flush(token)
+        return result
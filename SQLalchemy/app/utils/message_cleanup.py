@@ -0,0 +1,120 @@
+import asyncio
+from typing import Iterable, Optional
+from utils.cache import TTLCache
+
+# Bot API deleteMessages принимает до 100 id за вызов
+BULK_DELETE_LIMIT = 100
+MAX_CONCURRENT_DELETES = 5
+_IGNORED_ERRORS = ("message to delete not found", "message can't be deleted")
+
+
+def flatten_message_ids(message_ids) -> list[int]:
+    # id из FSM бывают числом, списком или списком списков - собираем плоский
+    # список без повторов, порядок сохраняем
+    result, seen = [], set()
+    stack = [message_ids]
+    while stack:
+        item = stack.pop()
+        if item is None or isinstance(item, bool):
+            continue
+        if isinstance(item, (list, tuple, set)):
+            stack.extend(reversed(list(item)))
+            continue
+        try:
+            message_id = int(item)
+        except (TypeError, ValueError):
+            continue
+        if message_id > 0 and message_id not in seen:
+            seen.add(message_id)
+            result.append(message_id)
+    return result
+
+
+def _is_ignored(error: Exception) -> bool:
+    text = str(error).lower()
+    return any(reason in text for reason in _IGNORED_ERRORS)
+
+
+class MessageCleaner:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_DELETES):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # chat_id -> счетчики, живут час после последнего удаления в чате
+        self._chat_stats = TTLCache(ttl=3600, maxsize=10_000)
+        self.totals = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> dict:
+        # deleted/not_found - точные, по одиночным удалениям. deleteMessages
+        # молча пропускает ненайденные, поэтому успешная пачка идет отдельно в
+        # bulk_requested: сколько из нее удалено на самом деле, неизвестно.
+        return {
+            "requested": 0,
+            "deleted": 0,
+            "not_found": 0,
+            "bulk_requested": 0,
+            "failed": 0,
+            "api_calls": 0,
+        }
+
+    def _count(self, chat_id: int, metric: str, value: int = 1):
+        chat_stats = self._chat_stats.get(chat_id)
+        if chat_stats is None:
+            chat_stats = self._empty_stats()
+        chat_stats[metric] += value
+        self._chat_stats.set(chat_id, chat_stats)
+        self.totals[metric] += value
+
+    async def _delete_one(self, bot, chat_id: int, message_id: int):
+        async with self._semaphore:
+            self._count(chat_id, "api_calls")
+            try:
+                await bot.delete_message(chat_id=chat_id, message_id=message_id)
+                self._count(chat_id, "deleted")
+            except Exception as e:
+                if _is_ignored(e):
+                    self._count(chat_id, "not_found")
+                    return
+                self._count(chat_id, "failed")
+                print(f"Ошибка удаления сообщения {message_id}: {e}")
+
+    async def _delete_bulk(self, bot, chat_id: int, chunk: list[int]) -> bool:
+        self._count(chat_id, "api_calls")
+        try:
+            # ненайденные сообщения Telegram пропускает сам
+            await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            self._count(chat_id, "bulk_requested", len(chunk))
+            return True
+        except Exception:
+            return False
+
+    async def delete(self, bot, chat_id: int, message_ids) -> int:
+        ids = flatten_message_ids(message_ids)
+        if not ids:
+            return 0
+        self._count(chat_id, "requested", len(ids))
+        single_ids = ids
+        if len(ids) > 1 and hasattr(bot, "delete_messages"):
+            single_ids = []
+            for start in range(0, len(ids), BULK_DELETE_LIMIT):
+                chunk = ids[start : start + BULK_DELETE_LIMIT]
+                if not await self._delete_bulk(bot, chat_id, chunk):
+                    # пачка целиком отклонена (например, старые сообщения) -
+                    # удаляем по одному, чтобы убрать то, что можно
+                    single_ids.extend(chunk)
+        if single_ids:
+            await asyncio.gather(
+                *(self._delete_one(bot, chat_id, message_id) for message_id in single_ids)
+            )
+        return len(ids)
+
+    def stats(self, chat_id: Optional[int] = None) -> dict:
+        if chat_id is None:
+            return dict(self.totals, chats=len(self._chat_stats))
+        return self._chat_stats.get(chat_id) or self._empty_stats()
+
+
+message_cleaner = MessageCleaner()
+
+
+async def delete_messages(bot, chat_id: int, message_ids: Iterable) -> int:
+    return await message_cleaner.delete(bot, chat_id, message_ids)
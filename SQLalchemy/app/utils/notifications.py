@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, Coroutine, Iterable, Optional
+from utils.cache import TTLCache
+from utils.rate_limit import TokenBucket
+
+# лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду в один чат
+GLOBAL_RATE = 25
+PER_CHAT_RATE = 1
+# ведро чата за минуты простоя все равно снова полное - храним только активные
+CHAT_BUCKET_TTL = 600
+CHAT_BUCKET_MAXSIZE = 50_000
+
+
+class NotificationDispatcher:
+    def __init__(
+        self,
+        global_rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._chat_buckets = TTLCache(ttl=CHAT_BUCKET_TTL, maxsize=CHAT_BUCKET_MAXSIZE)
+        self._tasks: set[asyncio.Task] = set()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_chat_rate, 1)
+        # продлеваем жизнь ведрам чатов, куда сейчас идут сообщения
+        self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def send_message(self, bot, chat_id: int, **kwargs) -> bool:
+        for attempt in range(self.max_retries + 1):
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, **kwargs)
+                self.sent += 1
+                return True
+            except Exception as e:
+                # TelegramRetryAfter (429) - ждем сколько просит Telegram и повторяем
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is None or attempt == self.max_retries:
+                    print(f"Ошибка отправки уведомления {chat_id}: {e}")
+                    break
+                self.retried += 1
+                await asyncio.sleep(retry_after)
+        self.failed += 1
+        return False
+
+    async def broadcast(self, bot, chat_ids: Iterable[int], **kwargs) -> int:
+        results = await asyncio.gather(
+            *(
+                self.send_message(bot, chat_id, **kwargs)
+                for chat_id in dict.fromkeys(chat_ids)
+            )
+        )
+        return sum(results)
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        # держим ссылку на задачу, иначе ее может собрать GC до завершения
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def wait_pending(self, timeout: Optional[float] = None) -> int:
+        # дожидается задач из spawn (при остановке бота), не успевшие за
+        # timeout отменяет. Возвращает число отмененных.
+        if not self._tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "pending_tasks": len(self._tasks),
+            "chat_buckets": len(self._chat_buckets),
+        }
+
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import tuple_
+
+# курсор: направление ("n" - дальше/старее, "p" - назад/новее) + время в
+# микросекундах и id в base36, например "nhb1x2k9lq8.2s" - укладывается в
+# лимит callback_data Telegram (64 байта) вместе с префиксом
+NEXT = "n"
+PREV = "p"
+CALLBACK_DATA_LIMIT = 64
+_EPOCH = datetime(1970, 1, 1)
+_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _to_base36(value: int) -> str:
+    if value == 0:
+        return "0"
+    digits = []
+    while value:
+        value, rem = divmod(value, 36)
+        digits.append(_ALPHABET[rem])
+    return "".join(reversed(digits))
+
+
+def encode_cursor(direction: str, sort_value: datetime, row_id: int) -> str:
+    if sort_value.tzinfo is not None:
+        sort_value = sort_value.replace(tzinfo=None)
+    micros = (sort_value - _EPOCH) // _EPOCH.resolution
+    return f"{direction}{_to_base36(micros)}.{_to_base36(row_id)}"
+
+
+def decode_cursor(cursor: str) -> tuple[str, datetime, int]:
+    direction = cursor[0]
+    if direction not in (NEXT, PREV):
+        raise ValueError(f"Некорректный курсор: {cursor}")
+    micros, row_id = cursor[1:].split(".")
+    sort_value = _EPOCH + int(micros, 36) * _EPOCH.resolution
+    return direction, sort_value, int(row_id, 36)
+
+
+def page_cursors(rows, sort_key: str, id_key: str) -> tuple[Optional[str], Optional[str]]:
+    # курсоры строятся по первой и последней строке текущей страницы
+    if not rows:
+        return None, None
+    first, last = rows[0], rows[-1]
+    return (
+        encode_cursor(PREV, first[sort_key], first[id_key]),
+        encode_cursor(NEXT, last[sort_key], last[id_key]),
+    )
+
+
+def build_page_callback(prefix: str, page: int, cursor: Optional[str]) -> str:
+    callback_data = f"{prefix}_{page}_{cursor}" if cursor else f"{prefix}_{page}"
+    if len(callback_data.encode()) > CALLBACK_DATA_LIMIT:
+        # не влезает курсор - откатываемся на номер страницы (OFFSET)
+        return f"{prefix}_{page}"
+    return callback_data
+
+
+def parse_page_callback(callback_data: str) -> tuple[int, Optional[str]]:
+    parts = callback_data.split("_")
+    if parts[-1][:1] in (NEXT, PREV):
+        return int(parts[-2]), parts[-1]
+    return int(parts[-1]), None
+
+
+def _apply_keyset(stmt, sort_column, id_column, cursor: str, limit: int):
+    # WHERE (sort, id) < (:sort, :id) ORDER BY sort DESC, id DESC - страница
+    # читается по индексу за O(limit) независимо от глубины
+    direction, sort_value, row_id = decode_cursor(cursor)
+    key = tuple_(sort_column, id_column)
+    if direction == NEXT:
+        stmt = stmt.where(key < (sort_value, row_id)).order_by(
+            sort_column.desc(), id_column.desc()
+        )
+    else:
+        stmt = stmt.where(key > (sort_value, row_id)).order_by(
+            sort_column.asc(), id_column.asc()
+        )
+    return stmt.limit(limit), direction == PREV
+
+
+async def fetch_page(
+    session,
+    stmt,
+    sort_column,
+    id_column,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+):
+    if cursor:
+        stmt, reverse = _apply_keyset(stmt, sort_column, id_column, cursor, limit)
+    else:
+        stmt = (
+            stmt.order_by(sort_column.desc(), id_column.desc())
+            .offset(offset)
+            .limit(limit)
+        )
+        reverse = False
+    result = await session.execute(stmt)
+    rows = result.mappings().all()
+    return rows[::-1] if reverse else rows
@@ -0,0 +1,82 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta, timezone
+from models import PaymentStatus
+from queries.orm import PaymentQueries
+
+PAYMENT_TIMEOUT = timedelta(minutes=15)
+# завершенные платежи храним еще час, потом удаляем
+FINISHED_RETENTION = timedelta(hours=1)
+CLEANUP_INTERVAL = 600
+
+
+def utcnow() -> datetime:
+    # в базе время хранится как UTC без таймзоны
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class PaymentExpiryScheduler:
+    # Все таймауты инвойсов в одной задаче: куча (expires_at, payment_id),
+    # задача спит до ближайшего срока или до нового платежа. При старте куча
+    # восстанавливается из таблицы payments.
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, str]] = []
+        self._wakeup = asyncio.Event()
+        self._last_cleanup = utcnow()
+
+    def schedule(self, payment_id: str, expires_at: datetime):
+        heapq.heappush(self._heap, (expires_at, payment_id))
+        self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def _load_pending(self):
+        for payment_id, expires_at in await PaymentQueries.get_pending_expirations():
+            heapq.heappush(self._heap, (expires_at, payment_id))
+
+    async def _expire(self, bot, payment_id: str):
+        # платеж мог быть оплачен или отменен - тогда finish_payment вернет None
+        payment = await PaymentQueries.finish_payment(payment_id, PaymentStatus.TIMEOUT)
+        if not payment or not payment["invoice_message_id"]:
+            return
+        try:
+            await bot.delete_message(
+                chat_id=payment["chat_id"], message_id=payment["invoice_message_id"]
+            )
+            print(f"Инвойс {payment['invoice_message_id']} удален по таймауту")
+        except Exception as e:
+            print(f"Не удалось удалить инвойс при таймауте: {e}")
+
+    async def _cleanup(self):
+        now = utcnow()
+        if (now - self._last_cleanup).total_seconds() < CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        await PaymentQueries.delete_finished_payments(now - FINISHED_RETENTION)
+
+    async def run(self, bot):
+        await self._load_pending()
+        while True:
+            try:
+                now = utcnow()
+                while self._heap and self._heap[0][0] <= now:
+                    _, payment_id = heapq.heappop(self._heap)
+                    await self._expire(bot, payment_id)
+                await self._cleanup()
+            except Exception as e:
+                print(f"Ошибка обработки таймаутов платежей: {e}")
+            timeout = CLEANUP_INTERVAL
+            if self._heap:
+                timeout = min(
+                    timeout, max(0.0, (self._heap[0][0] - utcnow()).total_seconds())
+                )
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+payment_expiry = PaymentExpiryScheduler()
@@ -0,0 +1,142 @@
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable
+
+# Telegram режет сообщения по 4096 единицам UTF-16, оставляем запас
+TELEGRAM_TEXT_LIMIT = 4000
+
+# Сущности, внутри которых резать нельзя: разрыв ломает разметку и Telegram
+# отвечает "can't parse entities".
+_ENTITY_PATTERNS = {
+    "Markdown": re.compile(
+        r"(?s:```.*?```)|`[^`\n]*`|\[[^\]\n]*\]\([^)\s]*\)|\*[^*\n]*\*|_[^_\n]*_"
+    ),
+    "HTML": re.compile(
+        r"(?s:<([a-zA-Z][a-zA-Z0-9-]*)\b[^>]*>.*?</\1\s*>)|<[^>]*>|&#?\w+;"
+    ),
+}
+
+
+def utf16_len(text: str) -> int:
+    # так длину считает Telegram: символы вне BMP (эмодзи и т.п.) занимают 2
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _utf16_offsets(text: str) -> list[int]:
+    # offsets[i] - длина text[:i] в UTF-16
+    return [0, *accumulate(2 if ord(char) > 0xFFFF else 1 for char in text)]
+
+
+def _protected_spans(text: str, parse_mode: str) -> list[tuple[int, int]]:
+    pattern = _ENTITY_PATTERNS.get(parse_mode)
+    if pattern is None:
+        return []
+    return [match.span() for match in pattern.finditer(text) if match.end() > match.start()]
+
+
+def _safe_breaks(text: str, char: str, spans: list) -> list[int]:
+    # позиции сразу после char, не попадающие внутрь сущностей (два указателя)
+    breaks, span_index = [], 0
+    position = text.find(char)
+    while position != -1:
+        cut = position + 1
+        while span_index < len(spans) and spans[span_index][1] <= cut:
+            span_index += 1
+        if span_index == len(spans) or not spans[span_index][0] < cut:
+            breaks.append(cut)
+        position = text.find(char, cut)
+    return breaks
+
+
+def _hard_cut(start: int, end: int, spans: list, span_starts: list) -> int:
+    # режем по границе символа; если end внутри сущности - перед ней
+    index = bisect_right(span_starts, end - 1) - 1
+    if index >= 0:
+        span_start, span_end = spans[index]
+        if span_start < end < span_end and span_start > start:
+            return span_start
+    return end
+
+
+def split_text(
+    text: str, limit: int = TELEGRAM_TEXT_LIMIT, parse_mode: str = "Markdown"
+) -> list[str]:
+    # Делит text на части не длиннее limit (UTF-16). Режет по переводу строки,
+    # иначе по пробелу, иначе по символу - но не внутри сущностей разметки и не
+    # посреди суррогатной пары. "".join(результат) == text.
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    if not text:
+        return []
+    offsets = _utf16_offsets(text)
+    if offsets[-1] <= limit:
+        return [text]
+    spans = _protected_spans(text, parse_mode)
+    span_starts = [span[0] for span in spans]
+    newlines = _safe_breaks(text, "\n", spans)
+    spaces = _safe_breaks(text, " ", spans)
+    parts, start = [], 0
+    while offsets[-1] - offsets[start] > limit:
+        end = bisect_right(offsets, offsets[start] + limit) - 1
+        cut = None
+        for breaks in (newlines, spaces):
+            index = bisect_right(breaks, end) - 1
+            if index >= 0 and breaks[index] > start:
+                cut = breaks[index]
+                break
+        if cut is None:
+            # символ вне BMP шире limit - отдаем его целиком
+            cut = max(_hard_cut(start, end, spans, span_starts), start + 1)
+        parts.append(text[start:cut])
+        start = cut
+    parts.append(text[start:])
+    return parts
+
+
+def chunk_lines(
+    lines: Iterable[str],
+    limit: int = TELEGRAM_TEXT_LIMIT,
+    header: str = "",
+    continuation: str = "",
+    parse_mode: str = "Markdown",
+) -> list[str]:
+    # Собирает строки в сообщения за один проход: первое начинается с header,
+    # следующие - с continuation. Строка, которая не влезает даже в пустое
+    # сообщение, режется через split_text. Части только из заголовка не
+    # возвращаются.
+    continuation_size = utf16_len(continuation)
+    if max(utf16_len(header), continuation_size) >= limit:
+        raise ValueError("header does not fit into limit")
+    parts, buffer, size = [], [header], utf16_len(header)
+    for line in lines:
+        line_size = utf16_len(line)
+        if size + line_size > limit and len(buffer) > 1:
+            parts.append("".join(buffer))
+            buffer, size = [continuation], continuation_size
+        if size + line_size > limit:
+            pieces = split_text(line, limit - max(size, continuation_size), parse_mode)
+            for piece in pieces[:-1]:
+                buffer.append(piece)
+                parts.append("".join(buffer))
+                buffer, size = [continuation], continuation_size
+            line = pieces[-1]
+            line_size = utf16_len(line)
+        buffer.append(line)
+        size += line_size
+    if len(buffer) > 1:
+        parts.append("".join(buffer))
+    return parts
+
+
+def take_lines(lines: Iterable[str], limit: int) -> tuple[str, int]:
+    # Берет строки, пока они целиком влезают в limit. Возвращает текст и
+    # количество взятых строк - для "… и еще N".
+    buffer, size = [], 0
+    for line in lines:
+        line_size = utf16_len(line)
+        if size + line_size > limit:
+            break
+        buffer.append(line)
+        size += line_size
+    return "".join(buffer), len(buffer)
@@ -0,0 +1,55 @@
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Hashable, Iterable, Optional
+from utils.cache import TTLCache
+
+
+class SlidingWindow:
+    # Не больше limit событий за window на ключ (telegram_id). Последние
+    # события ключа держатся в памяти, так что проверка - O(1) без запроса в
+    # базу. Если ключа в памяти нет (первое обращение после старта бота или
+    # запись вытеснена), вызывающий подгружает события из базы через load() -
+    # база и есть постоянное хранилище, в памяти только горячая копия.
+    # Время - naive UTC, как created_date в моделях.
+
+    def __init__(
+        self,
+        limit: int,
+        window: timedelta,
+        memory_ttl: float = 24 * 3600,
+        maxsize: int = 100_000,
+    ):
+        self.limit = limit
+        self.window = window
+        self._events = TTLCache(ttl=memory_ttl, maxsize=maxsize)
+
+    def load(self, key: Hashable, timestamps: Iterable[datetime]) -> None:
+        self._events.set(key, deque(sorted(timestamps)[-self.limit :], self.limit))
+
+    def remaining(self, key: Hashable, now: Optional[datetime] = None) -> Optional[float]:
+        # None - ключа нет в памяти, 0 - можно, иначе секунды до освобождения
+        events = self._events.get(key)
+        if events is None:
+            return None
+        if len(events) < self.limit:
+            return 0.0
+        now = now or datetime.utcnow()
+        return max(0.0, (events[0] + self.window - now).total_seconds())
+
+    def hit(self, key: Hashable, when: Optional[datetime] = None) -> None:
+        events = self._events.get(key)
+        # без загруженной истории не записываем: иначе более ранние события
+        # из базы потеряются и лимит будет занижен
+        if events is None:
+            return
+        events.append(when or datetime.utcnow())
+        self._events.set(key, events)
+
+    def forget(self, key: Hashable) -> None:
+        self._events.invalidate(key)
+
+    def clear(self) -> None:
+        self._events.clear()
+
+    def stats(self) -> dict:
+        return self._events.stats()